@@ -0,0 +1,178 @@
+"""
+Sinh corpus tin tức tiếng Việt tổng hợp cho benchmark
+
+Mô hình được học từ data/sample_news.json: phân bố topic / source, phân bố độ
+dài title và content, tần suất từ (unigram) của từng topic và của toàn corpus.
+Tỉ lệ TOPIC_MIX số từ được lấy từ mô hình của topic, còn lại từ mô hình chung; một tỉ lệ nhỏ từ được thay bằng từ mới để vocabulary tăng theo kích
+thước corpus (định luật Heaps) thay vì bão hòa ở vocabulary của dữ liệu mẫu.
+Cùng seed cho cùng corpus.
+
+    python benchmarks/corpus_generator.py 100000 /tmp/news_100k.jsonl.gz
+"""
+
+import argparse
+import gzip
+import itertools
+import json
+import math
+import os
+import random
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.corpus_reader import iter_documents
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'sample_news.json')
+
+# Tỉ lệ từ lấy theo mô hình của topic (còn lại lấy theo mô hình chung)
+TOPIC_MIX = 0.6
+# Tỉ lệ từ mới (không có trong dữ liệu mẫu) trên mỗi từ được sinh
+NOVEL_WORD_RATE = 0.002
+# Âm tiết dùng để ghép từ mới
+NOVEL_SYLLABLES = ['an', 'bình', 'cường', 'dũng', 'giang', 'hòa', 'khánh', 'long', 'minh', 'ngọc',
+                   'phúc', 'quang', 'sơn', 'thành', 'uyên', 'vinh', 'xuân', 'yến', 'đạt', 'hưng']
+
+
+class WordModel:
+    """Phân bố unigram, lấy mẫu bằng tìm nhị phân trên tần suất tích lũy"""
+
+    def __init__(self, counts: Counter):
+        self.words = list(counts)
+        self.cum_weights = list(itertools.accumulate(counts[word] for word in self.words))
+
+    def sample(self, rng: random.Random, k: int) -> List[str]:
+        return rng.choices(self.words, cum_weights=self.cum_weights, k=k)
+
+
+class CorpusProfile:
+    """Thống kê của dữ liệu mẫu dùng để sinh corpus"""
+
+    def __init__(self, sample_path: str = DEFAULT_SAMPLE):
+        topic_counts = Counter()
+        title_words = defaultdict(Counter)
+        content_words = defaultdict(Counter)
+        all_words = Counter()
+        self.title_lengths = []
+        self.content_lengths = []
+        self.sources = []
+        self.authors = []
+        for doc in iter_documents(sample_path):
+            topic = doc.get('topic') or ''
+            title = (doc.get('title') or '').split()
+            content = (doc.get('content') or '').split()
+            topic_counts[topic] += 1
+            title_words[topic].update(title)
+            content_words[topic].update(content)
+            all_words.update(title)
+            all_words.update(content)
+            self.title_lengths.append(len(title))
+            self.content_lengths.append(len(content))
+            self.sources.append(doc.get('source') or '')
+            self.authors.append(doc.get('author') or '')
+        if not topic_counts:
+            raise ValueError(f"Dữ liệu mẫu rỗng: {sample_path}")
+
+        self.topics = list(topic_counts)
+        self.topic_weights = [topic_counts[topic] for topic in self.topics]
+        self.title_models = {topic: WordModel(title_words[topic] or all_words) for topic in self.topics}
+        self.content_models = {topic: WordModel(content_words[topic] or all_words) for topic in self.topics}
+        self.global_model = WordModel(all_words)
+        self.vocabulary_size = len(all_words)
+
+
+class CorpusGenerator:
+    def __init__(self, profile: CorpusProfile, seed: int = 42,
+                 topic_mix: float = TOPIC_MIX, novel_word_rate: float = NOVEL_WORD_RATE):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.topic_mix = topic_mix
+        self.novel_word_rate = novel_word_rate
+        # Từ mới được đánh số tăng dần; xác suất dùng lại từ mới cũ giảm theo Zipf
+        self.novel_words: List[str] = []
+
+    def _novel_word(self) -> str:
+        rng = self.rng
+        if self.novel_words and rng.random() < 0.5:
+            # Dùng lại từ mới đã sinh, ưu tiên các từ sinh sớm (phân bố lệch)
+            index = int(len(self.novel_words) * rng.random() ** 3)
+            return self.novel_words[index]
+        number = len(self.novel_words)
+        syllables = NOVEL_SYLLABLES
+        word = syllables[number % len(syllables)] + syllables[(number // len(syllables)) % len(syllables)]
+        word += str(number // (len(syllables) ** 2)) if number >= len(syllables) ** 2 else ''
+        self.novel_words.append(word)
+        return word
+
+    def _text(self, topic_model: WordModel, length: int) -> str:
+        rng = self.rng
+        topic_count = round(length * self.topic_mix)
+        # Xen kẽ từ của topic và từ chung (thứ tự không ảnh hưởng TF-IDF, rẻ hơn shuffle)
+        topic_words = topic_model.sample(rng, topic_count)
+        global_words = self.profile.global_model.sample(rng, length - topic_count)
+        words = [word for pair in itertools.zip_longest(topic_words, global_words) for word in pair if word is not None]
+        if self.novel_word_rate:
+            # Vị trí từ mới cách nhau theo phân bố hình học, không cần tung xác suất cho từng từ
+            log_keep = math.log(1 - self.novel_word_rate)
+            position = int(math.log(1 - rng.random()) / log_keep)
+            while position < length:
+                words[position] = self._novel_word()
+                position += 1 + int(math.log(1 - rng.random()) / log_keep)
+        return ' '.join(words)
+
+    def documents(self, count: int, start_id: int = 1) -> Iterator[Dict]:
+        """Sinh lần lượt count documents"""
+        profile = self.profile
+        rng = self.rng
+        started = datetime(2022, 1, 1)
+        for doc_id in range(start_id, start_id + count):
+            topic = rng.choices(profile.topics, weights=profile.topic_weights)[0]
+            title = self._text(profile.title_models[topic], max(rng.choice(profile.title_lengths), 1))
+            content = self._text(profile.content_models[topic], rng.choice(profile.content_lengths))
+            source = rng.choice(profile.sources)
+            crawled_at = started + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+            yield {
+                'id': doc_id,
+                'author': rng.choice(profile.authors),
+                'content': content,
+                'picture_count': rng.randrange(10),
+                'processed': 1,
+                'source': source,
+                'title': title,
+                'topic': topic,
+                'url': f'https://{source or "news"}.example/{doc_id}.htm',
+                'crawled_at': crawled_at.strftime('%Y-%m-%d %H:%M:%S.%f'),
+            }
+
+
+def write_corpus(path: str, count: int, seed: int = 42, sample_path: str = DEFAULT_SAMPLE) -> str:
+    """Ghi corpus JSONL (nén gzip nếu path kết thúc bằng .gz), ghi ra file tạm rồi đổi tên"""
+    generator = CorpusGenerator(CorpusProfile(sample_path), seed=seed)
+    opener = gzip.open if path.endswith('.gz') else open
+    tmp_path = f"{path}.tmp"
+    # Mức nén thấp: corpus lớn được sinh nhanh hơn nhiều, file chỉ lớn hơn chút ít
+    options = {'compresslevel': 1} if path.endswith('.gz') else {}
+    with opener(tmp_path, 'wt', encoding='utf-8', **options) as f:
+        for doc in generator.documents(count):
+            f.write(json.dumps(doc, ensure_ascii=False))
+            f.write('\n')
+    os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('count', type=int, help='Số documents')
+    parser.add_argument('output', help='File JSONL đầu ra (.jsonl hoặc .jsonl.gz)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sample', default=DEFAULT_SAMPLE, help='Dữ liệu mẫu để học phân bố')
+    args = parser.parse_args()
+    write_corpus(args.output, args.count, args.seed, args.sample)
+    print(f"Đã sinh {args.count} documents vào {args.output}")
+
+
+if __name__ == "__main__":
+    main()
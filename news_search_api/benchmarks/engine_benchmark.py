@@ -0,0 +1,293 @@
+"""
+Benchmark build_index / search cho SimpleTFIDFSearchEngine và TFIDFSearchEngine
+
+Với mỗi kích thước corpus, corpus tổng hợp được sinh bằng corpus_generator.py
+(lưu cache trong --corpus-dir, chỉ sinh một lần). Mỗi engine chạy trong một
+process riêng để đo peak RSS (ru_maxrss) không bị lẫn giữa các lần chạy:
+- build_seconds: thời gian load_data + build_index
+- peak_rss_mb: RSS lớn nhất của process (và của các worker process nếu có)
+- latency_ms: p50 / p90 / p99 / mean / max của search() với bộ query cố định
+  lấy từ title của corpus (cùng seed cho cùng bộ query)
+
+Kết quả được ghi ra JSON để so sánh giữa các lần chạy:
+
+    python benchmarks/engine_benchmark.py --sizes 1000 10000 100000 --output results/run.json
+    python benchmarks/engine_benchmark.py --sizes 1000 10000 --compare results/run.json
+
+Với --compare, thời gian hoặc bộ nhớ tăng quá --threshold so với lần chạy cũ
+được in ra và lệnh thoát với mã 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from benchmarks.corpus_generator import DEFAULT_SAMPLE, write_corpus
+from src.corpus_reader import iter_documents
+
+DEFAULT_CORPUS_DIR = os.path.join(PROJECT_DIR, 'benchmarks', 'corpora')
+DEFAULT_RESULTS_DIR = os.path.join(PROJECT_DIR, 'benchmarks', 'results')
+
+# Engine được benchmark: tên -> mô tả; 'simple-<backend>' dùng backend chấm điểm tương ứng
+ENGINES = {
+    'simple': 'SimpleTFIDFSearchEngine (backend python)',
+    'simple-numpy': 'SimpleTFIDFSearchEngine (backend numpy)',
+    'tfidf': 'TFIDFSearchEngine (scikit-learn + underthesea)',
+}
+DEFAULT_ENGINES = ['simple', 'simple-numpy', 'tfidf']
+
+# Các chỉ số dùng để phát hiện regression (giá trị lớn hơn là tệ hơn)
+COMPARED_METRICS = ['build_seconds', 'peak_rss_mb', 'latency_ms.p50', 'latency_ms.p90', 'latency_ms.p99']
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentile theo nearest-rank trên danh sách đã sắp xếp"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def latency_summary(latencies: List[float]) -> Dict:
+    values = sorted(latencies)
+    return {
+        'p50': round(percentile(values, 0.50), 4),
+        'p90': round(percentile(values, 0.90), 4),
+        'p99': round(percentile(values, 0.99), 4),
+        'mean': round(sum(values) / len(values), 4) if values else 0.0,
+        'max': round(values[-1], 4) if values else 0.0,
+    }
+
+
+def peak_rss_mb() -> Dict:
+    """ru_maxrss của process hiện tại và của các process con đã kết thúc, tính bằng MB"""
+    # macOS trả về ru_maxrss tính bằng byte
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor, 1),
+    }
+
+
+def corpus_path(corpus_dir: str, size: int, seed: int) -> str:
+    """Đường dẫn corpus đã cache, sinh mới nếu chưa có"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    path = os.path.join(corpus_dir, f'news_{size}_seed{seed}.jsonl.gz')
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        write_corpus(path, size, seed=seed, sample_path=DEFAULT_SAMPLE)
+        print(f"Đã sinh corpus {size} documents vào {path} ({time.perf_counter() - started:.1f}s)")
+    return path
+
+
+def make_queries(path: str, count: int, seed: int) -> List[str]:
+    """Bộ query cố định: 1-3 từ liên tiếp trong title của các document được chọn ngẫu nhiên"""
+    rng = random.Random(seed)
+    titles = [doc.get('title') or '' for doc in iter_documents(path)]
+    queries = []
+    while titles and len(queries) < count:
+        words = rng.choice(titles).split()
+        if not words:
+            continue
+        length = min(rng.randint(1, 3), len(words))
+        start = rng.randrange(len(words) - length + 1)
+        queries.append(' '.join(words[start:start + length]))
+    return queries
+
+
+def run_engine(engine: str, path: str, queries: List[str], top_k: int, warmup: int) -> Dict:
+    """Chạy trong process con: build index rồi đo latency của từng query"""
+    rss_before = peak_rss_mb()['self']
+    started = time.perf_counter()
+    if engine.startswith('simple'):
+        from src.simple_tfidf import SimpleTFIDFSearchEngine
+
+        backend = engine.partition('-')[2] or 'python'
+        search_engine = SimpleTFIDFSearchEngine(scoring_backend=backend)
+        if search_engine.scoring_backend != backend:
+            return {'status': 'skipped', 'reason': f"Không dùng được backend {backend}"}
+        search_engine.load_data(path)
+        search_engine.build_index()
+    else:
+        # tfidf_search.py import text_processor như module cấp cao nhất
+        sys.path.insert(0, os.path.join(PROJECT_DIR, 'src'))
+        try:
+            from tfidf_search import TFIDFSearchEngine
+        except ImportError as e:
+            return {'status': 'skipped', 'reason': f"Thiếu thư viện: {e}"}
+        search_engine = TFIDFSearchEngine()
+        # load_data của TFIDFSearchEngine chỉ đọc JSON array
+        search_engine.documents = list(iter_documents(path))
+        search_engine.build_index()
+    build_seconds = time.perf_counter() - started
+
+    for query in queries[:warmup]:
+        search_engine.search(query, top_k=top_k)
+    latencies = []
+    hits = 0
+    for query in queries:
+        started = time.perf_counter()
+        results = search_engine.search(query, top_k=top_k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(results)
+
+    rss = peak_rss_mb()
+    return {
+        'status': 'ok',
+        'build_seconds': round(build_seconds, 3),
+        'peak_rss_mb': max(rss['self'], rss['children']),
+        'rss_before_build_mb': rss_before,
+        'rss_children_mb': rss['children'],
+        'queries': len(queries),
+        'avg_hits': round(hits / len(queries), 2) if queries else 0,
+        'latency_ms': latency_summary(latencies),
+    }
+
+
+def worker_main(args):
+    with open(args.queries_file, encoding='utf-8') as f:
+        queries = json.load(f)
+    result = run_engine(args.worker, args.corpus, queries, args.top_k, args.warmup)
+    # Dòng cuối của stdout là kết quả, các dòng log của engine nằm phía trên
+    print(json.dumps(result, ensure_ascii=False))
+
+
+def benchmark(engine: str, path: str, queries_file: str, args) -> Dict:
+    """Chạy một engine trong process mới và đọc kết quả từ stdout"""
+    command = [sys.executable, os.path.abspath(__file__), '--worker', engine,
+               '--corpus', path, '--queries-file', queries_file,
+               '--top-k', str(args.top_k), '--warmup', str(args.warmup)]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=args.timeout, cwd=PROJECT_DIR)
+    except subprocess.TimeoutExpired:
+        return {'status': 'error', 'reason': f"Quá thời gian {args.timeout}s"}
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {'status': 'error', 'reason': (completed.stderr.strip().splitlines() or ['không có output'])[-1]}
+    return json.loads(lines[-1])
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=PROJECT_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metric(result: Dict, name: str) -> Optional[float]:
+    value = result
+    for key in name.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """In bảng so sánh với lần chạy cũ, trả về danh sách regression"""
+    previous = {(r['engine'], r['docs']): r for r in baseline.get('results', [])}
+    regressions = []
+    print(f"\nSo sánh với {baseline.get('meta', {}).get('timestamp')} (commit {baseline.get('meta', {}).get('git_commit')})")
+    for result in current['results']:
+        old = previous.get((result['engine'], result['docs']))
+        if old is None or result['status'] != 'ok' or old.get('status') != 'ok':
+            continue
+        for name in COMPARED_METRICS:
+            new_value, old_value = metric(result, name), metric(old, name)
+            if not new_value or not old_value:
+                continue
+            ratio = new_value / old_value
+            flag = ''
+            if ratio > 1 + threshold:
+                flag = '  <-- REGRESSION'
+                regressions.append(f"{result['engine']} @ {result['docs']}: {name} {old_value} -> {new_value}")
+            print(f"  {result['engine']:<13} {result['docs']:>8} {name:<15} {old_value:>10} -> {new_value:>10} ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='Số documents của từng corpus')
+    parser.add_argument('--engines', nargs='+', default=DEFAULT_ENGINES, choices=list(ENGINES))
+    parser.add_argument('--queries', type=int, default=200, help='Số query đo latency')
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=20, help='Số query chạy trước khi đo')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--corpus-dir', default=DEFAULT_CORPUS_DIR, help='Thư mục cache corpus tổng hợp')
+    parser.add_argument('--output', help='File JSON kết quả (mặc định benchmarks/results/bench-<thời gian>.json)')
+    parser.add_argument('--compare', help='File JSON của lần chạy cũ để phát hiện regression')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Mức tăng tối đa cho phép khi so sánh')
+    parser.add_argument('--timeout', type=float, default=6 * 3600, help='Thời gian tối đa của mỗi lần chạy (giây)')
+    # Tham số nội bộ của process con
+    parser.add_argument('--worker', choices=list(ENGINES), help=argparse.SUPPRESS)
+    parser.add_argument('--corpus', help=argparse.SUPPRESS)
+    parser.add_argument('--queries-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return
+
+    timestamp = datetime.now()
+    report = {
+        'meta': {
+            'timestamp': timestamp.isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'queries': args.queries,
+            'top_k': args.top_k,
+        },
+        'results': [],
+    }
+
+    for size in args.sizes:
+        path = corpus_path(args.corpus_dir, size, args.seed)
+        queries_file = os.path.splitext(path)[0] + f'.queries{args.queries}.json'
+        if not os.path.exists(queries_file):
+            with open(queries_file, 'w', encoding='utf-8') as f:
+                json.dump(make_queries(path, args.queries, args.seed), f, ensure_ascii=False)
+        for engine in args.engines:
+            print(f"Benchmark {ENGINES[engine]} với {size} documents...")
+            result = {'engine': engine, 'docs': size}
+            result.update(benchmark(engine, path, queries_file, args))
+            report['results'].append(result)
+            if result['status'] == 'ok':
+                latency = result['latency_ms']
+                print(f"  build {result['build_seconds']}s, peak RSS {result['peak_rss_mb']} MB, "
+                      f"p50 {latency['p50']} ms, p90 {latency['p90']} ms, p99 {latency['p99']} ms")
+            else:
+                print(f"  {result['status']}: {result['reason']}")
+
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"bench-{timestamp.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Đã ghi kết quả vào {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression vượt ngưỡng {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nKhông có regression")
+
+
+if __name__ == "__main__":
+    main()
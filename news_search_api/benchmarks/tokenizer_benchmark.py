@@ -0,0 +1,111 @@
+"""
+Micro-benchmark cho BasicVietnameseTextProcessor
+
+So sánh bộ tách từ hiện tại với cách làm cũ (6 lượt re.sub rồi split) trên
+data/sample_news.json, đồng thời kiểm tra hai cách cho ra cùng danh sách token.
+
+    python benchmarks/tokenizer_benchmark.py [đường_dẫn_corpus] [--repeat N]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.basic_text_processor import BasicVietnameseTextProcessor
+from src.corpus_reader import iter_documents
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'sample_news.json')
+
+# Các trường hợp đặc biệt: HTML, URL, email, số điện thoại, ký tự Unicode
+EDGE_CASES = [
+    '<p>Giá <b>vàng</b> tăng</p> <a href="x">link</a>',
+    'Xem tại https://vnexpress.net/a-b-c.html?x=1&y=2 hoặc http://tuoitre.vn',
+    'Liên hệ abc@gmail.com, @user, user@, a@b@c và giá 1@2',
+    'Gọi +84912345678 hoặc 0912345678, mã 123456, số 12345678901234567890',
+    'Tab\tvà\nxuống dòng\u00a0khoảng trắng\u2003Unicode, İstanbul, snake_case',
+    'a<b>@c, http<i>s://x.vn, 12<br>34567',
+]
+
+
+def legacy_tokenize(processor: BasicVietnameseTextProcessor, text: str):
+    """Cách tách từ trước đây, dùng làm chuẩn để so sánh"""
+    if not text:
+        return []
+    text = text.lower()
+    text = re.sub(r'<[^>]+>', '', text)
+    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
+    text = re.sub(r'\S+@\S+', '', text)
+    text = re.sub(r'[\+]?[1-9]?[0-9]{7,15}', '', text)
+    text = re.sub(r'[^\w\sàáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return [token for token in text.split() if token not in processor.stop_words and len(token) >= 2]
+
+
+def legacy_document_tokens(processor: BasicVietnameseTextProcessor, title: str, content: str):
+    return legacy_tokenize(processor, title) * 2 + legacy_tokenize(processor, content)
+
+
+def time_it(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', nargs='?', default=DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    documents = [(doc.get('title', ''), doc.get('content', '')) for doc in iter_documents(args.corpus)]
+    titles = [title for title, _ in documents]
+    processor = BasicVietnameseTextProcessor()
+
+    # Kiểm tra kết quả giống hệt cách cũ
+    mismatches = 0
+    for text in EDGE_CASES + titles + [content for _, content in documents]:
+        if processor.simple_tokenize(text) != legacy_tokenize(processor, text):
+            mismatches += 1
+            print(f"Khác kết quả: {text[:80]!r}")
+    total_tokens = sum(len(processor.document_tokens(title, content)) for title, content in documents)
+    print(f"{len(documents)} documents, {total_tokens} tokens, {mismatches} khác biệt")
+
+    def run_legacy():
+        for title, content in documents:
+            legacy_document_tokens(processor, title, content)
+
+    def run_current():
+        # Processor mới cho mỗi lần chạy để không hưởng lợi từ cache giữa các lần lặp
+        current = BasicVietnameseTextProcessor()
+        for title, content in documents:
+            current.document_tokens(title, content)
+
+    def run_queries_legacy():
+        for title in titles:
+            legacy_tokenize(processor, title)
+
+    def run_queries_current():
+        for title in titles:
+            processor.query_tokens(title)
+
+    results = [
+        ('documents (cũ)', time_it(run_legacy, args.repeat)),
+        ('documents (mới)', time_it(run_current, args.repeat)),
+        ('query lặp lại (cũ)', time_it(run_queries_legacy, args.repeat)),
+        ('query lặp lại (mới, có cache)', time_it(run_queries_current, args.repeat)),
+    ]
+    for name, seconds in results:
+        print(f"{name:32s} {seconds * 1000:9.2f} ms")
+    print(f"Tăng tốc documents: {results[0][1] / results[1][1]:.2f}x, query: {results[2][1] / results[3][1]:.2f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,30 @@ Basic Vietnamese text processor without external dependencies
 
 import re
 import string
-from typing import List, Set
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+# Các bước làm sạch của clean_text, biên dịch sẵn một lần
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+URL_RE = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+EMAIL_RE = re.compile(r'\S+@\S+')
+PHONE_RE = re.compile(r'[\+]?[1-9]?[0-9]{7,15}')
+NON_WORD_RE = re.compile(r'[^\w\sàáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ]')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Sau khi thay ký tự không phải chữ/số bằng khoảng trắng, token là các dãy ký tự \w liên tiếp
+# (các chữ cái tiếng Việt có dấu đều thuộc \w)
+WORD_RE = re.compile(r'\w+')
+# Số điện thoại cần ít nhất 7 chữ số liên tiếp
+DIGIT_RUN_RE = re.compile(r'[0-9]{7}')
+
+# Văn bản ngắn (query, title) được cache kết quả tách từ
+MEMO_MAX_LENGTH = 256
+MEMO_SIZE = 8192
+
+# Vị trí đầu tiên của content cách từ cuối của title chừng này vị trí,
+# để truy vấn cụm từ / NEAR không khớp qua ranh giới title và content
+FIELD_POSITION_GAP = 100
 
 class BasicVietnameseTextProcessor:
     def __init__(self):
@@ -22,6 +45,7 @@ class BasicVietnameseTextProcessor:
             'ở', 'tôi', 'bạn', 'anh', 'chị', 'em', 'ông', 'bà', 'cô', 'chú',
             'thầy', 'cô', 'các', 'những', 'mỗi', 'từng', 'ai', 'gì', 'đâu', 'nào'
         }
+        self._tokenize_memo = lru_cache(maxsize=MEMO_SIZE)(self._tokenize_tuple)
     
     def clean_text(self, text: str) -> str:
         """Làm sạch văn bản"""
@@ -31,60 +55,149 @@ class BasicVietnameseTextProcessor:
         # Chuyển về chữ thường
         text = text.lower()
         
-        # Loại bỏ HTML tags nếu có
-        text = re.sub(r'<[^>]+>', '', text)
-        
-        # Loại bỏ URLs
-        text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
-        
-        # Loại bỏ email
-        text = re.sub(r'\S+@\S+', '', text)
-        
-        # Loại bỏ số điện thoại
-        text = re.sub(r'[\+]?[1-9]?[0-9]{7,15}', '', text)
+        # Loại bỏ HTML tags, URLs, email, số điện thoại
+        text = self._remove_patterns(text)
         
         # Giữ lại chữ cái tiếng Việt, số và khoảng trắng
-        text = re.sub(r'[^\w\sàáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ]', ' ', text)
+        text = NON_WORD_RE.sub(' ', text)
         
         # Loại bỏ khoảng trắng thừa
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = WHITESPACE_RE.sub(' ', text).strip()
         
         return text
     
+    def _remove_patterns(self, text: str) -> str:
+        """Loại bỏ HTML tags, URLs, email và số điện thoại (text đã ở chữ thường)
+
+        Chỉ chạy regex tương ứng khi văn bản có thể chứa mẫu đó
+        (kiểm tra bằng tìm chuỗi con, nhanh hơn nhiều so với re.sub).
+        """
+        if '<' in text:
+            text = HTML_TAG_RE.sub('', text)
+        if 'http' in text:
+            text = URL_RE.sub('', text)
+        if '@' in text:
+            text = EMAIL_RE.sub('', text)
+        if DIGIT_RUN_RE.search(text):
+            text = PHONE_RE.sub('', text)
+        return text
+    
+    def _tokenize_tuple(self, text: str) -> Tuple[str, ...]:
+        return tuple(self._tokenize(text))
+    
+    def _words(self, text: str) -> List[str]:
+        """Mọi từ của văn bản (kể cả stop words và từ ngắn), cùng cách làm sạch với clean_text()"""
+        return WORD_RE.findall(self._remove_patterns(text.lower())) if text else []
+    
+    def _tokenize(self, text: str) -> List[str]:
+        """Làm sạch và tách từ trong một lượt, cho cùng kết quả với clean_text() + split()"""
+        stop_words = self.stop_words
+        return [
+            token for token in self._words(text)
+            if len(token) >= 2 and token not in stop_words
+        ]
+    
+    def positional_tokens(self, text: str, words: Optional[List[str]] = None) -> List[Tuple[int, str]]:
+        """Các (vị trí, token) của văn bản, token như simple_tokenize()
+
+        Vị trí đếm cả stop words và từ ngắn đã bị lọc, nên khoảng cách giữa hai
+        token giống trong văn bản gốc. words: các từ của text nếu đã tách (split_words()).
+        """
+        stop_words = self.stop_words
+        return [
+            (position, token) for position, token in enumerate(self._words(text) if words is None else words)
+            if len(token) >= 2 and token not in stop_words
+        ]
+    
     def simple_tokenize(self, text: str) -> List[str]:
-        """Tách từ đơn giản bằng khoảng trắng"""
+        """Tách từ đơn giản bằng khoảng trắng
+
+        Lọc bỏ stop words và từ có độ dài < 2. Văn bản ngắn (query, title)
+        được cache vì thường lặp lại.
+        """
         if not text:
             return []
-        
-        # Làm sạch văn bản trước
-        clean_text = self.clean_text(text)
-        
-        # Tách từ bằng khoảng trắng
-        tokens = clean_text.split()
-        
-        # Lọc bỏ stop words và từ có độ dài < 2
-        filtered_tokens = [
-            token for token in tokens 
-            if token not in self.stop_words and len(token) >= 2
-        ]
-        
-        return filtered_tokens
+        if len(text) <= MEMO_MAX_LENGTH:
+            return list(self._tokenize_memo(text))
+        return self._tokenize(text)
+    
+    def document_tokens(self, title: str, content: str) -> List[str]:
+        """Danh sách token của document (title được lặp lại 2 lần để tăng trọng số),
+        dùng cho preprocess_document; index của SimpleTFIDFSearchEngine dùng document_fields()"""
+        title_tokens, content_tokens = self.document_fields(title, content)
+        return title_tokens * 2 + content_tokens
+    
+    def document_fields(self, title: str, content: str) -> Tuple[List[str], List[str]]:
+        """Token của title và của content (trọng số của từng trường do index áp dụng khi chấm điểm)"""
+        return self.simple_tokenize(title), self.simple_tokenize(content)
+    
+    def split_words(self, text: str, starts: Sequence[int]) -> Tuple[List[str], Optional[List[int]]]:
+        """Các từ của text như _words() và số từ đứng trước từng vị trí ký tự trong starts
+
+        starts tăng dần, mỗi vị trí nằm ngay sau khoảng trắng nên không cắt đôi một từ.
+        Khi bước làm sạch không xóa gì, văn bản chỉ được tách từ một lần theo từng đoạn.
+        Số từ là None nếu không tính được (thẻ HTML vắt qua ranh giới hai đoạn).
+        """
+        if not text:
+            return [], [0] * len(starts)
+        lowered = text.lower()
+        bounds = list(starts) + [len(text)]
+        if len(lowered) == len(text) and self._remove_patterns(lowered) == lowered:
+            words = WORD_RE.findall(lowered, 0, bounds[0])
+            counts = []
+            for start, end in zip(bounds, bounds[1:]):
+                counts.append(len(words))
+                words += WORD_RE.findall(lowered, start, end)
+            return words, counts
+
+        # Làm sạch từng đoạn rồi so tổng số từ với cả văn bản
+        words = self._words(text)
+        counts = []
+        count = len(self._words(text[:bounds[0]]))
+        for start, end in zip(bounds, bounds[1:]):
+            counts.append(count)
+            count += len(self._words(text[start:end]))
+        return words, counts if count == len(words) else None
+    
+    def content_start(self, title: str, title_words: Optional[List[str]] = None) -> int:
+        """Vị trí của từ đầu tiên của content trong document_positions()"""
+        if title_words is None:
+            title_words = self._words(title)
+        return len(title_words) + FIELD_POSITION_GAP
+    
+    def document_positions(self, title: str, content: str,
+                           content_words: Optional[List[str]] = None) -> Tuple[List[str], List[str], Dict[str, List[int]]]:
+        """Token của title, của content như document_fields() và vị trí của từng token
+
+        Vị trí được tính trên title rồi content, content bắt đầu sau title
+        FIELD_POSITION_GAP vị trí. Thứ tự token trong dict là thứ tự xuất hiện đầu
+        tiên trong title rồi content. content_words: các từ của content nếu đã tách.
+        """
+        positions = {}
+        title_tokens = []
+        title_words = self._words(title)
+        for position, token in self.positional_tokens(title):
+            title_tokens.append(token)
+            positions.setdefault(token, []).append(position)
+        content_tokens = []
+        start = self.content_start(title, title_words)
+        for position, token in self.positional_tokens(content, content_words):
+            content_tokens.append(token)
+            positions.setdefault(token, []).append(start + position)
+        return title_tokens, content_tokens, positions
+    
+    def query_tokens(self, query: str) -> List[str]:
+        """Danh sách token của query tìm kiếm"""
+        return self.simple_tokenize(query)
     
     def preprocess_document(self, title: str, content: str) -> str:
         """Tiền xử lý document (kết hợp title và content)"""
         # Gán trọng số cao hơn cho title bằng cách lặp lại 2 lần
-        title_tokens = self.simple_tokenize(title)
-        content_tokens = self.simple_tokenize(content)
-        
-        # Kết hợp title (x2) và content
-        all_tokens = title_tokens * 2 + content_tokens
-        
-        return ' '.join(all_tokens)
+        return ' '.join(self.document_tokens(title, content))
     
     def preprocess_query(self, query: str) -> str:
         """Tiền xử lý query tìm kiếm"""
-        tokens = self.simple_tokenize(query)
-        return ' '.join(tokens)
+        return ' '.join(self.query_tokens(query))
 
 # Test module
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+"""
+Đọc corpus tin tức theo luồng (JSON array, JSONL, có thể nén gzip)
+"""
+
+import gzip
+import io
+import itertools
+import json
+from typing import Dict, Iterable, Iterator, List, TextIO
+
+GZIP_MAGIC = b'\x1f\x8b'
+CHUNK_SIZE = 1 << 16
+
+
+def open_corpus(path: str) -> TextIO:
+    """Mở file corpus ở chế độ text, tự nhận diện gzip theo magic bytes"""
+    with open(path, 'rb') as f:
+        is_gzip = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    if is_gzip:
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_documents(path: str) -> Iterator[Dict]:
+    """Đọc lần lượt từng document, không nạp toàn bộ file vào bộ nhớ
+
+    Hỗ trợ file JSON dạng mảng (`[{...}, {...}]`) và JSONL (mỗi dòng một object),
+    định dạng được nhận diện theo ký tự đầu tiên khác khoảng trắng.
+    """
+    with open_corpus(path) as f:
+        first_char = ''
+        while True:
+            first_char = f.read(1)
+            if not first_char or not first_char.isspace():
+                break
+        if not first_char:
+            return
+        if first_char == '[':
+            yield from _iter_json_array(f)
+        else:
+            yield from _iter_json_lines(itertools.chain([first_char + f.readline()], f))
+
+
+def _iter_json_lines(lines: Iterable[str]) -> Iterator[Dict]:
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Dòng {line_no} không phải JSON hợp lệ: {e}") from e
+
+
+def _iter_json_array(f: io.TextIOBase) -> Iterator[Dict]:
+    """Giải mã từng phần tử của một JSON array (dấu '[' đã được đọc)"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    expect_value = True
+
+    while True:
+        # Bỏ qua khoảng trắng và dấu phẩy giữa các phần tử
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','):
+            if buffer[position] == ',':
+                expect_value = True
+            position += 1
+
+        if position < len(buffer) and buffer[position] == ']':
+            return
+
+        if position < len(buffer) and expect_value:
+            try:
+                document, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                end = None
+            # Phần tử chạm cuối buffer có thể chưa đầy đủ, cần đọc thêm rồi giải mã lại
+            if end is not None and (end < len(buffer) or eof):
+                yield document
+                position = end
+                expect_value = False
+                continue
+            if eof:
+                raise ValueError(f"JSON array không hợp lệ gần vị trí {position}")
+        elif position < len(buffer):
+            raise ValueError(f"Thiếu dấu phẩy giữa các phần tử gần vị trí {position}")
+
+        if eof:
+            raise ValueError("JSON array kết thúc không đúng (thiếu ']')")
+
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """Gom iterable thành các batch có tối đa batch_size phần tử"""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,217 @@
+"""
+Kho documents tách khỏi index, lưu trên đĩa và đọc qua memory-map
+
+Mỗi document gồm RECORDS_PER_DOCUMENT record nối liên tiếp: record tóm tắt
+(JSON, mọi trường trừ 'content', thêm 'preview' là đoạn đầu của content), record
+đầy đủ (JSON, 'content' để null) và content (UTF-8 thô, rỗng nếu document không
+có content dạng chuỗi). Bảng offset có 3 * num_docs + 1 phần tử: record thứ k
+của document i nằm trong [offs[3i + k], offs[3i + k + 1]). Kết quả tìm kiếm chỉ
+cần giải mã record tóm tắt của các document được trả về, và snippet chỉ đọc
+một khoảng byte của content (content_bytes()).
+
+Kho nạp từ snapshot có checksum CRC32 cho từng block CHECKSUM_BLOCK_SIZE byte;
+mỗi block được kiểm tra ở lần đầu có record nằm trong nó được đọc, nên thời gian
+khởi động không phụ thuộc kích thước kho.
+"""
+
+import json
+import mmap
+import tempfile
+import zlib
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+# Số ký tự đầu của content dùng làm preview trong kết quả tìm kiếm
+PREVIEW_LENGTH = 200
+# Record tóm tắt, record đầy đủ (không có content) và content
+RECORDS_PER_DOCUMENT = 3
+# Kích thước block được kiểm tra checksum
+CHECKSUM_BLOCK_SIZE = 1 << 20
+
+
+class DocumentStoreError(Exception):
+    """Dữ liệu của kho documents bị hỏng (sai checksum)"""
+
+
+def make_summary(document: Dict) -> Dict:
+    """Bản tóm tắt của document: mọi trường trừ 'content', kèm 'preview'"""
+    summary = {key: value for key, value in document.items() if key != 'content'}
+    content = document.get('content') or ''
+    summary['preview'] = content[:PREVIEW_LENGTH] + '...' if len(content) > PREVIEW_LENGTH else content
+    return summary
+
+
+def encode_records(document: Dict) -> Tuple[bytes, bytes, bytes]:
+    """(record tóm tắt, record đầy đủ, content) của một document"""
+    content = document.get('content')
+    if isinstance(content, str) and content:
+        # Giữ chỗ của 'content' để thứ tự các trường không đổi khi đọc lại
+        full, content = dict(document, content=None), content.encode('utf-8')
+    else:
+        full, content = document, b''
+    return (json.dumps(make_summary(document), ensure_ascii=False).encode('utf-8'),
+            json.dumps(full, ensure_ascii=False).encode('utf-8'),
+            content)
+
+
+class BlockChecksums:
+    """CRC32 của từng block CHECKSUM_BLOCK_SIZE byte, tính khi dữ liệu được ghi theo luồng"""
+
+    def __init__(self):
+        self.checksums = array('I')
+        self._crc = 0
+        self._filled = 0
+
+    def update(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            chunk = view[:CHECKSUM_BLOCK_SIZE - self._filled]
+            self._crc = zlib.crc32(chunk, self._crc)
+            self._filled += len(chunk)
+            view = view[len(chunk):]
+            if self._filled == CHECKSUM_BLOCK_SIZE:
+                self.checksums.append(self._crc)
+                self._crc = self._filled = 0
+
+    def finish(self) -> array:
+        if self._filled:
+            self.checksums.append(self._crc)
+            self._crc = self._filled = 0
+        return self.checksums
+
+
+class DocumentStore(Sequence):
+    """Danh sách documents đọc từ buffer (thường là memory-map), chỉ giải mã document được truy cập
+
+    checksums: CRC32 của từng block của buffer (xem BlockChecksums); None nếu không kiểm tra
+    """
+
+    def __init__(self, buffer: memoryview, offsets: memoryview, checksums: Optional[Sequence] = None):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._checksums = checksums
+        # Block đã kiểm tra checksum
+        self._verified = bytearray(len(checksums)) if checksums is not None else None
+
+    def _verify(self, start: int, stop: int):
+        """Kiểm tra checksum các block chứa [start, stop) chưa được kiểm tra
+
+        Raises:
+            DocumentStoreError: nếu một block sai checksum
+        """
+        if self._verified is None or start >= stop:
+            return
+        for block in range(start // CHECKSUM_BLOCK_SIZE, (stop - 1) // CHECKSUM_BLOCK_SIZE + 1):
+            if self._verified[block]:
+                continue
+            data = self._buffer[block * CHECKSUM_BLOCK_SIZE:(block + 1) * CHECKSUM_BLOCK_SIZE]
+            if zlib.crc32(data) != self._checksums[block]:
+                raise DocumentStoreError(f"Kho documents bị hỏng (sai checksum ở block {block})")
+            self._verified[block] = 1
+
+    def _record(self, index: int) -> bytes:
+        start, stop = self._offsets[index], self._offsets[index + 1]
+        self._verify(start, stop)
+        return bytes(self._buffer[start:stop])
+
+    def _check_index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('document index out of range')
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = RECORDS_PER_DOCUMENT * self._check_index(index)
+        document = json.loads(self._record(index + 1))
+        content = self._record(index + 2)
+        if content:
+            document['content'] = content.decode('utf-8')
+        return document
+
+    def summary(self, index: int) -> Dict:
+        """Bản tóm tắt (không có content) của document"""
+        return json.loads(self._record(RECORDS_PER_DOCUMENT * self._check_index(index)))
+
+    def content_bytes(self, index: int, start: int, stop: int) -> bytes:
+        """Các byte [start, stop) của content (UTF-8) của document"""
+        index = RECORDS_PER_DOCUMENT * self._check_index(index) + 2
+        base, end = self._offsets[index], self._offsets[index + 1]
+        start, stop = min(base + start, end), min(base + stop, end)
+        self._verify(start, stop)
+        return bytes(self._buffer[start:stop])
+
+    def raw_records(self, index: int) -> Tuple[bytes, ...]:
+        """Các record đã mã hóa của document, dùng để chép sang kho khác không cần giải mã"""
+        index = RECORDS_PER_DOCUMENT * self._check_index(index)
+        return tuple(self._record(index + k) for k in range(RECORDS_PER_DOCUMENT))
+
+    def __len__(self) -> int:
+        return (len(self._offsets) - 1) // RECORDS_PER_DOCUMENT
+
+
+def document_summary(documents, index: int) -> Dict:
+    """Bản tóm tắt của documents[index] cho cả DocumentStore lẫn list"""
+    if isinstance(documents, DocumentStore):
+        return documents.summary(index)
+    return make_summary(documents[index])
+
+
+def content_bytes(documents, index: int, start: int, stop: int) -> bytes:
+    """Các byte [start, stop) của content (UTF-8) của documents[index] cho cả DocumentStore lẫn list"""
+    if isinstance(documents, DocumentStore):
+        return documents.content_bytes(index, start, stop)
+    content = documents[index].get('content')
+    return content.encode('utf-8')[start:stop] if isinstance(content, str) else b''
+
+
+def iter_raw_records(documents) -> Iterator[Tuple[bytes, ...]]:
+    """Các record đã mã hóa của mọi document"""
+    if isinstance(documents, DocumentStore):
+        for index in range(len(documents)):
+            yield documents.raw_records(index)
+    else:
+        for document in documents:
+            yield encode_records(document)
+
+
+class DocumentStoreWriter:
+    """Ghi documents ra file tạm theo định dạng của DocumentStore,
+    dùng khi đọc corpus theo luồng để không phải giữ documents trong RAM"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._offsets = array('Q', [0])
+
+    def _write(self, record: bytes):
+        self._file.write(record)
+        self._offsets.append(self._offsets[-1] + len(record))
+
+    def append(self, document: Dict):
+        for record in encode_records(document):
+            self._write(record)
+
+    def append_from(self, documents, index: int):
+        """Chép documents[index], không giải mã lại nếu nguồn là DocumentStore"""
+        if isinstance(documents, DocumentStore):
+            for record in documents.raw_records(index):
+                self._write(record)
+        else:
+            self.append(documents[index])
+
+    def spool(self, documents: Iterable[Dict]) -> Iterable[Dict]:
+        """Ghi từng document khi nó đi qua pipeline"""
+        for document in documents:
+            self.append(document)
+            yield document
+
+    def finish(self) -> DocumentStore:
+        """Kết thúc ghi và trả về DocumentStore đọc qua memory-map"""
+        self._file.flush()
+        if self._offsets[-1] == 0:
+            return DocumentStore(memoryview(b''), memoryview(self._offsets))
+        mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return DocumentStore(memoryview(mapped), memoryview(self._offsets))
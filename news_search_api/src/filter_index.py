@@ -0,0 +1,317 @@
+"""
+Index cho lọc kết quả tìm kiếm theo topic, source và khoảng thời gian crawled_at
+
+Mỗi segment có một FilterIndex, xây dựng cùng lúc với postings:
+- topic / source (FieldIndex): cột value id của từng document và danh sách doc_idx
+  đã sắp xếp của từng giá trị (so khớp không phân biệt hoa thường, bỏ khoảng trắng thừa)
+- crawled_at (TimeIndex): cột thời gian (micro giây) của từng document và các doc_idx
+  sắp theo thời gian, khoảng thời gian được tra bằng tìm kiếm nhị phân
+
+SearchFilter.resolve() chọn điều kiện có ít document nhất, kiểm tra các điều kiện
+còn lại bằng cột giá trị và trả về AllowedDocs (danh sách doc_idx + bitmap theo byte)
+để backend chỉ chấm điểm các document thỏa mãn.
+"""
+
+import functools
+import itertools
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.index_segment import _nbytes, _zeros
+
+# Các trường lọc theo giá trị
+FILTER_FIELDS = ('topic', 'source')
+# Thời gian của document không có (hoặc không đọc được) crawled_at
+MISSING_TIME = -2 ** 63
+# Số kết quả resolve() được giữ lại cho mỗi segment (cùng bộ lọc cho nhiều query khác nhau)
+RESOLVED_CACHE_SIZE = 32
+
+_EPOCH = datetime(1970, 1, 1)
+_DAY_MICROS = 86400 * 10 ** 6
+
+
+def normalize_value(value) -> str:
+    """Dạng chuẩn hóa của giá trị topic/source dùng để so khớp"""
+    return '' if value is None else str(value).strip().casefold()
+
+
+def parse_time(value, end: bool = False) -> Optional[int]:
+    """Số micro giây kể từ 1970-01-01 của chuỗi ngày giờ ISO
+    ('2022-07-05', '2022-07-05 06:17:17.130776', '2022-07-05T06:17:17+07:00')
+
+    Thời gian có múi giờ được đổi sang UTC, thời gian không có múi giờ giữ nguyên.
+    Với end=True, ngày không kèm giờ được hiểu là hết ngày đó.
+
+    Returns:
+        None nếu giá trị không phải chuỗi ngày giờ hợp lệ
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    micros = (parsed - _EPOCH) // timedelta(microseconds=1)
+    if end and len(value) == 10:
+        micros += _DAY_MICROS - 1
+    return micros
+
+
+class FieldIndex:
+    """Giá trị (đã chuẩn hóa) của một trường theo từng document và danh sách document của từng giá trị"""
+
+    def __init__(self, values: List[str], doc_values, offsets, docs):
+        self.values = values
+        self.value_ids = {value: value_id for value_id, value in enumerate(values)}
+        # doc_idx -> value id
+        self.doc_values = doc_values
+        # Các doc_idx (tăng dần) có value id v: docs[offsets[v]:offsets[v + 1]]
+        self.offsets = offsets
+        self.docs = docs
+
+    @classmethod
+    def from_column(cls, values: List[str], doc_values: array) -> 'FieldIndex':
+        """Tạo danh sách document của từng giá trị từ cột value id (counting sort)"""
+        counts = [0] * len(values)
+        for value_id in doc_values:
+            counts[value_id] += 1
+        offsets = array('Q', itertools.accumulate(counts, initial=0))
+        docs = _zeros('I', offsets[-1])
+        cursors = list(offsets[:-1])
+        for doc_idx, value_id in enumerate(doc_values):
+            docs[cursors[value_id]] = doc_idx
+            cursors[value_id] += 1
+        return cls(values, doc_values, offsets, docs)
+
+    def count(self, value_ids: Iterable[int]) -> int:
+        return sum(self.offsets[value_id + 1] - self.offsets[value_id] for value_id in value_ids)
+
+    def documents(self, value_ids: Iterable[int]) -> Iterable[int]:
+        return itertools.chain.from_iterable(self.docs[self.offsets[value_id]:self.offsets[value_id + 1]]
+                                             for value_id in value_ids)
+
+    def nbytes(self) -> int:
+        return _nbytes(self.doc_values) + _nbytes(self.offsets) + _nbytes(self.docs)
+
+
+class TimeIndex:
+    """Thời gian crawled_at của từng document và các doc_idx sắp theo thời gian"""
+
+    def __init__(self, doc_times, order, sorted_times):
+        # doc_idx -> micro giây (MISSING_TIME nếu không có)
+        self.doc_times = doc_times
+        # doc_idx của các document có thời gian, sắp theo thời gian tăng dần
+        self.order = order
+        self.sorted_times = sorted_times
+
+    @classmethod
+    def from_column(cls, doc_times: array) -> 'TimeIndex':
+        order = array('I', sorted((doc_idx for doc_idx, value in enumerate(doc_times) if value != MISSING_TIME),
+                                  key=doc_times.__getitem__))
+        return cls(doc_times, order, array('q', (doc_times[doc_idx] for doc_idx in order)))
+
+    def range(self, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        """Vị trí [lo, hi) trong order của các document có start <= thời gian <= end"""
+        lo = 0 if start is None else bisect_left(self.sorted_times, start)
+        hi = len(self.order) if end is None else bisect_right(self.sorted_times, end)
+        return lo, max(lo, hi)
+
+    def nbytes(self) -> int:
+        return _nbytes(self.doc_times) + _nbytes(self.order) + _nbytes(self.sorted_times)
+
+
+class FilterIndex:
+    """Các index lọc của một segment"""
+
+    def __init__(self, fields: Dict[str, FieldIndex], crawled: TimeIndex):
+        self.fields = fields
+        self.crawled = crawled
+        self._resolved: 'OrderedDict[tuple, AllowedDocs]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, documents: Iterable[Dict]) -> 'FilterIndex':
+        writer = FilterIndexWriter()
+        for document in documents:
+            writer.add(document)
+        return writer.finish()
+
+    def __len__(self) -> int:
+        return len(self.crawled.doc_times)
+
+    def doc_values(self, doc_idx: int) -> Tuple:
+        """(giá trị của từng trường trong FILTER_FIELDS..., thời gian) của document"""
+        values = tuple(field.values[field.doc_values[doc_idx]] for field in
+                       (self.fields[name] for name in FILTER_FIELDS))
+        return values + (self.crawled.doc_times[doc_idx],)
+
+    def memory_usage(self) -> int:
+        return sum(field.nbytes() for field in self.fields.values()) + self.crawled.nbytes()
+
+
+class FilterIndexWriter:
+    """Ghi giá trị lọc của từng document theo thứ tự doc_idx"""
+
+    def __init__(self):
+        self._value_ids = {name: {} for name in FILTER_FIELDS}
+        self._columns = {name: array('I') for name in FILTER_FIELDS}
+        self._times = array('q')
+
+    def add_values(self, values: Sequence):
+        """Thêm document với (giá trị đã chuẩn hóa của từng trường..., thời gian)"""
+        for name, value in zip(FILTER_FIELDS, values):
+            value_ids = self._value_ids[name]
+            value_id = value_ids.get(value)
+            if value_id is None:
+                value_id = value_ids[value] = len(value_ids)
+            self._columns[name].append(value_id)
+        self._times.append(values[-1])
+
+    def add(self, document: Dict):
+        crawled_at = parse_time(document.get('crawled_at'))
+        self.add_values([normalize_value(document.get(name)) for name in FILTER_FIELDS]
+                        + [MISSING_TIME if crawled_at is None else crawled_at])
+
+    def add_from(self, filters: FilterIndex, doc_idx: int):
+        """Chép giá trị lọc của một document từ index khác (khi merge segment)"""
+        self.add_values(filters.doc_values(doc_idx))
+
+    def finish(self) -> FilterIndex:
+        fields = {name: FieldIndex.from_column(list(self._value_ids[name]), self._columns[name])
+                  for name in FILTER_FIELDS}
+        return FilterIndex(fields, TimeIndex.from_column(self._times))
+
+
+class AllowedDocs:
+    """Các document của một segment thỏa mãn bộ lọc: doc_idx tăng dần và bitmap (mỗi document một byte)"""
+
+    __slots__ = ('ids', 'mask')
+
+    def __init__(self, ids: array, num_docs: int):
+        self.ids = ids
+        self.mask = bytearray(num_docs)
+        for doc_idx in ids:
+            self.mask[doc_idx] = 1
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class SearchFilter:
+    """Điều kiện lọc kết quả tìm kiếm, các điều kiện được kết hợp bằng AND
+
+    topics / sources: document phải có một trong các giá trị (None: không lọc);
+    crawled_from / crawled_to: khoảng thời gian (micro giây, xem parse_time), tính cả hai đầu.
+    """
+
+    __slots__ = ('topics', 'sources', 'crawled_from', 'crawled_to')
+
+    def __init__(self, topics: Optional[Iterable[str]] = None, sources: Optional[Iterable[str]] = None,
+                 crawled_from: Optional[int] = None, crawled_to: Optional[int] = None):
+        self.topics = None if topics is None else frozenset(normalize_value(value) for value in topics)
+        self.sources = None if sources is None else frozenset(normalize_value(value) for value in sources)
+        self.crawled_from = crawled_from
+        self.crawled_to = crawled_to
+
+    @classmethod
+    def parse(cls, topics=None, sources=None, crawled_from=None, crawled_to=None) -> Optional['SearchFilter']:
+        """Tạo bộ lọc từ tham số của API (chuỗi hoặc danh sách chuỗi, ngày giờ ISO)
+
+        Returns:
+            None nếu không có điều kiện nào
+
+        Raises:
+            ValueError: nếu tham số không hợp lệ
+        """
+        def values(name, value):
+            if value is None or value == [] or value == '':
+                return None
+            if isinstance(value, str):
+                value = [value]
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise ValueError(f"{name} phải là chuỗi hoặc danh sách chuỗi")
+            return value
+
+        def time(name, value, end):
+            if value is None or value == '':
+                return None
+            parsed = parse_time(value, end)
+            if parsed is None:
+                raise ValueError(f"{name} phải là ngày giờ dạng ISO (ví dụ 2022-07-05 hoặc 2022-07-05 06:17:17)")
+            return parsed
+
+        search_filter = cls(values('topic', topics), values('source', sources),
+                            time('crawled_from', crawled_from, False), time('crawled_to', crawled_to, True))
+        return None if search_filter.is_empty() else search_filter
+
+    def is_empty(self) -> bool:
+        return (self.topics is None and self.sources is None
+                and self.crawled_from is None and self.crawled_to is None)
+
+    def key(self) -> Tuple:
+        """Khóa hashable của bộ lọc (dùng trong cache kết quả)"""
+        return (self.topics, self.sources, self.crawled_from, self.crawled_to)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SearchFilter) and self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+    def __repr__(self) -> str:
+        return f"SearchFilter{self.key()!r}"
+
+    def resolve(self, filters: FilterIndex) -> AllowedDocs:
+        """Các document của segment thỏa mãn bộ lọc (kết quả được cache theo segment)"""
+        key = self.key()
+        with filters._lock:
+            allowed = filters._resolved.get(key)
+            if allowed is not None:
+                filters._resolved.move_to_end(key)
+                return allowed
+        allowed = AllowedDocs(self._matching_documents(filters), len(filters))
+        with filters._lock:
+            filters._resolved[key] = allowed
+            if len(filters._resolved) > RESOLVED_CACHE_SIZE:
+                filters._resolved.popitem(last=False)
+        return allowed
+
+    def _matching_documents(self, filters: FilterIndex) -> array:
+        # Mỗi điều kiện: (số document thỏa mãn, các document đó, hàm kiểm tra một document)
+        conditions = []
+        for name, wanted in zip(FILTER_FIELDS, (self.topics, self.sources)):
+            if wanted is None:
+                continue
+            field = filters.fields[name]
+            value_ids = [field.value_ids[value] for value in wanted if value in field.value_ids]
+            if not value_ids:
+                return array('I')
+            allowed_ids = set(value_ids)
+            column = field.doc_values
+            conditions.append((field.count(value_ids), functools.partial(field.documents, value_ids),
+                               lambda doc_idx, column=column, allowed_ids=allowed_ids: column[doc_idx] in allowed_ids))
+        if self.crawled_from is not None or self.crawled_to is not None:
+            crawled = filters.crawled
+            lo, hi = crawled.range(self.crawled_from, self.crawled_to)
+            start = MISSING_TIME + 1 if self.crawled_from is None else self.crawled_from
+            end = -MISSING_TIME if self.crawled_to is None else self.crawled_to
+            times = crawled.doc_times
+            conditions.append((hi - lo, lambda: crawled.order[lo:hi],
+                               lambda doc_idx: start <= times[doc_idx] <= end))
+
+        conditions.sort(key=lambda condition: condition[0])
+        _, documents, _ = conditions[0]
+        checks = [check for _, _, check in conditions[1:]]
+        if checks:
+            matching = [doc_idx for doc_idx in documents() if all(check(doc_idx) for check in checks)]
+        else:
+            matching = list(documents())
+        matching.sort()
+        return array('I', matching)
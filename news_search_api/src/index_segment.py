@@ -0,0 +1,608 @@
+"""
+Segment của inverted index TF-IDF
+
+Index gồm nhiều segment bất biến: segment gốc (build_index / snapshot) và các
+segment nhỏ tạo ra khi thêm/cập nhật document. Postings lưu số lần xuất hiện
+của từ trong title và trong content cùng trọng số tính từ chúng (term frequency
+theo src/field_scoring.py), IDF dùng chung cho mọi segment và chỉ được nhân vào
+khi chấm điểm, nên cùng một document có cùng điểm dù nằm ở segment nào.
+
+Mọi cấu trúc theo term được lưu dạng mảng đánh chỉ số bằng term id (từ điển
+term -> id dùng chung), không giữ dict hay list Python cho từng term/document.
+
+Segment có thể kèm vị trí của từ trong document (PostingPositions) cho truy vấn
+cụm từ và NEAR (src/phrase_query.py): vị trí của mỗi posting là dãy tăng dần,
+lưu hiệu số giữa hai vị trí liên tiếp dạng varint. Khi đó segment cũng lưu đầu
+các đoạn của content (PassageIndex, src/snippets.py) để tạo snippet theo query.
+"""
+
+import itertools
+import math
+import mmap
+import sys
+import tempfile
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from src.field_scoring import MAX_FIELD_COUNT, FieldScoring
+
+
+def _zeros(typecode: str, length: int) -> array:
+    return array(typecode, bytes(array(typecode).itemsize * length))
+
+
+def _clamp_field_counts(field_counts: Iterator[Tuple[Tuple[str, int], int]]) -> Iterator[Tuple[Tuple[str, int], int]]:
+    """Giới hạn số lần xuất hiện trong title / content ở MAX_FIELD_COUNT (document dài bất thường)"""
+    for (word, count), title_count in field_counts:
+        content_count = min(count - title_count, MAX_FIELD_COUNT)
+        title_count = min(title_count, MAX_FIELD_COUNT)
+        yield (word, title_count + content_count), title_count
+
+
+def _nbytes(values) -> int:
+    """Số byte dữ liệu của array / memoryview / list số"""
+    if isinstance(values, (array, memoryview)):
+        return len(values) * values.itemsize
+    return sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+
+
+def dict_nbytes(term_ids: Dict[str, int]) -> int:
+    """Số byte của một từ điển term -> id (bảng băm và các chuỗi)"""
+    return sys.getsizeof(term_ids) + sum(sys.getsizeof(term) for term in term_ids)
+
+
+class TermIndexed(Mapping):
+    """Mapping term -> giá trị đọc từ các mảng đánh chỉ số bằng term id
+
+    term_ids có thể dùng chung với từ điển toàn cục và được thêm term sau khi
+    tạo: id được cấp tuần tự theo thứ tự thêm, nên chỉ `size` term đầu tiên
+    thuộc về mapping này, các term có id lớn hơn coi như không tồn tại.
+    """
+
+    def __init__(self, term_ids: Dict[str, int], size: int):
+        self.term_ids = term_ids
+        self._size = size
+
+    def term_id(self, term: str) -> Optional[int]:
+        term_id = self.term_ids.get(term)
+        return term_id if term_id is not None and term_id < self._size else None
+
+    def __contains__(self, term) -> bool:
+        return self.term_id(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return itertools.islice(self.term_ids, self._size)
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class TermValues(TermIndexed):
+    """Giá trị float theo từng term (cận trên điểm, IDF), lưu trong array('d') hoặc memoryview"""
+
+    def __init__(self, term_ids: Dict[str, int], values):
+        super().__init__(term_ids, len(values))
+        self.values = values
+
+    def __getitem__(self, term: str) -> float:
+        term_id = self.term_id(term)
+        if term_id is None:
+            raise KeyError(term)
+        return self.values[term_id]
+
+    def get(self, term: str, default=None):
+        term_id = self.term_ids.get(term)
+        if term_id is None or term_id >= self._size:
+            return default
+        return self.values[term_id]
+
+    def nbytes(self) -> int:
+        return _nbytes(self.values)
+
+
+class TermDictionary(TermValues):
+    """Từ điển term -> id dùng chung cho index, kèm IDF của từng term theo id
+
+    Chỉ thêm term mới (add), không xóa; IDF của term đã có chỉ đổi khi tạo
+    từ điển mới ở lần build / merge toàn bộ.
+    """
+
+    @classmethod
+    def from_scores(cls, idf_scores: Mapping) -> 'TermDictionary':
+        term_ids = {}
+        idf = array('d')
+        for term, value in idf_scores.items():
+            term_ids[term] = len(idf)
+            idf.append(value)
+        return cls(term_ids, idf)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[str]:
+        return itertools.islice(self.term_ids, len(self.values))
+
+    def get(self, term: str, default=None):
+        term_id = self.term_ids.get(term)
+        return default if term_id is None else self.values[term_id]
+
+    def term_id(self, term: str) -> Optional[int]:
+        return self.term_ids.get(term)
+
+    def add(self, term: str, value: float) -> int:
+        """Thêm term mới, trả về term id"""
+        if not isinstance(self.values, array):
+            # IDF nạp từ snapshot là memoryview chỉ đọc
+            self.values = array('d', self.values)
+        term_id = len(self.values)
+        self.term_ids[term] = term_id
+        self.values.append(value)
+        self._size = term_id + 1
+        return term_id
+
+    def memory_usage(self) -> Dict[str, int]:
+        return {'term_dictionary': dict_nbytes(self.term_ids), 'idf': self.nbytes()}
+
+
+def encode_positions(positions: Sequence[int]) -> bytes:
+    """Mã hóa dãy vị trí tăng dần: hiệu số liên tiếp (delta), mỗi số là varint 7 bit"""
+    deltas = [position - previous for previous, position in zip(itertools.chain((0,), positions), positions)]
+    if max(deltas, default=0) < 0x80:
+        return bytes(deltas)
+    data = bytearray()
+    for delta in deltas:
+        while delta >= 0x80:
+            data.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return bytes(data)
+
+
+def decode_positions(data) -> List[int]:
+    """Giải mã dãy vị trí của encode_positions"""
+    if max(data, default=0) < 0x80:
+        return list(itertools.accumulate(data))
+    positions = []
+    position = value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        position += value
+        positions.append(position)
+        value = shift = 0
+    return positions
+
+
+class PostingPositions:
+    """Vị trí của từ trong document cho từng posting (cùng thứ tự với PackedPostings.docs):
+    vị trí của posting p được mã hóa trong data[offsets[p]:offsets[p + 1]]"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_chunks(cls, source, starts: Sequence[int], lengths: Sequence[int]) -> 'PostingPositions':
+        """Chép vị trí của posting p từ source[starts[p]:starts[p] + lengths[p]]"""
+        offsets = array('Q', itertools.accumulate(lengths, initial=0))
+        data = bytearray(offsets[-1])
+        source = memoryview(source)
+        for start, end, length in zip(starts, offsets, lengths):
+            data[end:end + length] = source[start:start + length]
+        return cls(offsets, bytes(data))
+
+    @classmethod
+    def from_lists(cls, positions: Mapping[str, List[bytes]], term_ids: Dict[str, int]) -> 'PostingPositions':
+        """Đóng gói vị trí đã mã hóa dạng term -> [bytes], theo thứ tự hàng của PackedPostings.from_lists"""
+        offsets = array('Q', [0])
+        data = bytearray()
+        for term in term_ids:
+            for chunk in positions.get(term, ()):
+                data += chunk
+                offsets.append(len(data))
+        return cls(offsets, bytes(data))
+
+    def raw(self, posting: int) -> bytes:
+        return bytes(self.data[self.offsets[posting]:self.offsets[posting + 1]])
+
+    def get(self, posting: int) -> List[int]:
+        return decode_positions(self.data[self.offsets[posting]:self.offsets[posting + 1]])
+
+    def nbytes(self) -> int:
+        return _nbytes(self.offsets) + len(self.data)
+
+
+class PackedPostings(TermIndexed):
+    """Postings của mọi term trong các mảng (CSR): postings của term t là
+    docs[offsets[t]:offsets[t + 1]] cùng số lần xuất hiện trong title / content
+    (title_counts, content_counts) và trọng số tfs tương ứng
+
+    Dùng cho cả segment trong bộ nhớ (array) lẫn snapshot (memoryview trên mmap).
+    tfs được tính từ số đếm theo FieldScoring (snapshot không lưu tfs).
+    """
+
+    def __init__(self, term_ids: Dict[str, int], offsets, docs, tfs, title_counts, content_counts):
+        super().__init__(term_ids, len(offsets) - 1)
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.title_counts = title_counts
+        self.content_counts = content_counts
+
+    @classmethod
+    def from_lists(cls, postings: Mapping[str, List[Tuple[int, float, int, int]]],
+                   term_ids: Optional[Dict[str, int]] = None) -> 'PackedPostings':
+        """Đóng gói postings dạng term -> [(doc_idx, tf, title_count, content_count)]
+
+        Nếu có term_ids, mọi term của postings phải có id trong đó và thứ tự hàng theo id.
+        """
+        if term_ids is None:
+            term_ids = {term: term_id for term_id, term in enumerate(postings)}
+        offsets = array('Q', [0])
+        docs = array('I')
+        tfs = array('d')
+        title_counts = array('H')
+        content_counts = array('H')
+        for term in term_ids:
+            for doc_idx, tf, title_count, content_count in postings.get(term, ()):
+                docs.append(doc_idx)
+                tfs.append(tf)
+                title_counts.append(title_count)
+                content_counts.append(content_count)
+            offsets.append(len(docs))
+        return cls(term_ids, offsets, docs, tfs, title_counts, content_counts)
+
+    def with_weights(self, tfs) -> 'PackedPostings':
+        """Bản sao với trọng số mới (các mảng khác dùng chung)"""
+        return PackedPostings(self.term_ids, self.offsets, self.docs, tfs, self.title_counts, self.content_counts)
+
+    def posting_range(self, term: str) -> Optional[Tuple[int, int]]:
+        """Khoảng [start, end) của postings của term trong docs / tfs (None nếu không có term)"""
+        term_id = self.term_id(term)
+        if term_id is None:
+            return None
+        return self.offsets[term_id], self.offsets[term_id + 1]
+
+    def raw_arrays(self) -> Tuple[Dict[str, int], Sequence[int], Sequence[int], Sequence[float]]:
+        """(term_ids, offsets, docs, tfs)"""
+        return self.term_ids, self.offsets, self.docs, self.tfs
+
+    def __getitem__(self, term: str) -> List[Tuple[int, float]]:
+        term_id = self.term_id(term)
+        if term_id is None:
+            raise KeyError(term)
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return list(zip(self.docs[start:end], self.tfs[start:end]))
+
+    def get(self, term: str, default=None):
+        term_id = self.term_ids.get(term)
+        if term_id is None or term_id >= self._size:
+            return default
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return list(zip(self.docs[start:end], self.tfs[start:end]))
+
+    def items(self):
+        offsets, docs, tfs = self.offsets, self.docs, self.tfs
+        for term_id, term in enumerate(self):
+            start, end = offsets[term_id], offsets[term_id + 1]
+            yield term, list(zip(docs[start:end], tfs[start:end]))
+
+    @property
+    def num_postings(self) -> int:
+        return len(self.docs)
+
+    def nbytes(self) -> int:
+        return (_nbytes(self.offsets) + _nbytes(self.docs) + _nbytes(self.tfs)
+                + _nbytes(self.title_counts) + _nbytes(self.content_counts))
+
+
+def compute_norms(postings: Mapping[str, List[Tuple[int, float]]], num_docs: int,
+                  idf_scores: Mapping[str, float]) -> array:
+    """Tính norm TF-IDF của mọi document từ postings (không cần token gốc)"""
+    squares = [0.0] * num_docs
+    for word, word_postings in postings.items():
+        idf = idf_scores.get(word, 0)
+        if idf == 0:
+            continue
+        for doc_idx, tf in word_postings:
+            squares[doc_idx] += (tf * idf) ** 2
+    return array('d', (math.sqrt(value) for value in squares))
+
+
+def compute_doc_norms(scoring: FieldScoring, postings: PackedPostings,
+                      field_lengths: Tuple[Sequence[int], Sequence[int]], idf_scores: Mapping[str, float]) -> array:
+    """Norm của mọi document theo scoring: norm TF-IDF nếu chấm điểm bằng cosine,
+    ngược lại 1 (0 với document không có token nào)"""
+    if scoring.cosine:
+        return compute_norms(postings, len(field_lengths[0]), idf_scores)
+    return array('d', (1.0 if title_length + content_length else 0.0
+                       for title_length, content_length in zip(*field_lengths)))
+
+
+class DocStatsSpool:
+    """doc_stats cho IndexSegment.build được ghi tạm ra đĩa theo batch
+
+    Mỗi batch được ghi thành ba mảng: id tạm của các từ (theo thứ tự của word_counts),
+    số đếm và title_counts; vị trí đã mã hóa (nếu có) nối vào một file tạm khác.
+    Trong bộ nhớ chỉ còn từ điển từ -> id tạm và vài số nguyên mỗi document, nên bộ
+    nhớ khi build không tăng theo tổng số posting. Đọc lại (__iter__) từng batch một,
+    trả về cùng bộ (word_counts, title_counts, title_length, content_length) như khi ghi.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._position_file = None
+        self._word_ids: Dict[str, int] = {}
+        self._words: List[str] = []
+        # (số document, số từ, số title_counts) của từng batch theo thứ tự ghi
+        self._batches: List[Tuple[int, int, int]] = []
+        self._word_totals = array('I')
+        self._title_totals = array('I')
+        self.title_lengths = array('I')
+        self.content_lengths = array('I')
+        self.position_lengths = array('I')
+
+    def append(self, doc_stats: Sequence[Tuple[Counter, Tuple[int, ...], int, int]],
+               positions: Optional[Tuple[bytes, Sequence[int]]] = None):
+        """Ghi thống kê của một batch, positions là (data, lengths) như IndexSegment.build"""
+        word_ids, words = self._word_ids, self._words
+        ids = array('I')
+        counts = array('I')
+        title_counts = array('I')
+        for word_counts, doc_title_counts, title_length, content_length in doc_stats:
+            for word, count in word_counts.items():
+                word_id = word_ids.get(word)
+                if word_id is None:
+                    word_id = word_ids[word] = len(words)
+                    words.append(word)
+                ids.append(word_id)
+                counts.append(count)
+            title_counts.extend(doc_title_counts)
+            self._word_totals.append(len(word_counts))
+            self._title_totals.append(len(doc_title_counts))
+            self.title_lengths.append(title_length)
+            self.content_lengths.append(content_length)
+        for values in (ids, counts, title_counts):
+            values.tofile(self._file)
+        self._batches.append((len(doc_stats), len(ids), len(title_counts)))
+        if positions is not None:
+            if self._position_file is None:
+                self._position_file = tempfile.TemporaryFile(dir=self._directory)
+            self._position_file.write(positions[0])
+            self.position_lengths.extend(positions[1])
+
+    def positions(self) -> Tuple[object, Sequence[int]]:
+        """(data, lengths) của vị trí đã ghi, data đọc qua memory-map"""
+        if self._position_file is None or not self._position_file.tell():
+            return b'', self.position_lengths
+        self._position_file.flush()
+        data = mmap.mmap(self._position_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return data, self.position_lengths
+
+    @property
+    def field_totals(self) -> Tuple[int, int]:
+        """Tổng độ dài title / content"""
+        return sum(self.title_lengths), sum(self.content_lengths)
+
+    def __len__(self) -> int:
+        return len(self.title_lengths)
+
+    def __iter__(self) -> Iterator[Tuple[Dict[str, int], Tuple[int, ...], int, int]]:
+        self._file.flush()
+        self._file.seek(0)
+        words = self._words
+        first_doc = 0
+        for num_docs, num_words, num_titles in self._batches:
+            batch = []
+            for length in (num_words, num_words, num_titles):
+                values = array('I')
+                values.fromfile(self._file, length)
+                batch.append(values)
+            ids, counts, title_counts = batch
+            word_start = title_start = 0
+            for doc_idx in range(first_doc, first_doc + num_docs):
+                word_end = word_start + self._word_totals[doc_idx]
+                title_end = title_start + self._title_totals[doc_idx]
+                word_counts = dict(zip(map(words.__getitem__, ids[word_start:word_end]), counts[word_start:word_end]))
+                yield (word_counts, tuple(title_counts[title_start:title_end]),
+                       self.title_lengths[doc_idx], self.content_lengths[doc_idx])
+                word_start, title_start = word_end, title_end
+            first_doc += num_docs
+
+    def close(self):
+        self._file.close()
+        if self._position_file is not None:
+            self._position_file.close()
+
+
+class IndexSegment:
+    """Một segment: documents, postings (PackedPostings), norm của từng document, độ dài
+    title / content của từng document (field_lengths), index lọc theo topic/source/crawled_at
+    (FilterIndex, xem src/filter_index.py), vị trí của từ (PostingPositions) và đầu các
+    đoạn của content (PassageIndex, xem src/snippets.py), hai cấu trúc sau là None nếu
+    index không lưu vị trí
+
+    doc_idx là vị trí cục bộ trong segment. Document bị xóa không bị gỡ khỏi
+    postings mà được đánh dấu trong `deleted` (tombstone) cho tới lần merge sau.
+    """
+
+    def __init__(self, documents: Sequence[Dict], postings: Mapping[str, List[Tuple[int, float, int, int]]],
+                 doc_norms: Sequence[float], doc_ids: Sequence,
+                 field_lengths: Tuple[Sequence[int], Sequence[int]],
+                 term_bounds: Optional[Mapping[str, float]] = None, filters=None,
+                 positions: Optional[PostingPositions] = None, passages=None):
+        if not isinstance(postings, PackedPostings):
+            postings = PackedPostings.from_lists(postings)
+        if not isinstance(doc_norms, (array, memoryview)):
+            doc_norms = array('d', doc_norms)
+        self.documents = documents
+        self.postings = postings
+        self.doc_norms = doc_norms
+        self.doc_ids = doc_ids
+        self.field_lengths = field_lengths
+        # term -> max(tf / norm) trên postings của term, dùng làm cận trên điểm khi cắt tỉa top-k
+        self.term_bounds = term_bounds if term_bounds is not None else self.compute_term_bounds()
+        self.filters = filters
+        self.positions = positions
+        self.passages = passages
+        self.deleted: Set[int] = set()
+
+    @classmethod
+    def build(cls, documents: Sequence[Dict], doc_stats: Sequence[Tuple[Counter, Tuple[int, ...], int, int]],
+              idf_scores: Mapping[str, float], doc_ids: Optional[Sequence] = None,
+              term_ids: Optional[Dict[str, int]] = None, filters=None,
+              positions: Optional[Tuple[bytes, Sequence[int]]] = None, passages=None,
+              scoring: Optional[FieldScoring] = None,
+              avg_lengths: Tuple[float, float] = (0.0, 0.0)) -> 'IndexSegment':
+        """Tạo segment từ (word_counts, title_counts, title_length, content_length) của từng document
+
+        word_counts đếm mỗi token của title và content một lần, các từ của title đứng
+        trước; title_counts[i] là số lần từ thứ i của word_counts xuất hiện trong title
+        (chỉ gồm các từ của title). Trọng số posting và norm tính theo scoring
+        (mặc định FieldScoring()), avg_lengths là độ dài trung bình của title / content
+        trên corpus.
+
+        Postings được ghi thẳng vào mảng sau một lượt đếm document frequency.
+        term_ids (ví dụ từ điển toàn cục) phải chứa mọi từ của doc_stats;
+        mặc định segment dùng từ điển riêng. positions là (data, lengths): vị trí
+        đã mã hóa của từng (document, từ) nối liền theo thứ tự của doc_stats và
+        word_counts, lengths là số byte của từng phần; passages (PassageIndex) đi kèm positions.
+        """
+        if scoring is None:
+            scoring = FieldScoring()
+        if term_ids is None:
+            term_ids = {}
+            for word_counts, _, _, _ in doc_stats:
+                for word in word_counts:
+                    if word not in term_ids:
+                        term_ids[word] = len(term_ids)
+        num_terms = len(term_ids)
+
+        doc_freq = [0] * num_terms
+        for word_counts, _, _, _ in doc_stats:
+            for word in word_counts:
+                doc_freq[term_ids[word]] += 1
+        offsets = array('Q', itertools.accumulate(doc_freq, initial=0))
+        docs = _zeros('I', offsets[-1])
+        title_counts = _zeros('H', offsets[-1])
+        content_counts = _zeros('H', offsets[-1])
+        cursors = list(offsets[:-1])
+        if positions is not None:
+            # Vị trí (byte) trong positions[0] và số byte vị trí của từng posting
+            chunk_starts = _zeros('Q', offsets[-1])
+            chunk_lengths = _zeros('I', offsets[-1])
+            chunks = iter(positions[1])
+            chunk_start = 0
+
+        # TF-IDF: tf = (title_boost * title_count + content_boost * content_count) / độ dài có trọng số
+        # (FieldScoring.weigher), tính trực tiếp ở đây để lấy norm mà không gọi hàm cho từng posting
+        cosine = scoring.cosine
+        title_boost, content_boost = scoring.title_boost, scoring.content_boost
+        if cosine:
+            # IDF theo term id để không tra mapping cho từng posting
+            term_idf = [0.0] * num_terms
+            for word, term_id in term_ids.items():
+                term_idf[term_id] = idf_scores.get(word, 0)
+        doc_norms = array('d')
+        title_lengths = array('I')
+        content_lengths = array('I')
+        for doc_idx, (word_counts, doc_title_counts, title_length, content_length) in enumerate(doc_stats):
+            title_lengths.append(title_length)
+            content_lengths.append(content_length)
+            norm = 0.0
+            if title_length + content_length > 0:
+                squares = 0.0
+                length = title_boost * title_length + content_boost * content_length
+                field_counts = itertools.zip_longest(word_counts.items(), doc_title_counts, fillvalue=0)
+                if title_length > MAX_FIELD_COUNT or content_length > MAX_FIELD_COUNT:
+                    field_counts = _clamp_field_counts(field_counts)
+                for (word, count), title_count in field_counts:
+                    term_id = term_ids[word]
+                    position = cursors[term_id]
+                    content_count = count - title_count
+                    docs[position] = doc_idx
+                    title_counts[position] = title_count
+                    content_counts[position] = content_count
+                    cursors[term_id] = position + 1
+                    if cosine:
+                        squares += ((title_boost * title_count + content_boost * content_count) / length
+                                    * term_idf[term_id]) ** 2
+                    if positions is not None:
+                        chunk_length = next(chunks)
+                        chunk_starts[position] = chunk_start
+                        chunk_lengths[position] = chunk_length
+                        chunk_start += chunk_length
+                norm = math.sqrt(squares) if cosine else 1.0
+            doc_norms.append(norm)
+        if doc_ids is None:
+            doc_ids = [doc.get('id') for doc in documents]
+        if positions is not None:
+            positions = PostingPositions.from_chunks(positions[0], chunk_starts, chunk_lengths)
+        field_lengths = (title_lengths, content_lengths)
+        postings = PackedPostings(term_ids, offsets, docs, None, title_counts, content_counts)
+        postings = postings.with_weights(scoring.posting_weights(postings, field_lengths, avg_lengths))
+        return cls(documents, postings, doc_norms, doc_ids, field_lengths, filters=filters, positions=positions,
+                   passages=passages)
+
+    def __len__(self) -> int:
+        return len(self.doc_norms)
+
+    @property
+    def live_count(self) -> int:
+        """Số document chưa bị xóa"""
+        return len(self.doc_norms) - len(self.deleted)
+
+    def compute_term_bounds(self) -> TermValues:
+        """Tính max(tf / norm) của từng term
+
+        Đóng góp của term vào cosine similarity của mọi document trong segment
+        không vượt quá query_weight * idf * bound / query_norm.
+        """
+        doc_norms = self.doc_norms
+        term_ids, offsets, docs, tfs = self.postings.raw_arrays()
+        bounds = _zeros('d', len(offsets) - 1)
+        for term_id in range(len(bounds)):
+            bound = 0.0
+            for position in range(offsets[term_id], offsets[term_id + 1]):
+                norm = doc_norms[docs[position]]
+                if norm > 0:
+                    value = tfs[position] / norm
+                    if value > bound:
+                        bound = value
+            bounds[term_id] = bound
+        return TermValues(term_ids, bounds)
+
+    def reweighted(self, scoring: FieldScoring, idf_scores: Mapping[str, float],
+                   avg_lengths: Tuple[float, float]) -> 'IndexSegment':
+        """Bản sao segment với trọng số, norm và cận trên điểm tính lại theo scoring và bảng
+        IDF mới từ số đếm theo trường (documents, số đếm và vị trí dùng chung)"""
+        postings = self.postings.with_weights(scoring.posting_weights(self.postings, self.field_lengths, avg_lengths))
+        doc_norms = compute_doc_norms(scoring, postings, self.field_lengths, idf_scores)
+        segment = IndexSegment(self.documents, postings, doc_norms, self.doc_ids, self.field_lengths,
+                               filters=self.filters, positions=self.positions, passages=self.passages)
+        segment.deleted = self.deleted
+        return segment
+
+    def memory_usage(self, shared_term_ids: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """Số byte của từng cấu trúc trong segment (không tính documents)
+
+        Từ điển term của segment không được tính nếu là shared_term_ids (đã tính ở từ điển toàn cục).
+        """
+        term_ids = self.postings.term_ids
+        return {
+            'term_ids': 0 if term_ids is shared_term_ids else dict_nbytes(term_ids),
+            'postings': self.postings.nbytes(),
+            'term_bounds': self.term_bounds.nbytes(),
+            'doc_norms': _nbytes(self.doc_norms),
+            'field_lengths': sum(_nbytes(lengths) for lengths in self.field_lengths),
+            'doc_ids': _nbytes(self.doc_ids),
+            'deleted': _nbytes(self.deleted),
+            'filters': self.filters.memory_usage() if self.filters is not None else 0,
+            'positions': self.positions.nbytes() if self.positions is not None else 0,
+            'passages': self.passages.nbytes() if self.passages is not None else 0,
+        }
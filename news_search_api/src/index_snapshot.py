@@ -0,0 +1,400 @@
+"""
+Định dạng snapshot nhị phân cho index TF-IDF, nạp lại bằng memory-map
+
+Bố cục file (byte order của máy ghi, mọi section căn lề 8 byte):
+    header      MAGIC, version, byte order, fingerprint của file dữ liệu nguồn,
+                số documents / terms / postings, bảng section (vị trí, độ dài và
+                CRC32 của từng section) và CRC32 của header
+    vocabulary  các từ (UTF-8) nối bằng '\\n', thứ tự = term id
+    idf         float64[num_terms]
+    bounds      float64[num_terms], max(tf / norm) của từng term (cận trên cho top-k)
+    post_offs   uint64[num_terms + 1], postings của term t nằm trong [offs[t], offs[t+1])
+    post_docs   uint32[num_postings]
+    post_title  uint16[num_postings], số lần xuất hiện của từ trong title
+    post_content    uint16[num_postings], số lần xuất hiện trong content
+    post_weights    float64[num_postings], trọng số posting tính từ hai số đếm theo FieldScoring
+                của section scoring (tính lại từ số đếm khi nạp với FieldScoring khác,
+                xem src/field_scoring.py)
+    norms       float64[num_docs]
+    title_lens, content_lens    uint32[num_docs], số token của title / content
+    scoring     JSON: FieldScoring và độ dài trung bình của các trường dùng để tính
+                bounds và norms
+    docs        record tóm tắt, record đầy đủ và content của từng document, xem src/document_store.py
+    docs_crcs   uint32[], CRC32 của từng block của docs (kiểm tra khi block được đọc lần đầu)
+    doc_offs    uint64[3 * num_docs + 1], vị trí các record trong docs
+    doc_ids     JSON array chứa 'id' của từng document
+    duplicates  JSON array các [id bản chính, thông tin các bản sao] (xem src/near_duplicates.py)
+    index lọc (xem src/filter_index.py), với mỗi trường topic / source:
+    {f}_values  JSON array các giá trị đã chuẩn hóa, thứ tự = value id
+    {f}_column  uint32[num_docs], value id của từng document
+    {f}_offs    uint64[num_values + 1], {f}_docs uint32[num_docs]: doc_idx có từng giá trị
+    và với crawled_at:
+    crawled_times   int64[num_docs], micro giây kể từ 1970-01-01 (MISSING_TIME nếu không có)
+    crawled_order   uint32[], doc_idx sắp theo thời gian; crawled_sorted int64[] thời gian tương ứng
+    index gợi ý (xem src/suggest_index.py):
+    suggest_keys        các key (UTF-8) đã sắp xếp nối bằng '\n', suggest_weights uint32[num_keys]
+    suggest_prefixes    tiền tố của các nút lớn nối bằng '\n'
+    suggest_offs        uint64[num_nodes + 1], suggest_top uint32[]: top key của từng nút lớn
+    vị trí của từ (xem PostingPositions trong src/index_segment.py, rỗng nếu index không lưu vị trí):
+    pos_offs    uint64[num_postings + 1], vị trí của posting p nằm trong pos_data[offs[p]:offs[p+1]]
+    pos_data    vị trí đã mã hóa (delta + varint)
+    đầu các đoạn của content dùng cho snippet (xem src/snippets.py, rỗng nếu index không lưu vị trí):
+    pass_offs   uint64[num_docs + 1], đoạn của document i nằm trong [offs[i], offs[i+1])
+    pass_bytes, pass_words  uint32[], vị trí byte trong content và vị trí từ đầu tiên của từng đoạn
+
+Khi nạp, CRC32 của mọi section được kiểm tra trừ LAZY_SECTIONS: docs chiếm phần lớn
+file nên được kiểm tra theo block khi đọc (DocumentStore), thời gian nạp không tăng
+theo kích thước của content.
+"""
+
+import contextlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Optional, Tuple
+
+from src.document_store import CHECKSUM_BLOCK_SIZE, RECORDS_PER_DOCUMENT, BlockChecksums, DocumentStore, iter_raw_records
+from src.field_scoring import FieldScoring
+from src.filter_index import FILTER_FIELDS, FieldIndex, FilterIndex, TimeIndex
+from src.index_segment import PackedPostings, PostingPositions, TermDictionary, TermValues
+from src.snippets import PassageIndex
+from src.suggest_index import SuggestIndex
+
+MAGIC = b'VNTFIDX\0'
+FORMAT_VERSION = 12
+
+FILTER_SECTIONS = tuple(f'{field}_{part}' for field in FILTER_FIELDS for part in ('values', 'column', 'offs', 'docs'))
+FILTER_SECTIONS += ('crawled_times', 'crawled_order', 'crawled_sorted')
+SUGGEST_SECTIONS = ('suggest_keys', 'suggest_weights', 'suggest_prefixes', 'suggest_offs', 'suggest_top')
+SECTIONS = ('vocabulary', 'idf', 'bounds', 'post_offs', 'post_docs', 'post_title', 'post_content', 'post_weights',
+            'norms',
+            'title_lens', 'content_lens', 'scoring', 'doc_offs', 'docs', 'docs_crcs',
+            'doc_ids', 'duplicates') + FILTER_SECTIONS + SUGGEST_SECTIONS + ('pos_offs', 'pos_data', 'pass_offs', 'pass_bytes', 'pass_words')
+
+# Section không kiểm tra checksum khi nạp (có checksum riêng theo block)
+LAZY_SECTIONS = ('docs',)
+
+# magic, version, little_endian, source_size, source_mtime_ns, num_docs, num_terms, num_postings
+_HEADER = struct.Struct('<8sIIqqIIQ')
+# offset, length, crc32
+_SECTION = struct.Struct('<QQI')
+_CRC = struct.Struct('<I')
+_PREFIX_SIZE = _HEADER.size + _SECTION.size * len(SECTIONS) + _CRC.size
+_ALIGN = 8
+
+
+class SnapshotError(Exception):
+    """Snapshot không dùng được (không tồn tại, hỏng hoặc đã cũ)"""
+
+
+def source_fingerprint(source_path: Optional[str]) -> Tuple[int, int]:
+    """Fingerprint (kích thước, mtime_ns) của file dữ liệu nguồn"""
+    if not source_path:
+        return (-1, -1)
+    stat = os.stat(source_path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _padding(length: int) -> bytes:
+    return b'\0' * (-length % _ALIGN)
+
+
+def write_snapshot(path: str, segment, idf_scores: Mapping, suggestions: SuggestIndex,
+                   source_path: Optional[str] = None, field_scoring: Optional[FieldScoring] = None,
+                   avg_lengths: Tuple[float, float] = (0.0, 0.0), duplicates: Optional[Mapping] = None):
+    """Ghi một IndexSegment (không có document đã xóa) cùng bảng IDF và index gợi ý ra file snapshot
+
+    field_scoring / avg_lengths: cách tính trọng số đã dùng cho norm và cận trên điểm của segment
+    duplicates: id bản chính -> thông tin các bản sao không được index
+
+    Ghi ra file tạm rồi đổi tên để không để lại file dở dang.
+    """
+    if segment.deleted:
+        raise ValueError("Segment còn document đã xóa, cần merge trước khi lưu")
+    documents = segment.documents
+    postings = segment.postings
+    terms = sorted(postings.keys() | idf_scores.keys())
+    for term in terms:
+        if '\n' in term:
+            raise ValueError(f"Từ không hợp lệ trong vocabulary: {term!r}")
+
+    post_offs = array('Q', [0])
+    post_docs = array('I')
+    post_title = array('H')
+    post_content = array('H')
+    post_weights = array('d')
+    for term in terms:
+        posting_range = postings.posting_range(term)
+        if posting_range is not None:
+            start, end = posting_range
+            post_docs.extend(postings.docs[start:end])
+            post_title.extend(postings.title_counts[start:end])
+            post_content.extend(postings.content_counts[start:end])
+            post_weights.extend(postings.tfs[start:end])
+        post_offs.append(len(post_docs))
+    scoring = {'field_scoring': (field_scoring or FieldScoring()).to_dict(), 'avg_lengths': list(avg_lengths)}
+
+    def iter_positions():
+        # Vị trí của mỗi term nằm liền nhau trong segment, chép theo thứ tự term của snapshot
+        positions = segment.positions
+        offsets = positions.offsets
+        for term in terms:
+            posting_range = postings.posting_range(term)
+            if posting_range is None:
+                continue
+            start, end = posting_range
+            base = pos_offs[-1] - offsets[start]
+            pos_offs.extend(offset + base for offset in offsets[start + 1:end + 1])
+            yield positions.data[offsets[start]:offsets[end]]
+
+    pos_offs = array('Q', [0] if segment.positions is not None else [])
+    def iter_doc_records():
+        # Documents đã nằm trong DocumentStore được chép nguyên record, không mã hóa lại
+        for records in iter_raw_records(documents):
+            for record in records:
+                doc_offs.append(doc_offs[-1] + len(record))
+                doc_checksums.update(record)
+                yield record
+
+    doc_offs = array('Q', [0])
+    doc_checksums = BlockChecksums()
+    # Section docs được ghi theo luồng nên phải đứng trước doc_offs / docs_crcs trong thứ tự ghi
+    payloads = {
+        'vocabulary': lambda: ['\n'.join(terms).encode('utf-8')],
+        'idf': lambda: [array('d', (idf_scores.get(term, 0) for term in terms)).tobytes()],
+        'bounds': lambda: [array('d', (segment.term_bounds.get(term, 0.0) for term in terms)).tobytes()],
+        'post_offs': lambda: [post_offs.tobytes()],
+        'post_docs': lambda: [post_docs.tobytes()],
+        'post_title': lambda: [post_title.tobytes()],
+        'post_content': lambda: [post_content.tobytes()],
+        'post_weights': lambda: [post_weights.tobytes()],
+        'norms': lambda: [array('d', segment.doc_norms).tobytes()],
+        'title_lens': lambda: [array('I', segment.field_lengths[0]).tobytes()],
+        'content_lens': lambda: [array('I', segment.field_lengths[1]).tobytes()],
+        'scoring': lambda: [json.dumps(scoring).encode('utf-8')],
+        'docs': iter_doc_records,
+        'docs_crcs': lambda: [doc_checksums.finish().tobytes()],
+        'doc_offs': lambda: [doc_offs.tobytes()],
+        'doc_ids': lambda: [json.dumps(list(segment.doc_ids), ensure_ascii=False).encode('utf-8')],
+        'duplicates': lambda: [json.dumps([[doc_id, variants] for doc_id, variants in (duplicates or {}).items()],
+                                          ensure_ascii=False).encode('utf-8')],
+    }
+    filters = segment.filters
+    for field in FILTER_FIELDS:
+        field_index = filters.fields[field]
+        payloads[f'{field}_values'] = lambda field_index=field_index: [
+            json.dumps(field_index.values, ensure_ascii=False).encode('utf-8')]
+        payloads[f'{field}_column'] = lambda field_index=field_index: [array('I', field_index.doc_values).tobytes()]
+        payloads[f'{field}_offs'] = lambda field_index=field_index: [array('Q', field_index.offsets).tobytes()]
+        payloads[f'{field}_docs'] = lambda field_index=field_index: [array('I', field_index.docs).tobytes()]
+    payloads['crawled_times'] = lambda: [array('q', filters.crawled.doc_times).tobytes()]
+    payloads['crawled_order'] = lambda: [array('I', filters.crawled.order).tobytes()]
+    payloads['crawled_sorted'] = lambda: [array('q', filters.crawled.sorted_times).tobytes()]
+    payloads['suggest_keys'] = lambda: ['\n'.join(suggestions.keys).encode('utf-8')]
+    payloads['suggest_weights'] = lambda: [array('I', suggestions.weights).tobytes()]
+    payloads['suggest_prefixes'] = lambda: ['\n'.join(suggestions.prefixes).encode('utf-8')]
+    payloads['suggest_offs'] = lambda: [array('Q', suggestions.node_offsets).tobytes()]
+    payloads['suggest_top'] = lambda: [array('I', suggestions.node_top).tobytes()]
+    # Như docs, pos_data được ghi theo luồng trước pos_offs
+    payloads['pos_data'] = iter_positions if segment.positions is not None else lambda: []
+    payloads['pos_offs'] = lambda: [pos_offs.tobytes()]
+    passages = segment.passages
+    payloads['pass_offs'] = lambda: [array('Q', passages.offsets).tobytes()] if passages is not None else []
+    payloads['pass_bytes'] = lambda: [array('I', passages.byte_starts).tobytes()] if passages is not None else []
+    payloads['pass_words'] = lambda: [array('I', passages.word_starts).tobytes()] if passages is not None else []
+
+    tmp_path = f"{path}.tmp"
+    try:
+        _write_sections(tmp_path, payloads, source_path, len(segment.doc_norms), len(terms), len(post_docs))
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def _write_sections(tmp_path: str, payloads: Dict, source_path: Optional[str],
+                    num_docs: int, num_terms: int, num_postings: int):
+    """Ghi các section theo thứ tự của payloads, rồi ghi header"""
+    with open(tmp_path, 'wb') as f:
+        # Header được ghi sau cùng, khi đã biết vị trí các section và checksum
+        f.write(b'\0' * _PREFIX_SIZE)
+        position = _PREFIX_SIZE
+
+        def write(data: bytes):
+            nonlocal position
+            f.write(data)
+            position += len(data)
+
+        write(_padding(position))
+        sections = {}
+        for name, chunks in payloads.items():
+            start, crc = position, 0
+            for chunk in chunks():
+                write(chunk)
+                crc = zlib.crc32(chunk, crc)
+            sections[name] = (start, position - start, crc)
+            write(_padding(position))
+
+        source_size, source_mtime_ns = source_fingerprint(source_path)
+        header = _HEADER.pack(MAGIC, FORMAT_VERSION, sys.byteorder == 'little',
+                              source_size, source_mtime_ns, num_docs, num_terms, num_postings)
+        header += b''.join(_SECTION.pack(*sections[name]) for name in SECTIONS)
+        header += _CRC.pack(zlib.crc32(header))
+        f.seek(0)
+        f.write(header)
+
+
+def read_snapshot(path: str, source_path: Optional[str] = None) -> Dict:
+    """Nạp snapshot bằng memory-map
+
+    Checksum của section docs được kiểm tra khi đọc documents (DocumentStoreError nếu hỏng).
+
+    Raises:
+        SnapshotError: nếu snapshot không tồn tại, sai version, hỏng hoặc cũ hơn file nguồn
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Không mở được snapshot: {e}") from e
+
+    if len(mapped) < _PREFIX_SIZE:
+        raise SnapshotError("Snapshot bị cắt cụt")
+
+    (magic, version, little_endian, source_size, source_mtime_ns,
+     num_docs, num_terms, num_postings) = _HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise SnapshotError("Không phải file snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Snapshot version {version}, cần version {FORMAT_VERSION}")
+    (header_crc,) = _CRC.unpack_from(mapped, _PREFIX_SIZE - _CRC.size)
+    if zlib.crc32(mapped[:_PREFIX_SIZE - _CRC.size]) != header_crc:
+        raise SnapshotError("Header của snapshot bị hỏng (sai checksum)")
+    if bool(little_endian) != (sys.byteorder == 'little'):
+        raise SnapshotError("Snapshot được ghi với byte order khác")
+    try:
+        current_fingerprint = source_fingerprint(source_path)
+    except OSError as e:
+        raise SnapshotError(f"Không đọc được file dữ liệu nguồn: {e}") from e
+    if source_path and (source_size, source_mtime_ns) != current_fingerprint:
+        raise SnapshotError("Snapshot cũ hơn file dữ liệu nguồn")
+
+    view = memoryview(mapped)
+    sections = {}
+    position = _HEADER.size
+    for name in SECTIONS:
+        offset, length, crc = _SECTION.unpack_from(mapped, position)
+        position += _SECTION.size
+        if offset + length > len(mapped):
+            raise SnapshotError(f"Section {name} vượt quá kích thước file")
+        if name not in LAZY_SECTIONS and zlib.crc32(view[offset:offset + length]) != crc:
+            raise SnapshotError(f"Section {name} bị hỏng (sai checksum)")
+        sections[name] = (offset, length)
+
+    def section(name: str, fmt: Optional[str] = None) -> memoryview:
+        offset, length = sections[name]
+        data = view[offset:offset + length]
+        return data.cast(fmt) if fmt else data
+
+    idf = section('idf', 'd')
+    bounds = section('bounds', 'd')
+    post_offs = section('post_offs', 'Q')
+    post_docs = section('post_docs', 'I')
+    post_title = section('post_title', 'H')
+    post_content = section('post_content', 'H')
+    post_weights = section('post_weights', 'd')
+    norms = section('norms', 'd')
+    title_lens = section('title_lens', 'I')
+    content_lens = section('content_lens', 'I')
+    doc_offs = section('doc_offs', 'Q')
+    doc_data, doc_crcs = section('docs'), section('docs_crcs', 'I')
+    if (len(idf) != num_terms or len(bounds) != num_terms or len(post_offs) != num_terms + 1
+            or len(post_docs) != num_postings or len(post_title) != num_postings
+            or len(post_content) != num_postings or len(post_weights) != num_postings or len(norms) != num_docs or len(title_lens) != num_docs
+            or len(content_lens) != num_docs or len(doc_offs) != RECORDS_PER_DOCUMENT * num_docs + 1
+            or doc_offs[-1] != len(doc_data) or len(doc_crcs) != -(-len(doc_data) // CHECKSUM_BLOCK_SIZE)):
+        raise SnapshotError("Kích thước section không khớp header")
+    try:
+        scoring = json.loads(bytes(section('scoring')))
+        field_scoring = FieldScoring.from_dict(scoring['field_scoring'])
+        avg_lengths = tuple(float(avg) for avg in scoring['avg_lengths'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise SnapshotError(f"Section scoring không hợp lệ: {e}") from e
+
+    doc_ids = json.loads(bytes(section('doc_ids')))
+    if len(doc_ids) != num_docs:
+        raise SnapshotError("Số doc_ids không khớp header")
+    try:
+        duplicates = {doc_id: variants for doc_id, variants in json.loads(bytes(section('duplicates')))}
+    except (ValueError, TypeError) as e:
+        raise SnapshotError(f"Section duplicates không hợp lệ: {e}") from e
+
+    vocabulary = bytes(section('vocabulary')).decode('utf-8')
+    terms = vocabulary.split('\n') if num_terms else []
+    term_ids = {term: term_id for term_id, term in enumerate(terms)}
+
+    fields = {}
+    for field in FILTER_FIELDS:
+        values = json.loads(bytes(section(f'{field}_values')))
+        doc_values = section(f'{field}_column', 'I')
+        offsets = section(f'{field}_offs', 'Q')
+        docs = section(f'{field}_docs', 'I')
+        if len(doc_values) != num_docs or len(offsets) != len(values) + 1 or len(docs) != num_docs:
+            raise SnapshotError(f"Kích thước index lọc {field} không khớp header")
+        fields[field] = FieldIndex(values, doc_values, offsets, docs)
+    crawled = TimeIndex(section('crawled_times', 'q'), section('crawled_order', 'I'), section('crawled_sorted', 'q'))
+    if len(crawled.doc_times) != num_docs or len(crawled.order) != len(crawled.sorted_times):
+        raise SnapshotError("Kích thước index lọc crawled_at không khớp header")
+
+    suggest_weights = section('suggest_weights', 'I')
+    suggest_offs = section('suggest_offs', 'Q')
+    suggest_top = section('suggest_top', 'I')
+    suggest_keys = bytes(section('suggest_keys')).decode('utf-8').split('\n') if len(suggest_weights) else []
+    suggest_prefixes = (bytes(section('suggest_prefixes')).decode('utf-8').split('\n')
+                        if len(suggest_offs) > 1 else [])
+    if (not len(suggest_offs) or len(suggest_keys) != len(suggest_weights)
+            or len(suggest_prefixes) != len(suggest_offs) - 1 or suggest_offs[-1] != len(suggest_top)):
+        raise SnapshotError("Kích thước index gợi ý không khớp")
+
+    pos_offs = section('pos_offs', 'Q')
+    pos_data = section('pos_data')
+    positions = None
+    if len(pos_offs):
+        if len(pos_offs) != num_postings + 1 or pos_offs[-1] != len(pos_data):
+            raise SnapshotError("Kích thước section vị trí không khớp header")
+        positions = PostingPositions(pos_offs, pos_data)
+
+    pass_offs = section('pass_offs', 'Q')
+    passages = None
+    if len(pass_offs):
+        pass_bytes, pass_words = section('pass_bytes', 'I'), section('pass_words', 'I')
+        if (len(pass_offs) != num_docs + 1 or pass_offs[-1] != len(pass_bytes)
+                or len(pass_words) != len(pass_bytes)):
+            raise SnapshotError("Kích thước section đoạn không khớp header")
+        passages = PassageIndex(pass_offs, pass_bytes, pass_words)
+
+    return {
+        'mmap': mapped,
+        'term_ids': term_ids,
+        'idf_scores': TermDictionary(term_ids, idf),
+        'term_bounds': TermValues(term_ids, bounds),
+        # Trọng số (tfs) theo field_scoring của snapshot
+        'postings': PackedPostings(term_ids, post_offs, post_docs, post_weights, post_title, post_content),
+        'doc_norms': norms,
+        'field_lengths': (title_lens, content_lens),
+        'field_scoring': field_scoring,
+        'avg_field_lengths': avg_lengths,
+        'documents': DocumentStore(doc_data, doc_offs, doc_crcs),
+        'doc_ids': doc_ids,
+        'duplicates': duplicates,
+        'filters': FilterIndex(fields, crawled),
+        'suggestions': SuggestIndex(suggest_keys, suggest_weights, suggest_prefixes, suggest_offs, suggest_top),
+        'positions': positions,
+        'passages': passages,
+    }
@@ -0,0 +1,97 @@
+"""
+Response JSON cho các API tìm kiếm: mã hóa nhanh, nén và ETag
+
+- JSON được mã hóa bằng orjson nếu đã cài (nhanh hơn json của thư viện chuẩn nhiều
+  lần), cùng dữ liệu với jsonify: khóa được sắp xếp, không có khoảng trắng thừa; ký
+  tự không phải ASCII được ghi thẳng dạng UTF-8 thay vì \\uXXXX.
+- Body từ COMPRESS_MIN_SIZE byte trở lên được nén brotli (nếu đã cài brotli) hoặc
+  gzip theo Accept-Encoding của request.
+- ETag (weak) do route tính từ những gì quyết định nội dung response (generation
+  của index, query đã chuẩn hóa, ...): request có If-None-Match khớp nhận 304 không
+  body mà không phải tìm kiếm lại (chỉ với GET / HEAD). Response kèm Cache-Control: no-cache để trình
+  duyệt luôn hỏi lại server (gửi If-None-Match) trước khi dùng bản đã lưu.
+"""
+
+import gzip
+import hashlib
+import json
+from typing import Any, Optional
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn
+    brotli = None
+
+# Body nhỏ hơn không được nén (header nén và thời gian nén không đáng)
+COMPRESS_MIN_SIZE = 1024
+# Mức nén thấp vừa đủ: nén trên đường xử lý request nên ưu tiên tốc độ
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+JSON_MIMETYPE = 'application/json'
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps(payload: Any) -> bytes:
+    """Mã hóa payload thành JSON (UTF-8)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Kiểu orjson không hỗ trợ (ví dụ số nguyên lớn hơn 64 bit): dùng json
+            pass
+    return json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def make_etag(*parts: Any) -> str:
+    """Giá trị ETag (không có dấu ngoặc kép) từ các thành phần quyết định nội dung response"""
+    key = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=repr)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """Response 304 nếu request GET / HEAD có If-None-Match chứa etag, None nếu phải trả nội dung"""
+    if request.method not in ('GET', 'HEAD') or not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _encoding() -> Optional[str]:
+    """Cách nén tốt nhất mà client chấp nhận, None nếu không nén"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def json_response(payload: Any, status: int = 200, etag: Optional[str] = None) -> Response:
+    """Response JSON của payload, nén nếu lớn và client chấp nhận, kèm ETag nếu có"""
+    body = dumps(payload)
+    response = Response(body, status=status, mimetype=JSON_MIMETYPE)
+    if len(body) >= COMPRESS_MIN_SIZE:
+        encoding = _encoding()
+        if encoding == 'br':
+            response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+        elif encoding == 'gzip':
+            response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0))
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        # Cache trung gian phải lưu riêng bản nén và bản không nén
+        response.vary.add('Accept-Encoding')
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,472 @@
+"""
+Đo thời gian từng giai đoạn xử lý và xuất metrics theo định dạng text của Prometheus
+
+- StageTimer: ghi thời gian các giai đoạn liên tiếp bằng mốc perf_counter,
+  mỗi mốc chỉ tốn một lần gọi perf_counter và một phép cộng vào dict
+- MetricsRegistry: histogram, counter và gauge có label, render ở /api/metrics;
+  metric.labels(*giá trị) trả về chuỗi số liệu để observe/inc
+- SlowQueryLog: giữ các query chậm hơn ngưỡng kèm thời gian từng giai đoạn
+
+Khi chạy nhiều worker process (src/serve.py), share(directory) cho mỗi process
+ghi số liệu vào file riêng trong một thư mục chung (MetricsFile: memory-map, mỗi
+chuỗi số liệu một vùng cố định, ghi đè khi observe/inc); /api/metrics và
+slow-query log ở bất kỳ worker nào cộng / gộp số liệu của mọi file. File của
+worker đã dừng được giữ lại nên counter không bị giảm khi worker được fork lại.
+"""
+
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bucket (giây) cho latency của một request tìm kiếm
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Bucket (giây) cho các thao tác dài như build index
+BUILD_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# File số liệu của từng process trong thư mục dùng chung
+METRICS_FILE_PATTERN = 'metrics-{}.db'
+SLOW_LOG_FILE_PATTERN = 'slow-{}.json'
+
+# Header: số byte đã dùng; mỗi bản ghi: độ dài key, số giá trị, key (UTF-8, căn lề 8 byte), giá trị float64
+_USED = struct.Struct('<Q')
+_ENTRY = struct.Struct('<II')
+
+
+def _aligned(length: int) -> int:
+    return length + (-length % 8)
+
+
+class MetricsFile:
+    """Số liệu của một process: các bản ghi (key, giá trị float64) trong file memory-map
+
+    Bản ghi mới được ghi đầy đủ trước khi tăng số byte đã dùng ở header, nên process
+    khác đọc file (read_metrics_file) không bao giờ thấy bản ghi dở dang.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'w+b')
+        self._file.truncate(self.INITIAL_SIZE)
+        self._mmap = mmap.mmap(self._file.fileno(), self.INITIAL_SIZE)
+        self._used = _USED.size
+        _USED.pack_into(self._mmap, 0, self._used)
+        self._lock = threading.Lock()
+
+    def allocate(self, key: str, values: Sequence[float]) -> int:
+        """Thêm bản ghi với giá trị ban đầu values, trả về vị trí của giá trị đầu tiên"""
+        encoded = key.encode('utf-8')
+        offset_in_entry = _ENTRY.size + _aligned(len(encoded))
+        size = offset_in_entry + 8 * len(values)
+        with self._lock:
+            start = self._used
+            if start + size > len(self._mmap):
+                new_size = 2 * len(self._mmap)
+                while start + size > new_size:
+                    new_size *= 2
+                self._file.truncate(new_size)
+                self._mmap.close()
+                self._mmap = mmap.mmap(self._file.fileno(), new_size)
+            _ENTRY.pack_into(self._mmap, start, len(encoded), len(values))
+            self._mmap[start + _ENTRY.size:start + _ENTRY.size + len(encoded)] = encoded
+            struct.pack_into(f'<{len(values)}d', self._mmap, start + offset_in_entry, *values)
+            self._used = start + size
+            _USED.pack_into(self._mmap, 0, self._used)
+        return start + offset_in_entry
+
+    def write(self, offset: int, values: Sequence[float]):
+        with self._lock:
+            struct.pack_into(f'<{len(values)}d', self._mmap, offset, *values)
+
+    def close(self):
+        with self._lock:
+            self._mmap.close()
+            self._file.close()
+
+
+def read_metrics_file(path: str) -> Dict[str, List[float]]:
+    """key -> giá trị của các bản ghi trong file của MetricsFile (file hỏng: bỏ qua phần sau)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _USED.size:
+        return {}
+    (used,) = _USED.unpack_from(data, 0)
+    used = min(used, len(data))
+    records = {}
+    position = _USED.size
+    while position + _ENTRY.size <= used:
+        key_length, num_values = _ENTRY.unpack_from(data, position)
+        values_start = position + _ENTRY.size + _aligned(key_length)
+        end = values_start + 8 * num_values
+        if end > used:
+            break
+        key = data[position + _ENTRY.size:position + _ENTRY.size + key_length].decode('utf-8', errors='replace')
+        records[key] = list(struct.unpack_from(f'<{num_values}d', data, values_start))
+        position = end
+    return records
+
+
+class StageTimer:
+    """Thời gian (giây) của các giai đoạn liên tiếp: mark(stage) ghi thời gian từ mốc trước tới hiện tại"""
+
+    __slots__ = ('started', 'stages', '_last')
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last)
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        """Thời gian từ lúc tạo tới mốc cuối cùng"""
+        return self._last - self.started
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramSeries:
+    """Một chuỗi bucket của histogram ứng với một tổ hợp giá trị label"""
+
+    __slots__ = ('buckets', 'counts', 'total', 'count', '_lock', '_sink')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # (MetricsFile, vị trí) nhận giá trị mới sau mỗi lần observe, None nếu không chia sẻ
+        self._sink = None
+        self.reset()
+
+    def reset(self):
+        # Số mẫu trong từng bucket (không cộng dồn), phần tử cuối là bucket +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+            if self._sink is not None:
+                self._sink[0].write(self._sink[1], self.counts + [self.total, self.count])
+
+    def values(self) -> List[float]:
+        """Số mẫu của từng bucket, tổng và số mẫu (cùng thứ tự với bản ghi trong MetricsFile)"""
+        with self._lock:
+            return self.counts + [self.total, self.count]
+
+
+class _CounterSeries:
+    __slots__ = ('value', '_lock', '_sink')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sink = None
+        self.reset()
+
+    def reset(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+            if self._sink is not None:
+                self._sink[0].write(self._sink[1], [self.value])
+
+    def values(self) -> List[float]:
+        with self._lock:
+            return [self.value]
+
+
+class _LabeledMetric:
+    """Metric có label: labels(*values) trả về chuỗi số liệu của tổ hợp label đó (tạo khi dùng lần đầu)"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+        # File số liệu của process (MetricsRegistry.share), None nếu không chia sẻ
+        self._file: Optional[MetricsFile] = None
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} cần {len(self.label_names)} label: {', '.join(self.label_names)}")
+            with self._lock:
+                series = self._series.get(values)
+                if series is None:
+                    series = self._series[values] = self._new_series()
+                    if self._file is not None:
+                        self._bind_series(values, series)
+        return series
+
+    def _bind_series(self, values: Tuple, series):
+        key = json.dumps([self.name, list(values)], ensure_ascii=False)
+        series._sink = (self._file, self._file.allocate(key, series.values()))
+
+    def bind(self, metrics_file: MetricsFile, reset: bool):
+        """Ghi số liệu vào metrics_file, reset: bắt đầu lại từ 0 (process con sau fork)"""
+        with self._lock:
+            self._file = metrics_file
+            for values, series in self._series.items():
+                if reset:
+                    series.reset()
+                self._bind_series(values, series)
+
+    def _items(self, merged: Optional[Dict] = None) -> List[Tuple[Tuple[Tuple[str, str], ...], List[float]]]:
+        """(label, giá trị) của từng chuỗi số liệu, của process này hoặc đã cộng trên mọi process (merged)"""
+        if merged is None:
+            with self._lock:
+                items = sorted((values, series.values()) for values, series in self._series.items())
+        else:
+            items = sorted(merged.get(self.name, {}).items())
+        return [(tuple(zip(self.label_names, values)), series_values) for values, series_values in items]
+
+    def render(self, merged: Optional[Dict] = None) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Histogram(_LabeledMetric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self) -> _HistogramSeries:
+        return _HistogramSeries(self.buckets)
+
+    def render(self, merged: Optional[Dict] = None) -> List[str]:
+        lines = super().render()
+        for labels, values in self._items(merged):
+            counts, total, count = values[:-2], values[-2], values[-1]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += int(bucket_count)
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {int(count)}')
+        return lines
+
+
+class Counter(_LabeledMetric):
+    kind = 'counter'
+
+    def _new_series(self) -> _CounterSeries:
+        return _CounterSeries()
+
+    def render(self, merged: Optional[Dict] = None) -> List[str]:
+        lines = super().render()
+        for labels, (value,) in self._items(merged):
+            # Giá trị đọc từ file là float64
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            lines.append(f'{self.name}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Gauge:
+    """Gauge đọc giá trị từ callback lúc render (ví dụ số documents trong index)"""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Optional[float]]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def render(self, merged: Optional[Dict] = None) -> List[str]:
+        """Giá trị của process hiện tại (các worker dùng chung index nên gauge giống nhau)"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        value = self.read()
+        if value is not None:
+            lines.append(f'{self.name} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        # Thư mục chứa file số liệu của mọi process (share()), None: chỉ số liệu của process này
+        self.directory = None
+        self._file = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        if self._file is not None and isinstance(metric, _LabeledMetric):
+            metric.bind(self._file, reset=False)
+        return metric
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], Optional[float]]) -> Gauge:
+        return self.register(Gauge(name, documentation, read))
+
+    def share(self, directory: str, reset: bool = False):
+        """Ghi số liệu của process hiện tại vào file riêng trong directory, render() cộng mọi file
+
+        Process chính gọi trước khi fork (số liệu đã có, ví dụ thời gian build index, nằm
+        trong file của nó); mỗi worker gọi lại sau fork với reset=True để chỉ ghi số liệu của mình.
+        """
+        metrics_file = MetricsFile(os.path.join(directory, METRICS_FILE_PATTERN.format(os.getpid())))
+        self.directory = directory
+        self._file = metrics_file
+        for metric in self._metrics:
+            if isinstance(metric, _LabeledMetric):
+                metric.bind(metrics_file, reset)
+
+    def _merged(self) -> Dict[str, Dict[Tuple, List[float]]]:
+        """Tên metric -> giá trị label -> tổng giá trị trên file của mọi process"""
+        merged = {}
+        for path in glob.glob(os.path.join(self.directory, METRICS_FILE_PATTERN.format('*'))):
+            try:
+                records = read_metrics_file(path)
+            except OSError:
+                continue
+            for key, values in records.items():
+                try:
+                    name, label_values = json.loads(key)
+                except ValueError:
+                    continue
+                totals = merged.setdefault(name, {}).setdefault(tuple(label_values), [0.0] * len(values))
+                if len(totals) == len(values):
+                    for i, value in enumerate(values):
+                        totals[i] += value
+        return merged
+
+    def render(self) -> str:
+        """Toàn bộ metrics theo định dạng text của Prometheus"""
+        merged = self._merged() if self.directory is not None else None
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(merged))
+        return '\n'.join(lines) + '\n'
+
+
+class SlowQueryLog:
+    """Ghi lại các query có tổng thời gian vượt ngưỡng, giữ max_entries query gần nhất"""
+
+    def __init__(self, threshold_ms: float = 250.0, max_entries: int = 100):
+        self.threshold_ms = threshold_ms
+        self.max_entries = max_entries
+        self._entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+        self._total = 0
+        # Thư mục dùng chung giữa các process (share()), None: chỉ query của process này
+        self.directory = None
+        self._path = None
+
+    def share(self, directory: str, reset: bool = False):
+        """Ghi các query chậm của process hiện tại vào file riêng trong directory,
+        entries() / total gộp file của mọi process (xem MetricsRegistry.share)"""
+        with self._lock:
+            if reset:
+                self._entries.clear()
+                self._total = 0
+            self.directory = directory
+            self._path = os.path.join(directory, SLOW_LOG_FILE_PATTERN.format(os.getpid()))
+            self._write()
+
+    def _write(self):
+        """Ghi đè file của process (query chậm hiếm nên ghi lại cả file mỗi lần)"""
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'total': self._total, 'entries': list(self._entries)}, f, ensure_ascii=False)
+        os.replace(temp_path, self._path)
+
+    def _shared(self) -> List[Dict]:
+        """Nội dung file của mọi process"""
+        logs = []
+        for path in glob.glob(os.path.join(self.directory, SLOW_LOG_FILE_PATTERN.format('*'))):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    logs.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return logs
+
+    @property
+    def total(self) -> int:
+        """Số query chậm đã ghi (của mọi process nếu share())"""
+        if self.directory is None:
+            return self._total
+        return sum(log.get('total', 0) for log in self._shared())
+
+    def record(self, endpoint: str, query, timer: StageTimer, **details) -> bool:
+        """Ghi query nếu chậm hơn ngưỡng, trả về True nếu đã ghi"""
+        total_ms = timer.total * 1000
+        if total_ms < self.threshold_ms:
+            return False
+        stages_ms = {stage: round(elapsed * 1000, 3) for stage, elapsed in timer.stages.items()}
+        entry = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'endpoint': endpoint,
+            'query': query,
+            'total_ms': round(total_ms, 3),
+            'stages_ms': stages_ms,
+        }
+        if self.directory is not None:
+            entry['pid'] = os.getpid()
+        entry.update(details)
+        with self._lock:
+            self._entries.append(entry)
+            self._total += 1
+            if self._path is not None:
+                try:
+                    self._write()
+                except OSError as e:
+                    print(f"Không ghi được slow-query log: {e}")
+        return True
+
+    def entries(self) -> List[Dict]:
+        """Các query chậm gần nhất, mới nhất đứng đầu"""
+        if self.directory is None:
+            with self._lock:
+                return list(reversed(self._entries))
+        entries = [entry for log in self._shared() for entry in log.get('entries', [])]
+        # Mỗi file theo thứ tự thời gian, sort ổn định giữ thứ tự trong cùng một giây
+        entries.sort(key=lambda entry: entry.get('time', ''))
+        return list(reversed(entries[-self.max_entries:]))
@@ -0,0 +1,219 @@
+"""
+Phát hiện bài báo gần trùng lặp (near-duplicate) khi nạp corpus
+
+Cùng một tin thường được nhiều nguồn đăng lại với sửa đổi nhỏ. Trước khi build
+index, mỗi document được lấy dấu (MinHash) trên tập shingle (SHINGLE_SIZE từ
+liên tiếp) của title và content, rồi các document gần giống nhau được gom cụm
+bằng LSH trong thời gian gần tuyến tính:
+
+- chữ ký: one-permutation MinHash, mỗi shingle được băm một lần (NumPy nếu có,
+  cùng kết quả với vòng lặp Python) và rơi vào một trong NUM_HASHES ngăn, ngăn
+  giữ giá trị nhỏ nhất (ngăn rỗng lấy giá trị của ngăn kế tiếp). Mỗi giá trị giữ
+  16 bit thấp nên chữ ký chỉ tốn 2 * NUM_HASHES byte.
+- LSH: chữ ký được chia thành LSH_BANDS dải, hai document trùng nhau ở một dải
+  là ứng viên; ứng viên được giữ nếu tỉ lệ giá trị trùng nhau của hai chữ ký
+  (ước lượng độ tương đồng Jaccard của hai tập shingle) >= ngưỡng.
+- các cặp được gom thành cụm (union-find); document xuất hiện đầu tiên trong
+  corpus là bản chính (canonical) và được index, các bản sao (variant) không
+  được index mà chỉ được ghi lại (VARIANT_FIELDS) dưới bản chính.
+"""
+
+import zlib
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy là tùy chọn
+    np = None
+
+SHINGLE_SIZE = 3
+NUM_HASHES = 64
+LSH_BANDS = 16
+# Độ tương đồng Jaccard (ước lượng) tối thiểu để hai bài được coi là bản sao (ngưỡng
+# mặc định của find(); engine chỉ gộp khi được truyền duplicate_threshold)
+DUPLICATE_THRESHOLD = 0.8
+# Các trường của bản sao được giữ lại dưới bản chính
+VARIANT_FIELDS = ('id', 'title', 'source', 'url', 'crawled_at')
+
+_ROWS = NUM_HASHES // LSH_BANDS
+_BAND_BYTES = 2 * _ROWS
+_BIN_BITS = NUM_HASHES.bit_length() - 1
+_BIN_MASK = NUM_HASHES - 1
+_MASK = (1 << 64) - 1
+_EMPTY = 1 << 64
+# Hệ số của từng từ trong shingle (từ cuối hệ số 1) và của bộ trộn bit
+_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 1)
+_MIX_1 = 0xBF58476D1CE4E5B9
+_MIX_2 = 0x94D049BB133111EB
+
+
+def _mix(value: int) -> int:
+    """Trộn bit của số 64 bit (bộ trộn của splitmix64)"""
+    value ^= value >> 30
+    value = (value * _MIX_1) & _MASK
+    value ^= value >> 27
+    value = (value * _MIX_2) & _MASK
+    return value ^ (value >> 31)
+
+
+def _bin_minimums(hashes: List[int]) -> List[int]:
+    """Giá trị nhỏ nhất trong từng ngăn của các shingle (_EMPTY nếu ngăn rỗng)"""
+    count = len(hashes) - SHINGLE_SIZE + 1
+    if np is not None:
+        values = np.array(hashes, dtype=np.uint64)
+        # Phép nhân / cộng uint64 của NumPy tràn theo modulo 2^64 như _mix
+        shingles = values[:count] * np.uint64(_MULTIPLIERS[0])
+        for i in range(1, SHINGLE_SIZE):
+            shingles += values[i:i + count] * np.uint64(_MULTIPLIERS[i])
+        shingles ^= shingles >> np.uint64(30)
+        shingles *= np.uint64(_MIX_1)
+        shingles ^= shingles >> np.uint64(27)
+        shingles *= np.uint64(_MIX_2)
+        shingles ^= shingles >> np.uint64(31)
+        minimums = np.full(NUM_HASHES, _MASK, dtype=np.uint64)
+        np.minimum.at(minimums, shingles & np.uint64(_BIN_MASK), shingles >> np.uint64(_BIN_BITS))
+        return [_EMPTY if value == _MASK else value for value in minimums.tolist()]
+
+    minimums = [_EMPTY] * NUM_HASHES
+    for i in range(count):
+        value = _mix(sum(hashes[i + j] * _MULTIPLIERS[j] for j in range(SHINGLE_SIZE)) & _MASK)
+        bin_id = value & _BIN_MASK
+        value >>= _BIN_BITS
+        if value < minimums[bin_id]:
+            minimums[bin_id] = value
+    return minimums
+
+
+def document_signature(title: str, content: str) -> Optional[bytes]:
+    """Chữ ký MinHash (NUM_HASHES giá trị uint16) của document, None nếu không có từ nào
+
+    Từ được tách theo khoảng trắng (không cần tách từ tiếng Việt để so sánh hai văn bản).
+    """
+    words = f'{title or ""}\n{content or ""}'.lower().encode('utf-8').split()
+    if not words:
+        return None
+    hashes = list(map(zlib.crc32, words))
+    if len(hashes) < SHINGLE_SIZE:
+        hashes += [0] * (SHINGLE_SIZE - len(hashes))
+    minimums = _bin_minimums(hashes)
+
+    # Ngăn rỗng lấy giá trị của ngăn gần nhất về bên phải (vòng tròn) cộng khoảng cách
+    signature = array('H', bytes(2 * NUM_HASHES))
+    for bin_id in range(NUM_HASHES):
+        distance = 0
+        value = minimums[bin_id]
+        while value == _EMPTY:
+            distance += 1
+            value = minimums[(bin_id + distance) % NUM_HASHES]
+        signature[bin_id] = (value + distance * 0x9E37) & 0xFFFF
+    return signature.tobytes()
+
+
+def signature_batch(texts: Sequence[Tuple[str, str]]) -> List[Optional[bytes]]:
+    """Chữ ký của một batch (title, content), chạy được trong process con"""
+    return [document_signature(title, content) for title, content in texts]
+
+
+def similarity(first: bytes, second: bytes) -> float:
+    """Tỉ lệ giá trị trùng nhau của hai chữ ký (ước lượng độ tương đồng Jaccard)"""
+    first, second = array('H', first), array('H', second)
+    return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
+
+
+def variant_record(document: Dict) -> Dict:
+    """Thông tin của bản sao được giữ lại dưới bản chính"""
+    return {field: document.get(field) for field in VARIANT_FIELDS}
+
+
+class DuplicateClusters:
+    """Kết quả gom cụm: vị trí (trong corpus) của mỗi bản sao -> vị trí bản chính của nó
+
+    split() lọc bản sao khỏi luồng documents khi build và ghi lại thông tin của
+    chúng (variant_record) dưới bản chính; pointers() trả về id bản chính -> các bản sao.
+    """
+
+    def __init__(self, canonical_of: Dict[int, int], variants: Optional[Dict[int, List[Dict]]] = None,
+                 num_documents: int = 0):
+        self.canonical_of = canonical_of
+        # Số documents đã được so sánh (kể cả bản sao)
+        self.num_documents = num_documents
+        # vị trí bản chính -> thông tin các bản sao; đã đầy đủ nếu được truyền vào (shard)
+        self.variants = variants if variants is not None else {}
+        self._collect = variants is None
+        self._canonical_ids = {}
+
+    @classmethod
+    def find(cls, signatures: Iterable[Optional[bytes]],
+             threshold: float = DUPLICATE_THRESHOLD) -> 'DuplicateClusters':
+        """Gom cụm documents theo chữ ký (thứ tự = vị trí trong corpus, None: không so sánh)"""
+        signatures = list(signatures)
+        parent = {}
+
+        def root(position):
+            while parent.get(position, position) != position:
+                grandparent = parent.get(parent[position], parent[position])
+                parent[position] = grandparent
+                position = grandparent
+            return position
+
+        # Mỗi lần chỉ giữ bảng băm của một dải để bộ nhớ không nhân theo LSH_BANDS
+        for band in range(LSH_BANDS):
+            start = band * _BAND_BYTES
+            first_seen = {}
+            for position, signature in enumerate(signatures):
+                if signature is None:
+                    continue
+                key = signature[start:start + _BAND_BYTES]
+                other = first_seen.setdefault(key, position)
+                if other == position:
+                    continue
+                other_root, position_root = root(other), root(position)
+                if other_root == position_root:
+                    continue
+                if similarity(signatures[other], signature) >= threshold:
+                    # Gốc của cụm là document đứng trước trong corpus
+                    if other_root < position_root:
+                        parent[position_root] = other_root
+                    else:
+                        parent[other_root] = position_root
+        return cls({position: root(position) for position in parent if root(position) != position},
+                   num_documents=len(signatures))
+
+    def __len__(self) -> int:
+        """Số bản sao"""
+        return len(self.canonical_of)
+
+    def __bool__(self) -> bool:
+        """Có bản sao cần bỏ qua hoặc bản chính cần ghi lại bản sao"""
+        return bool(self.canonical_of or self.variants)
+
+    def subset(self, start: int, stop: int) -> 'DuplicateClusters':
+        """Phần của khoảng [start, stop) (cho shard), vị trí tính từ start
+
+        Cần gọi sau khi split() đã chạy hết corpus: bản sao của các bản chính trong
+        khoảng được giữ lại kể cả khi chúng nằm ngoài khoảng.
+        """
+        return DuplicateClusters(
+            {position - start: canonical - start for position, canonical in self.canonical_of.items()
+             if start <= position < stop},
+            {canonical - start: variants for canonical, variants in self.variants.items() if start <= canonical < stop},
+            stop - start)
+
+    def split(self, documents: Iterable[Dict]) -> Iterator[Dict]:
+        """Các document không phải bản sao (documents theo cùng thứ tự như khi gom cụm)"""
+        canonical_of = self.canonical_of
+        canonicals = set(canonical_of.values()).union(self.variants)
+        for position, document in enumerate(documents):
+            canonical = canonical_of.get(position)
+            if canonical is None:
+                if position in canonicals:
+                    self._canonical_ids[position] = document.get('id')
+                yield document
+            elif self._collect:
+                self.variants.setdefault(canonical, []).append(variant_record(document))
+
+    def pointers(self) -> Dict[object, List[Dict]]:
+        """id bản chính -> thông tin các bản sao (theo thứ tự corpus), sau khi split() đã chạy hết"""
+        return {self._canonical_ids[position]: variants for position, variants in sorted(self.variants.items())
+                if self._canonical_ids.get(position) is not None}
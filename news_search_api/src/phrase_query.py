@@ -0,0 +1,203 @@
+"""
+Truy vấn cụm từ và NEAR trên vị trí của từ trong document
+
+Cú pháp (trong query của /api/search):
+- "giá vàng": các từ phải đứng liền nhau theo đúng thứ tự (stop word trong cụm
+  từ giữ chỗ: "giá của vàng" khớp 'giá' rồi một từ bất kỳ rồi 'vàng')
+- a NEAR/k b: hai vế cách nhau không quá k từ, theo thứ tự bất kỳ (NEAR viết hoa,
+  k mặc định DEFAULT_NEAR_DISTANCE), mỗi vế là một từ hoặc một cụm từ trong ngoặc kép
+Các điều kiện được kết hợp bằng AND và chỉ lọc tập document được chấm điểm: điểm
+TF-IDF vẫn tính trên mọi từ của query như query thường. Title và content cách
+nhau FIELD_POSITION_GAP vị trí (src/basic_text_processor.py) nên không khớp qua
+ranh giới hai trường.
+"""
+
+import re
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.filter_index import AllowedDocs
+
+# Khoảng cách mặc định và tối đa (số từ ở giữa) của NEAR, tối đa nhỏ hơn FIELD_POSITION_GAP
+DEFAULT_NEAR_DISTANCE = 10
+MAX_NEAR_DISTANCE = 50
+
+# Cụm từ trong ngoặc kép (thiếu ngoặc đóng: tới hết query), toán tử NEAR[/k] hoặc một từ
+_TOKEN_RE = re.compile(r'"(?P<phrase>[^"]*)"?|(?<!\S)NEAR(?:/(?P<distance>\d+))?(?!\S)|(?P<word>[^\s"]+)')
+
+
+class Phrase:
+    """Các từ ở vị trí tương đối cố định: terms là các (offset, từ), offset đầu tiên là 0"""
+
+    def __init__(self, terms: Sequence[Tuple[int, str]]):
+        self.terms = list(terms)
+
+    @classmethod
+    def from_text(cls, text_processor, text: str) -> Optional['Phrase']:
+        """Cụm từ của đoạn văn bản (None nếu không còn từ nào sau khi bỏ stop word)"""
+        tokens = text_processor.positional_tokens(text)
+        if not tokens:
+            return None
+        first = tokens[0][0]
+        return cls([(position - first, word) for position, word in tokens])
+
+    def words(self) -> List[str]:
+        return [word for _, word in self.terms]
+
+    def spans(self, positions: Dict[str, List[int]]) -> List[Tuple[int, int]]:
+        """Các khoảng (vị trí đầu, vị trí cuối) khớp cụm từ trong document"""
+        starts = set(positions[self.terms[0][1]])
+        for offset, word in self.terms[1:]:
+            starts.intersection_update([position - offset for position in positions[word]])
+            if not starts:
+                return []
+        last = self.terms[-1][0]
+        return [(start, start + last) for start in sorted(starts)]
+
+    def key(self) -> str:
+        words = ['*'] * (self.terms[-1][0] + 1)
+        for offset, word in self.terms:
+            words[offset] = word
+        return '"' + ' '.join(words) + '"'
+
+
+class Near:
+    """Hai vế (Phrase hoặc Near) cách nhau không quá distance từ, theo thứ tự bất kỳ"""
+
+    def __init__(self, left, right, distance: int):
+        self.left = left
+        self.right = right
+        self.distance = distance
+
+    def words(self) -> List[str]:
+        return self.left.words() + self.right.words()
+
+    def spans(self, positions: Dict[str, List[int]]) -> List[Tuple[int, int]]:
+        """Các khoảng bao cả hai vế với mỗi cặp khoảng của hai vế đủ gần nhau"""
+        right_spans = self.right.spans(positions)
+        if not right_spans:
+            return []
+        distance = self.distance
+        spans = set()
+        for left_start, left_end in self.left.spans(positions):
+            for right_start, right_end in right_spans:
+                # Số từ ở giữa hai khoảng (âm nếu hai khoảng chồng lên nhau)
+                if right_start - left_end - 1 <= distance and left_start - right_end - 1 <= distance:
+                    spans.add((min(left_start, right_start), max(left_end, right_end)))
+        return sorted(spans)
+
+    def key(self) -> str:
+        return f'({self.left.key()} NEAR/{self.distance} {self.right.key()})'
+
+
+class PositionalQuery:
+    """Các điều kiện cụm từ / NEAR của một query, kết hợp bằng AND"""
+
+    def __init__(self, constraints: Sequence):
+        self.constraints = list(constraints)
+        self.words = list(dict.fromkeys(word for constraint in self.constraints for word in constraint.words()))
+
+    def key(self) -> str:
+        """Dạng chuẩn của các điều kiện, dùng trong cache key và fingerprint của cursor"""
+        return ' '.join(constraint.key() for constraint in self.constraints)
+
+    def matches(self, positions: Dict[str, List[int]]) -> bool:
+        return all(constraint.spans(positions) for constraint in self.constraints)
+
+    def resolve(self, segment, allowed: Optional[AllowedDocs] = None) -> AllowedDocs:
+        """Các document của segment thỏa mãn mọi điều kiện (và thuộc allowed nếu có)
+
+        Document ứng viên chứa mọi từ của điều kiện: duyệt postings của từ hiếm nhất
+        (hoặc allowed nếu ít hơn) và tìm nhị phân trong postings của các từ còn lại;
+        vị trí chỉ được giải mã cho ứng viên. Segment không lưu vị trí chỉ kiểm tra
+        document chứa mọi từ.
+        """
+        postings = segment.postings
+        ranges = []
+        for word in self.words:
+            posting_range = postings.posting_range(word)
+            if posting_range is None or posting_range[0] == posting_range[1]:
+                return AllowedDocs(array('I'), len(segment))
+            ranges.append((posting_range[1] - posting_range[0], word, posting_range[0], posting_range[1]))
+        ranges.sort()
+        docs = postings.docs
+        positions = segment.positions
+
+        if allowed is not None and len(allowed) < ranges[0][0]:
+            candidates = enumerate(allowed.ids)
+            checks = ranges
+            driver = None
+            mask = None
+        else:
+            _, driver, start, end = ranges[0]
+            candidates = zip(range(start, end), docs[start:end])
+            checks = ranges[1:]
+            mask = allowed.mask if allowed is not None else None
+        cursors = [start for _, _, start, _ in checks]
+
+        ids = array('I')
+        for driver_posting, doc_idx in candidates:
+            if mask is not None and not mask[doc_idx]:
+                continue
+            found = {} if driver is None else {driver: driver_posting}
+            exhausted = False
+            for i, (_, word, _, end) in enumerate(checks):
+                posting = bisect_left(docs, doc_idx, cursors[i], end)
+                cursors[i] = posting
+                if posting == end:
+                    # Các ứng viên sau đều lớn hơn mọi document của từ này
+                    exhausted = True
+                    break
+                if docs[posting] != doc_idx:
+                    break
+                found[word] = posting
+            if exhausted:
+                break
+            if len(found) < len(ranges):
+                continue
+            if positions is None or self.matches({word: positions.get(posting) for word, posting in found.items()}):
+                ids.append(doc_idx)
+        return AllowedDocs(ids, len(segment))
+
+
+def parse_query(text_processor, query: str) -> Tuple[str, Optional[PositionalQuery]]:
+    """Tách các điều kiện cụm từ / NEAR khỏi query
+
+    Returns:
+        (văn bản dùng để chấm điểm TF-IDF, điều kiện hoặc None nếu query không có điều kiện nào).
+        Query không có dấu ngoặc kép và NEAR được trả về nguyên vẹn.
+    """
+    if '"' not in query and 'NEAR' not in query:
+        return query, None
+
+    tokens = list(_TOKEN_RE.finditer(query))
+    is_near = [match.group('phrase') is None and match.group('word') is None for match in tokens]
+    text_parts = []
+    # Các vế: [Phrase / Near hoặc None, là điều kiện], NEAR nối vế trước và vế sau
+    operands = []
+    near_distance = None
+    for i, match in enumerate(tokens):
+        if is_near[i] and 0 < i < len(tokens) - 1 and not is_near[i - 1] and not is_near[i + 1]:
+            distance = match.group('distance')
+            near_distance = min(int(distance), MAX_NEAR_DISTANCE) if distance else DEFAULT_NEAR_DISTANCE
+            continue
+        # NEAR thiếu vế được coi là một từ thường
+        text = match.group('phrase') if match.group('phrase') is not None else match.group(0)
+        text_parts.append(text)
+        operand = [Phrase.from_text(text_processor, text), match.group('phrase') is not None]
+        if near_distance is not None:
+            left = operands.pop()
+            if left[0] is None or operand[0] is None:
+                # Vế chỉ có stop word: giữ lại vế còn lại như khi không có NEAR
+                operand = left if operand[0] is None else operand
+            else:
+                operand = [Near(left[0], operand[0], near_distance), True]
+            near_distance = None
+        operands.append(operand)
+
+    constraints = [node for node, required in operands if required and node is not None]
+    scoring_text = ' '.join(text_parts)
+    if not constraints:
+        return scoring_text, None
+    return scoring_text, PositionalQuery(constraints)
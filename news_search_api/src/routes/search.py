@@ -2,29 +2,238 @@
 Search API routes cho hệ thống tìm kiếm tin tức
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
+from src.field_scoring import BM25_B, BM25_K1, CONTENT_BOOST, TITLE_BOOST, FieldScoring
+from src.filter_index import SearchFilter
+from src.json_response import json_response, make_etag, not_modified
+from src.metrics import BUILD_BUCKETS, CONTENT_TYPE, MetricsRegistry, SlowQueryLog, StageTimer
+from src.search_cache import SearchCache
+from src.sharded_search import ShardedSearchEngine
 from src.simple_tfidf import SimpleTFIDFSearchEngine
+from src.suggest_index import SUGGEST_TOP_K
+import base64
+import hashlib
+import json
 import os
+import time
 
 search_bp = Blueprint('search', __name__)
 
 # Khởi tạo search engine global
 search_engine = None
 
+# Cache kết quả /api/search theo (query đã chuẩn hóa, limit, bộ lọc, mốc trang), tự xóa khi index đổi generation
+search_cache = SearchCache(
+    max_entries=int(os.environ.get('SEARCH_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('SEARCH_CACHE_TTL', 300))
+)
+
+# Backend chấm điểm: 'auto' (numpy nếu đã cài NumPy), 'numpy' hoặc 'python'
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+
+# Số shard (mỗi shard một process), 0 hoặc 1: không chia shard
+SEARCH_SHARDS = int(os.environ.get('SEARCH_SHARDS', 0))
+
+# Lưu vị trí của từ cho truy vấn cụm từ ("...") và NEAR/k, 0: tắt (index nhỏ hơn,
+# các truy vấn này chỉ còn yêu cầu document chứa mọi từ)
+SEARCH_POSITIONS = os.environ.get('SEARCH_POSITIONS', '1') != '0'
+
+# Mô hình chấm điểm ('tfidf' hoặc 'bm25f') và hệ số của title / content, áp dụng khi nạp
+# snapshot (không cần build lại index khi đổi), xem src/field_scoring.py
+SEARCH_FIELD_SCORING = FieldScoring(
+    model=os.environ.get('SEARCH_SCORING', 'tfidf'),
+    title_boost=float(os.environ.get('SEARCH_TITLE_BOOST', TITLE_BOOST)),
+    content_boost=float(os.environ.get('SEARCH_CONTENT_BOOST', CONTENT_BOOST)),
+    k1=float(os.environ.get('SEARCH_BM25_K1', BM25_K1)),
+    b=float(os.environ.get('SEARCH_BM25_B', BM25_B))
+)
+
+# Ngưỡng tương đồng (0..1) để gộp bài gần trùng lặp khi build index, chỉ bài xuất hiện
+# đầu tiên được index và trả về kèm các bản sao (src/near_duplicates.py), mặc định 0: không
+# gộp (ngưỡng đề nghị 0.8).
+# Snapshot đã lưu giữ kết quả gộp cũ: xóa file .idx để build lại khi đổi ngưỡng
+SEARCH_DEDUPE_THRESHOLD = float(os.environ.get('SEARCH_DEDUPE_THRESHOLD', 0))
+
+# Phân biệt các lần khởi động server trong ETag của /api/search (generation của index
+# bắt đầu lại sau khi khởi động lại); tạo trước khi fork nên mọi worker dùng chung
+SERVER_INSTANCE = os.urandom(8).hex()
+
+# Số query tối đa trong một request /api/search/batch
+SEARCH_BATCH_MAX_QUERIES = int(os.environ.get('SEARCH_BATCH_MAX_QUERIES', 100))
+
+# Số query đầu tiên của một batch được ghi vào slow-query log
+SLOW_LOG_BATCH_QUERIES = 5
+
+# Khi chạy nhiều worker (src/serve.py), mỗi worker giữ một bản index riêng nên API
+# cập nhật documents bị tắt: cập nhật file dữ liệu rồi khởi động lại để build lại index
+index_read_only = False
+
+# Query có tổng thời gian xử lý vượt ngưỡng (ms) được ghi vào slow-query log
+slow_query_log = SlowQueryLog(
+    threshold_ms=float(os.environ.get('SEARCH_SLOW_QUERY_MS', 250)),
+    max_entries=int(os.environ.get('SEARCH_SLOW_QUERY_LOG_SIZE', 100))
+)
+
+# Metrics xuất ở /api/metrics theo định dạng Prometheus
+metrics = MetricsRegistry()
+request_duration = metrics.histogram(
+    'search_request_duration_seconds', 'Thời gian xử lý request tìm kiếm', ['endpoint'])
+stage_duration = metrics.histogram(
+    'search_stage_duration_seconds', 'Thời gian từng giai đoạn của request tìm kiếm', ['endpoint', 'stage'])
+build_stage_duration = metrics.histogram(
+    'index_build_stage_duration_seconds', 'Thời gian từng giai đoạn khi nạp/xây dựng index', ['stage'],
+    buckets=BUILD_BUCKETS)
+slow_queries = metrics.counter(
+    'search_slow_queries_total', 'Số request chậm hơn ngưỡng slow-query log', ['endpoint'])
+cache_requests = metrics.counter(
+    'search_cache_requests_total', 'Số lần tra cache kết quả tìm kiếm', ['result'])
+metrics.gauge('search_index_documents', 'Số documents đang được tìm kiếm',
+              lambda: search_engine.num_documents if search_engine is not None else None)
+metrics.gauge('search_index_segments', 'Số segment (hoặc số shard) của index',
+              lambda: search_engine.num_segments if search_engine is not None else None)
+metrics.gauge('search_index_generation', 'Generation hiện tại của index',
+              lambda: search_engine.generation if search_engine is not None else None)
+
+def observe_request(endpoint, query, timer, **details):
+    """Ghi thời gian các giai đoạn của một request vào histogram và slow-query log"""
+    for stage, elapsed in timer.stages.items():
+        stage_duration.labels(endpoint, stage).observe(elapsed)
+    request_duration.labels(endpoint).observe(timer.total)
+    if slow_query_log.record(endpoint, query, timer, **details):
+        slow_queries.labels(endpoint).inc()
+
+def batch_summary(queries):
+    """Query của một batch trong slow-query log: vài query đầu nối bằng ' | ' kèm số query còn lại"""
+    summary = ' | '.join(queries[:SLOW_LOG_BATCH_QUERIES])
+    if len(queries) > SLOW_LOG_BATCH_QUERIES:
+        summary += f' (+{len(queries) - SLOW_LOG_BATCH_QUERIES})'
+    return summary
+
+def observe_build(stages):
+    """Ghi thời gian các giai đoạn nạp/xây dựng index"""
+    for stage, elapsed in stages.items():
+        build_stage_duration.labels(stage).observe(elapsed)
+
 def init_search_engine():
     """Khởi tạo search engine"""
     global search_engine
     if search_engine is None:
-        search_engine = SimpleTFIDFSearchEngine()
-        # Đường dẫn tới file dữ liệu
-        data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'sample_news.json')
-        search_engine.load_data(data_path)
-        search_engine.build_index()
-        print("Search engine đã được khởi tạo!")
+        global index_read_only
+        if SEARCH_SHARDS > 1:
+            search_engine = ShardedSearchEngine(SEARCH_SHARDS, scoring_backend=SEARCH_BACKEND,
+                                                positions=SEARCH_POSITIONS, field_scoring=SEARCH_FIELD_SCORING,
+                                                duplicate_threshold=SEARCH_DEDUPE_THRESHOLD)
+            # Index chia shard không hỗ trợ cập nhật documents
+            index_read_only = True
+        else:
+            search_engine = SimpleTFIDFSearchEngine(scoring_backend=SEARCH_BACKEND, positions=SEARCH_POSITIONS,
+                                                    field_scoring=SEARCH_FIELD_SCORING,
+                                                    duplicate_threshold=SEARCH_DEDUPE_THRESHOLD)
+        # Đường dẫn tới file dữ liệu (mặc định data/sample_news.json)
+        data_path = os.environ.get('SEARCH_DATA_PATH') or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'sample_news.json')
+        # Snapshot index nằm cạnh file dữ liệu, tự build lại nếu thiếu, hỏng hoặc cũ
+        index_path = os.path.splitext(data_path)[0] + '.idx'
+        started = time.perf_counter()
+        if search_engine.load_index(index_path, source_path=data_path):
+            observe_build({'load_snapshot': time.perf_counter() - started})
+        else:
+            search_engine.load_data(data_path)
+            search_engine.build_index()
+            started = time.perf_counter()
+            search_engine.save_index(index_path)
+            observe_build(dict(search_engine.build_timings, save_snapshot=time.perf_counter() - started))
+            # Phục vụ từ snapshot vừa lưu: index nằm trong page cache (memory-map) thay vì
+            # trên heap, các worker của src/serve.py dùng chung mà không phải copy
+            search_engine.load_index(index_path, source_path=data_path)
+        # generation của engine mới không liên quan tới kết quả đã cache
+        search_cache.clear()
+        print(f"Search engine đã được khởi tạo! (backend chấm điểm: {search_engine.scoring_backend})")
+
+def format_results(results):
+    """Chuyển kết quả (bản tóm tắt document, score) của search engine sang dạng trả về của API"""
+    formatted_results = []
+    for doc, score in results:
+        # Các bản sao (gần trùng lặp) của bài đã được gộp khi build index
+        duplicates = doc.get('duplicates', [])
+        # Bài báo thêm qua /api/documents có thể thiếu một số trường
+        formatted_results.append({
+            'id': doc.get('id'),
+            'title': doc.get('title', ''),
+            'content': doc.get('preview', ''),
+            # Đoạn khớp query nhất kèm vị trí các từ được đánh dấu (None nếu index không lưu vị trí)
+            'snippet': doc.get('snippet'),
+            'author': doc.get('author'),
+            'source': doc.get('source'),
+            'topic': doc.get('topic'),
+            'url': doc.get('url'),
+            'crawled_at': doc.get('crawled_at'),
+            'score': round(score, 4),
+            'duplicate_count': len(duplicates),
+            'duplicates': duplicates
+        })
+    return formatted_results
+
+def query_fingerprint(normalized_query, filters):
+    """Fingerprint của query đã chuẩn hóa và bộ lọc, gắn vào cursor để cursor chỉ dùng được cho đúng query đó"""
+    filter_key = None if filters is None else [sorted(value) if isinstance(value, frozenset) else value
+                                               for value in filters.key()]
+    key = json.dumps([normalized_query, filter_key], ensure_ascii=False)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+def encode_cursor(generation, fingerprint, after):
+    """Cursor (chuỗi base64 URL-safe) của trang tiếp theo: generation của index, fingerprint
+    của query và mốc (score, vị trí) của kết quả cuối trang hiện tại"""
+    score, position = after
+    payload = json.dumps([generation, fingerprint, float(score).hex(), position], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('ascii')).rstrip(b'=').decode('ascii')
+
+def decode_cursor(cursor):
+    """(generation, fingerprint, (score, vị trí)) của cursor, ValueError nếu cursor không hợp lệ"""
+    if not isinstance(cursor, str):
+        raise ValueError('Cursor không hợp lệ')
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        generation, fingerprint, score, position = json.loads(payload)
+        after = (float.fromhex(score), int(position))
+    except (ValueError, TypeError):
+        raise ValueError('Cursor không hợp lệ')
+    return generation, fingerprint, after
+
+def page_cursor(generation, normalized_query, filters, next_after):
+    """Cursor của trang sau, None nếu đã hết kết quả"""
+    if next_after is None:
+        return None
+    return encode_cursor(generation, query_fingerprint(normalized_query, filters), next_after)
+
+def parse_filters(params):
+    """Đọc bộ lọc từ tham số request, None nếu không lọc, ValueError nếu không hợp lệ
+
+    params: dict các giá trị topic, source (chuỗi hoặc danh sách), crawled_from, crawled_to (ngày giờ ISO)
+    """
+    if params is None:
+        return None
+    if not isinstance(params, dict):
+        raise ValueError('filters phải là object {"topic": ..., "source": ..., "crawled_from": ..., "crawled_to": ...}')
+    return SearchFilter.parse(params.get('topic'), params.get('source'),
+                              params.get('crawled_from'), params.get('crawled_to'))
 
 @search_bp.route('/search', methods=['GET', 'POST'])
 def search_news():
-    """API endpoint tìm kiếm tin tức"""
+    """API endpoint tìm kiếm tin tức
+
+    Lọc kết quả theo topic, source (có thể nhiều giá trị) và khoảng crawled_at:
+    GET ?q=...&topic=...&source=...&crawled_from=2022-07-01&crawled_to=2022-07-31,
+    POST {"query": ..., "filters": {"topic": [...], "source": ..., "crawled_from": ..., "crawled_to": ...}}
+
+    Phân trang: kết quả kèm next_cursor (None nếu hết kết quả), gửi lại cùng query
+    và bộ lọc với cursor=next_cursor (GET ?cursor=... hoặc POST {"cursor": ...}) để
+    lấy trang sau. Cursor hết hạn khi index thay đổi.
+
+    Response của GET / HEAD kèm ETag theo generation của index, query đã chuẩn hóa, bộ lọc, limit
+    và mốc trang: request có If-None-Match khớp nhận 304 mà không phải tìm kiếm lại.
+    POST luôn trả nội dung (không có ETag).
+    """
     try:
         # Search engine đã được khởi tạo từ main.py
         global search_engine
@@ -35,14 +244,28 @@ def search_news():
                 'results': []
             }), 500
         
+        timer = StageTimer()
         # Lấy query từ request
-        if request.method == 'GET':
-            query = request.args.get('q', '').strip()
-            limit = int(request.args.get('limit', 10))
-        else:  # POST
-            data = request.get_json()
-            query = data.get('query', '').strip() if data else ''
-            limit = int(data.get('limit', 10)) if data else 10
+        try:
+            if request.method in ('GET', 'HEAD'):
+                query = request.args.get('q', '').strip()
+                limit = int(request.args.get('limit', 10))
+                filters = parse_filters({name: request.args.getlist(name) for name in ('topic', 'source')} | {
+                    name: request.args.get(name) for name in ('crawled_from', 'crawled_to')})
+                cursor = request.args.get('cursor')
+            else:  # POST
+                data = request.get_json()
+                query = data.get('query', '').strip() if data else ''
+                limit = int(data.get('limit', 10)) if data else 10
+                filters = parse_filters(data.get('filters')) if data else None
+                cursor = data.get('cursor') if data else None
+            cursor = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e),
+                'results': []
+            }), 400
         
         if not query:
             return jsonify({
@@ -53,31 +276,170 @@ def search_news():
         
         # Giới hạn số kết quả
         limit = min(max(limit, 1), 50)  # Từ 1 đến 50
+        timer.mark('parse')
         
-        # Thực hiện tìm kiếm
-        results = search_engine.search(query, top_k=limit)
-        
-        # Format kết quả
-        formatted_results = []
-        for doc, score in results:
-            formatted_results.append({
-                'id': doc['id'],
-                'title': doc['title'],
-                'content': doc['content'][:200] + '...' if len(doc['content']) > 200 else doc['content'],
-                'author': doc['author'],
-                'source': doc['source'],
-                'topic': doc['topic'],
-                'url': doc['url'],
-                'crawled_at': doc['crawled_at'],
-                'score': round(score, 4)
-            })
+        generation = search_engine.generation
+        normalized_query = search_engine.normalize_query(query)
+        after = None
+        if cursor is not None:
+            cursor_generation, fingerprint, after = cursor
+            if fingerprint != query_fingerprint(normalized_query, filters):
+                return jsonify({
+                    'success': False,
+                    'message': 'Cursor không thuộc query và bộ lọc này',
+                    'results': []
+                }), 400
+            if cursor_generation != generation:
+                return jsonify({
+                    'success': False,
+                    'message': 'Cursor đã hết hạn do index đã thay đổi, hãy tìm kiếm lại từ trang đầu',
+                    'results': []
+                }), 410
         
-        return jsonify({
+        # Kết quả giống nhau với cùng query đã chuẩn hóa, limit, bộ lọc, mốc trang và generation của index
+        cache_key = (normalized_query, limit, filters, after)
+        etag = None
+        if request.method in ('GET', 'HEAD'):
+            etag = make_etag(SERVER_INSTANCE, generation, query_fingerprint(normalized_query, filters), limit, after)
+        response = not_modified(etag) if etag is not None else None
+        if response is not None:
+            timer.mark('etag')
+            observe_request('search', query, timer, limit=limit, not_modified=True)
+            return response
+        page = search_cache.get(cache_key, generation)
+        cache_hit = page is not None
+        cache_requests.labels('hit' if cache_hit else 'miss').inc()
+        timer.mark('cache')
+        if not cache_hit:
+            results, next_after = search_engine.search_page(query, top_k=limit, after=after, summary=True,
+                                                            timer=timer, filters=filters)
+            page = (format_results(results), next_after)
+            timer.mark('format')
+            search_cache.put(cache_key, page, generation)
+            timer.mark('cache')
+        formatted_results, next_after = page
+        
+        response = json_response({
             'success': True,
             'query': query,
             'total_results': len(formatted_results),
-            'results': formatted_results
+            'results': formatted_results,
+            'next_cursor': page_cursor(generation, normalized_query, filters, next_after)
+        }, etag=etag)
+        timer.mark('serialize')
+        observe_request('search', query, timer, limit=limit, cache_hit=cache_hit)
+        return response
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}',
+            'results': []
+        }), 500
+
+def parse_batch_item(item, default_limit):
+    """Đọc (query, limit) của một phần tử trong batch, ValueError nếu không hợp lệ"""
+    if isinstance(item, str):
+        query, limit = item, default_limit
+    elif isinstance(item, dict):
+        query, limit = item.get('query', ''), item.get('limit', default_limit)
+    else:
+        raise ValueError('Mỗi phần tử phải là chuỗi query hoặc {"query": ..., "limit": ...}')
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError('Query không được để trống')
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('limit phải là số nguyên')
+    # Giới hạn số kết quả
+    return query.strip(), min(max(limit, 1), 50)  # Từ 1 đến 50
+
+@search_bp.route('/search/batch', methods=['POST'])
+def search_batch():
+    """API endpoint tìm kiếm nhiều query trong một request
+
+    Body: {"queries": ["query", {"query": "...", "limit": 5}, ...], "limit": 10}
+    Query lỗi chỉ làm hỏng phần tử tương ứng, không làm hỏng cả batch.
+    """
+    try:
+        global search_engine
+        if search_engine is None:
+            return jsonify({
+                'success': False,
+                'message': 'Search engine chưa được khởi tạo',
+                'results': []
+            }), 500
+        
+        data = request.get_json(silent=True)
+        items = data.get('queries') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'message': 'Cần gửi danh sách queries',
+                'results': []
+            }), 400
+        if len(items) > SEARCH_BATCH_MAX_QUERIES:
+            return jsonify({
+                'success': False,
+                'message': f'Tối đa {SEARCH_BATCH_MAX_QUERIES} query mỗi batch',
+                'results': []
+            }), 400
+        default_limit = data.get('limit', 10) if isinstance(data, dict) else 10
+        timer = StageTimer()
+        
+        generation = search_engine.generation
+        responses = [None] * len(items)
+        # Các query chưa có trong cache: cache_key -> (query, limit, vị trí trong batch)
+        pending = {}
+        for position, item in enumerate(items):
+            try:
+                query, limit = parse_batch_item(item, default_limit)
+            except ValueError as e:
+                responses[position] = {
+                    'success': False,
+                    'query': item.get('query') if isinstance(item, dict) else item,
+                    'message': str(e),
+                    'results': []
+                }
+                continue
+            cache_key = (search_engine.normalize_query(query), limit, None, None)
+            page = search_cache.get(cache_key, generation)
+            cache_requests.labels('hit' if page is not None else 'miss').inc()
+            if page is None:
+                pending.setdefault(cache_key, (query, limit, []))[2].append(position)
+            responses[position] = {
+                'success': True,
+                'query': query,
+                'total_results': 0 if page is None else len(page[0]),
+                'results': None if page is None else page[0],
+                'next_cursor': None if page is None else page_cursor(generation, cache_key[0], None, page[1])
+            }
+        timer.mark('cache')
+        
+        # Chấm điểm tất cả query còn thiếu trong một lượt trên index
+        if pending:
+            batch_results = search_engine.search_batch([(query, limit) for query, limit, _ in pending.values()],
+                                                       summary=True, timer=timer, pages=True)
+            for (cache_key, (_, _, positions)), (results, next_after) in zip(pending.items(), batch_results):
+                formatted_results = format_results(results)
+                search_cache.put(cache_key, (formatted_results, next_after), generation)
+                next_cursor = page_cursor(generation, cache_key[0], None, next_after)
+                for position in positions:
+                    responses[position]['total_results'] = len(formatted_results)
+                    responses[position]['results'] = formatted_results
+                    responses[position]['next_cursor'] = next_cursor
+            timer.mark('format')
+        
+        response = json_response({
+            'success': True,
+            'total_queries': len(responses),
+            'failed_queries': sum(1 for response in responses if not response['success']),
+            'results': responses
         })
+        timer.mark('serialize')
+        observe_request('search_batch', batch_summary([query for query, _, _ in pending.values()]), timer,
+                        total_queries=len(responses), scored_queries=len(pending))
+        return response
     
     except Exception as e:
         return jsonify({
@@ -86,9 +448,56 @@ def search_news():
             'results': []
         }), 500
 
+@search_bp.route('/suggest', methods=['GET'])
+def suggest_queries():
+    """API endpoint gợi ý hoàn thành query đang gõ (gọi theo từng phím gõ)
+
+    GET ?q=<phần đã gõ>&limit=<1..10>: các từ và cụm từ trong title bắt đầu bằng
+    phần đã gõ, xếp theo số document chứa chúng
+    """
+    try:
+        global search_engine
+        if search_engine is None:
+            return jsonify({
+                'success': False,
+                'message': 'Search engine chưa được khởi tạo',
+                'suggestions': []
+            }), 500
+        
+        timer = StageTimer()
+        query = request.args.get('q', '')
+        try:
+            limit = int(request.args.get('limit', SUGGEST_TOP_K))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'limit phải là số nguyên',
+                'suggestions': []
+            }), 400
+        limit = min(max(limit, 1), SUGGEST_TOP_K)
+        timer.mark('parse')
+        
+        suggestions = search_engine.suggest(query, limit)
+        timer.mark('suggest')
+        response = json_response({
+            'success': True,
+            'query': query,
+            'suggestions': [{'text': text, 'documents': documents} for text, documents in suggestions]
+        })
+        timer.mark('serialize')
+        observe_request('suggest', query, timer, limit=limit)
+        return response
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}',
+            'suggestions': []
+        }), 500
+
 @search_bp.route('/stats', methods=['GET'])
 def get_stats():
-    """API endpoint lấy thống kê search engine"""
+    """API endpoint lấy thống kê search engine (thống kê của index được tính một lần cho mỗi generation)"""
     try:
         global search_engine
         if search_engine is None:
@@ -99,7 +508,8 @@ def get_stats():
             }), 500
         
         stats = search_engine.get_stats()
-        return jsonify({
+        stats['cache'] = search_cache.stats()
+        return json_response({
             'success': True,
             'stats': stats
         })
@@ -110,6 +520,118 @@ def get_stats():
             'message': f'Lỗi server: {str(e)}'
         }), 500
 
+@search_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """API endpoint xuất metrics theo định dạng text của Prometheus"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@search_bp.route('/metrics/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """API endpoint lấy các query chậm gần nhất (mới nhất đứng đầu)"""
+    return jsonify({
+        'success': True,
+        'threshold_ms': slow_query_log.threshold_ms,
+        'total': slow_query_log.total,
+        'queries': slow_query_log.entries()
+    })
+
+@search_bp.route('/documents', methods=['POST'])
+def upsert_documents():
+    """API endpoint thêm mới/cập nhật bài báo theo 'id' (tìm kiếm được ngay, không build lại index)
+
+    Body: một bài báo, danh sách bài báo hoặc {"documents": [...]}
+    """
+    try:
+        global search_engine
+        if search_engine is None:
+            return jsonify({
+                'success': False,
+                'message': 'Search engine chưa được khởi tạo'
+            }), 500
+        
+        if index_read_only:
+            return jsonify({
+                'success': False,
+                'message': 'Index chỉ đọc khi chạy nhiều worker, hãy cập nhật dữ liệu rồi khởi động lại server'
+            }), 409
+        
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            documents = data.get('documents', [data])
+        else:
+            documents = data
+        if not isinstance(documents, list) or not documents:
+            return jsonify({
+                'success': False,
+                'message': 'Cần gửi ít nhất một bài báo'
+            }), 400
+        
+        try:
+            upserted = search_engine.upsert_documents(documents)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'upserted': upserted,
+            'generation': search_engine.generation
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}'
+        }), 500
+
+@search_bp.route('/documents', methods=['DELETE'])
+def delete_documents():
+    """API endpoint xóa bài báo theo 'id'
+
+    Body {"ids": [...]} hoặc query string ?id=...&id=...
+    """
+    try:
+        global search_engine
+        if search_engine is None:
+            return jsonify({
+                'success': False,
+                'message': 'Search engine chưa được khởi tạo'
+            }), 500
+        
+        if index_read_only:
+            return jsonify({
+                'success': False,
+                'message': 'Index chỉ đọc khi chạy nhiều worker, hãy cập nhật dữ liệu rồi khởi động lại server'
+            }), 409
+        
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and 'ids' in data:
+            ids = data['ids']
+        else:
+            # id trong query string là chuỗi, thử chuyển về số để khớp với id trong dữ liệu
+            ids = [int(doc_id) if doc_id.isdigit() else doc_id for doc_id in request.args.getlist('id')]
+        if not isinstance(ids, list) or not ids:
+            return jsonify({
+                'success': False,
+                'message': 'Cần chỉ định ít nhất một id'
+            }), 400
+        
+        deleted = search_engine.delete_documents(ids)
+        return jsonify({
+            'success': True,
+            'deleted': deleted,
+            'not_found': [doc_id for doc_id in ids if doc_id not in deleted],
+            'generation': search_engine.generation
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Lỗi server: {str(e)}'
+        }), 500
+
 @search_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
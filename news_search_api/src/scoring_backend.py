@@ -0,0 +1,145 @@
+"""
+Backend chấm điểm cho SimpleTFIDFSearchEngine
+
+- 'python': chấm điểm term-at-a-time bằng vòng lặp Python với cắt tỉa MaxScore
+  (cài đặt trong simple_tfidf.py, không cần thư viện ngoài)
+- 'numpy': mỗi segment được xem như ma trận CSR (hàng = term, cột = document,
+  trọng số float32), điểm của query là một phép nhân ma trận thưa với vector
+  query (gom postings của mọi term trong query rồi cộng bằng bincount), top-k
+  được chọn bằng argpartition
+- 'auto': 'numpy' nếu đã cài NumPy, ngược lại 'python'
+
+Điểm của backend numpy khác backend python ở độ chính xác float32, nên thứ hạng chỉ
+có thể khác ở các document có điểm chênh nhau dưới mức sai số đó.
+"""
+
+import threading
+import weakref
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # NumPy là tùy chọn
+    np = None
+
+SCORING_BACKENDS = ('auto', 'python', 'numpy')
+
+
+class SegmentMatrix:
+    """Ma trận CSR của một segment: hàng term_id chứa tf (float32) của các document có term đó"""
+
+    def __init__(self, segment):
+        term_ids, offsets, docs, tfs = segment.postings.raw_arrays()
+        self.term_ids = term_ids
+        # indptr / indices là view trên các mảng của PackedPostings (array hoặc memory-map
+        # của snapshot), không chép; chỉ trọng số được chuyển sang float32
+        self.indptr = np.frombuffer(offsets, dtype=np.uint64)
+        self.indices = np.frombuffer(docs, dtype=np.uint32)
+        self.data = np.frombuffer(tfs, dtype=np.float64).astype(np.float32)
+        self.num_terms = len(self.indptr) - 1
+
+        norms = np.asarray(segment.doc_norms, dtype=np.float64)
+        inv_norms = np.zeros(len(norms), dtype=np.float64)
+        np.divide(1.0, norms, out=inv_norms, where=norms > 0)
+        self.inv_norms = inv_norms.astype(np.float32)
+
+    def scores(self, query_factors: Dict[str, float], query_norm: float, allowed=None):
+        """Cosine similarity của mọi document trong segment với query
+
+        allowed (AllowedDocs): chỉ cộng điểm cho các document thỏa mãn bộ lọc, document khác có điểm 0
+        """
+        rows, factors = [], []
+        for word, factor in query_factors.items():
+            term_id = self.term_ids.get(word)
+            if term_id is not None and term_id < self.num_terms:
+                rows.append(term_id)
+                factors.append(factor)
+        num_docs = len(self.inv_norms)
+        if not rows:
+            return np.zeros(num_docs, dtype=np.float32)
+        rows = np.array(rows, dtype=np.int64)
+        starts = self.indptr[rows].astype(np.int64)
+        lengths = self.indptr[rows + 1].astype(np.int64) - starts
+        # Vị trí của mọi posting của các hàng được chọn, nối theo thứ tự hàng
+        row_ends = np.cumsum(lengths)
+        positions = np.arange(row_ends[-1], dtype=np.int64) + np.repeat(starts - (row_ends - lengths), lengths)
+        row_docs = self.indices[positions]
+        weights = self.data[positions] * np.repeat(np.array(factors, dtype=np.float32), lengths)
+        if allowed is not None:
+            # Bitmap mỗi document một byte 0/1 của AllowedDocs, dùng trực tiếp làm mảng bool
+            keep = np.frombuffer(allowed.mask, dtype=np.bool_)[row_docs]
+            row_docs, weights = row_docs[keep], weights[keep]
+        scores = np.bincount(row_docs, weights=weights, minlength=num_docs).astype(np.float32)
+        scores *= self.inv_norms
+        scores *= np.float32(1.0 / query_norm)
+        return scores
+
+
+class NumpyScoringBackend:
+    """Chấm điểm segment bằng ma trận CSR float32, ma trận được tạo khi segment được truy vấn lần đầu"""
+
+    name = 'numpy'
+
+    def __init__(self):
+        self._matrices = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def matrix(self, segment) -> SegmentMatrix:
+        with self._lock:
+            matrix = self._matrices.get(segment)
+            if matrix is None:
+                matrix = SegmentMatrix(segment)
+                self._matrices[segment] = matrix
+            return matrix
+
+    def score_segment(self, segment, query_factors: Dict[str, float], query_norm: float,
+                      top_k: int, top_hits: List, offset: int, push_hit, allowed=None, after=None):
+        """Đưa top_k document của segment (trong số document thỏa mãn allowed và xếp sau
+        mốc after = (score, vị trí toàn cục) nếu có) vào heap top_hits qua push_hit(hit)"""
+        scores = self.matrix(segment).scores(query_factors, query_norm, allowed)
+        if segment.deleted:
+            scores[list(segment.deleted)] = 0
+        if after is not None:
+            after_score, after_position = after
+            scores[scores > after_score] = 0
+            tied = np.flatnonzero(scores == after_score)
+            scores[tied[tied <= after_position - offset]] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) == 0:
+            return
+        candidate_scores = scores[candidates]
+        if len(candidates) > top_k:
+            top = np.argpartition(candidate_scores, -top_k)[-top_k:]
+            # Giữ mọi document bằng điểm thứ top_k để tie-break theo thứ tự document như backend python
+            kth_score = candidate_scores[top].min()
+            keep = candidate_scores >= kth_score
+            candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+        order = np.lexsort((candidates, -candidate_scores))[:top_k]
+        for doc_idx, score in zip(candidates[order].tolist(), candidate_scores[order].tolist()):
+            push_hit((score, -(offset + doc_idx), segment, doc_idx))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            matrices = list(self._matrices.values())
+        # indptr / indices dùng chung bộ nhớ với postings, chỉ tính các mảng được chép
+        return {
+            'matrices': len(matrices),
+            'memory_bytes': sum(m.data.nbytes + m.inv_norms.nbytes for m in matrices),
+        }
+
+
+def create_scoring_backend(name: str = 'auto') -> Optional[NumpyScoringBackend]:
+    """Tạo backend chấm điểm theo tên, None nghĩa là backend python
+
+    Raises:
+        ValueError: nếu tên backend không hợp lệ
+    """
+    if name not in SCORING_BACKENDS:
+        raise ValueError(f"Backend chấm điểm không hợp lệ: {name!r} (chọn một trong {', '.join(SCORING_BACKENDS)})")
+    if name == 'python':
+        return None
+    if np is None:
+        if name == 'numpy':
+            print("Chưa cài NumPy, dùng backend chấm điểm python")
+        return None
+    return NumpyScoringBackend()
@@ -0,0 +1,115 @@
+"""
+Cache kết quả tìm kiếm với LRU + TTL, tự xóa khi index thay đổi
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def estimate_size(value: Any) -> int:
+    """Ước lượng số byte của một giá trị JSON-like (dict/list/str/số)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class SearchCache:
+    """Cache có giới hạn số phần tử, hết hạn theo TTL và gắn với generation của index
+
+    Mọi phần tử thuộc về một generation: khi get/put với generation mới hơn,
+    toàn bộ cache bị xóa vì kết quả cũ không còn đúng với index mới. get/put với
+    generation cũ hơn (request bắt đầu trước khi index thay đổi) bị bỏ qua.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_generation(self, generation: int) -> bool:
+        """Chuyển sang generation mới hơn; False nếu generation đã cũ"""
+        if self._generation is not None and generation < self._generation:
+            return False
+        if generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+        return True
+
+    def get(self, key: Hashable, generation: int) -> Optional[Any]:
+        """Lấy giá trị đã cache, None nếu không có hoặc đã hết hạn"""
+        with self._lock:
+            entry = self._entries.get(key) if self._check_generation(generation) else None
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: int):
+        """Lưu giá trị, loại phần tử ít được dùng nhất khi vượt max_entries
+
+        Giá trị tính với generation cũ hơn generation hiện tại không được lưu.
+        """
+        if self.max_entries <= 0:
+            return
+        size = estimate_size(value)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if not self._check_generation(generation):
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """Xóa mọi phần tử và quên generation (dùng khi thay search engine)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = None
+
+    def stats(self) -> Dict:
+        """Thống kê cache cho /api/stats"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'memory_bytes': self._bytes,
+                'generation': self._generation,
+            }
@@ -0,0 +1,231 @@
+"""
+Chạy API ở chế độ production với nhiều worker process dùng chung một index
+
+Process chính nạp index một lần (nếu cần build thì build trong một process con
+và lưu snapshot), mở socket lắng nghe rồi fork các worker; mọi worker accept trên
+cùng socket và dùng chung bộ nhớ của index:
+- index được phục vụ từ snapshot memory-map (page cache dùng chung giữa các process)
+  và các mảng phẳng (array / NumPy), không có object Python cho từng posting
+- gc.freeze() trước khi fork chuyển mọi object đã tạo sang thế hệ permanent, GC
+  của worker không duyệt (và không ghi vào header của) các object này nên các
+  trang bộ nhớ không bị copy-on-write
+Worker chết bất thường được fork lại; SIGTERM / SIGINT dừng toàn bộ.
+
+Với index chia shard (SEARCH_SHARDS > 1), mỗi worker khởi động các process shard
+của riêng mình từ snapshot của shard sau khi fork (ShardedSearchEngine.reopen), nên
+các worker không dùng chung (và không phải chờ nhau trên) một kết nối tới mỗi shard;
+snapshot được memory-map nên shard của mọi worker dùng chung page cache.
+
+Metrics (/api/metrics) và slow-query log (/api/metrics/slow-queries) được cộng trên
+mọi worker: mỗi worker ghi số liệu vào file riêng trong thư mục SEARCH_METRICS_DIR
+(mặc định thư mục tạm, xóa khi dừng), worker nhận request scrape đọc file của tất cả
+(xem src/metrics.py). Cache kết quả tìm kiếm là riêng của từng worker (thống kê cache
+trong /api/stats là của worker trả lời request).
+
+    python src/serve.py --workers 4 --port 5000
+"""
+
+import argparse
+import gc
+import glob
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Tuple
+
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+
+def build_snapshot():
+    """Build index và lưu snapshot trong một process con nếu snapshot thiếu hoặc cũ
+
+    Bộ nhớ tạm của build_index được giải phóng cùng process con, process chính chỉ
+    nạp snapshot (memory-map) nên không giữ heap phân mảnh sau khi build.
+    """
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            from src.routes.search import init_search_engine
+            init_search_engine()
+        except BaseException as e:
+            print(f"Lỗi khi build index: {e}")
+            status = 1
+        finally:
+            os._exit(status)
+    os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+    build_snapshot()
+
+# Không chạy GC trong lúc nạp index: object được giữ nguyên vị trí cho tới gc.freeze()
+gc.disable()
+
+from werkzeug.serving import make_server
+from src.main import app
+from src.models.user import db
+from src.metrics import METRICS_FILE_PATTERN, SLOW_LOG_FILE_PATTERN
+from src.routes import search as search_routes
+from src.sharded_search import ShardedSearchEngine
+
+# Worker chết trong khoảng này sau khi fork được coi là lỗi khởi động, chờ trước khi fork lại
+RESPAWN_DELAY = 1.0
+
+
+def create_listener(host: str, port: int, backlog: int) -> socket.socket:
+    """Socket lắng nghe dùng chung cho mọi worker"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    listener.set_inheritable(True)
+    return listener
+
+
+def metrics_directory() -> Tuple[str, bool]:
+    """(thư mục chứa file metrics của các worker, True nếu là thư mục tạm cần xóa khi dừng)
+
+    Thư mục SEARCH_METRICS_DIR được dọn file của lần chạy trước để counter bắt đầu từ 0.
+    """
+    directory = os.environ.get('SEARCH_METRICS_DIR')
+    if not directory:
+        return tempfile.mkdtemp(prefix='search-metrics-'), True
+    os.makedirs(directory, exist_ok=True)
+    for pattern in (METRICS_FILE_PATTERN, SLOW_LOG_FILE_PATTERN):
+        for path in glob.glob(os.path.join(directory, pattern.format('*'))):
+            os.remove(path)
+    return directory, False
+
+
+def share_metrics(directory: str, reset: bool):
+    """Ghi metrics và slow-query log của process hiện tại vào directory (xem src/metrics.py)"""
+    search_routes.metrics.share(directory, reset)
+    search_routes.slow_query_log.share(directory, reset)
+
+
+def prepare_index(workers: int, metrics_dir: str):
+    """Chuẩn bị index trong process chính trước khi fork"""
+    search_engine = search_routes.search_engine
+    if isinstance(search_engine, ShardedSearchEngine):
+        # Mỗi worker mở shard riêng sau khi fork (run_worker), shard của process chính không dùng tới
+        search_engine.close()
+    elif search_engine is not None:
+        search_engine.warm_up()
+    if workers > 1:
+        search_routes.index_read_only = True
+    # Thời gian nạp / build index đã ghi ở process chính được tính một lần trong file của nó
+    share_metrics(metrics_dir, reset=False)
+    gc.collect()
+    gc.freeze()
+
+
+def run_worker(listener: socket.socket, host: str, port: int, threaded: bool, metrics_dir: str):
+    """Vòng lặp phục vụ request của một worker (chạy trong process con)"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+    share_metrics(metrics_dir, reset=True)
+    search_engine = search_routes.search_engine
+    if isinstance(search_engine, ShardedSearchEngine):
+        if not search_engine.reopen():
+            raise RuntimeError("Không mở được các shard của index")
+        search_engine.warm_up()
+    # Kết nối database mở trong process chính không được dùng chung giữa các process
+    with app.app_context():
+        db.engine.dispose()
+    server = make_server(host, port, app, threaded=threaded, fd=listener.fileno())
+    server.serve_forever()
+
+
+class Master:
+    """Fork và giám sát các worker"""
+
+    def __init__(self, listener: socket.socket, host: str, port: int, workers: int, threaded: bool,
+                 metrics_dir: str):
+        self.listener = listener
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threaded = threaded
+        self.metrics_dir = metrics_dir
+        # pid -> thời điểm fork
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                run_worker(self.listener, self.host, self.port, self.threaded, self.metrics_dir)
+            except KeyboardInterrupt:
+                pass
+            except BaseException as e:
+                print(f"Worker {os.getpid()} lỗi: {e}")
+                status = 1
+            finally:
+                os._exit(status)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        print(f"Đang phục vụ tại http://{self.host}:{self.port} với {self.workers} worker "
+              f"(pid {', '.join(str(pid) for pid in self.children)})")
+        gc.enable()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            print(f"Worker {pid} đã dừng (mã {os.waitstatus_to_exitcode(status)}), khởi động lại")
+            if time.monotonic() - started < RESPAWN_DELAY:
+                time.sleep(RESPAWN_DELAY)
+            self.spawn()
+        self.listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SEARCH_WORKERS', os.cpu_count() or 1)),
+                        help='Số worker process (mặc định: số CPU)')
+    parser.add_argument('--threads', action='store_true',
+                        help='Mỗi worker xử lý request bằng nhiều thread (mặc định mỗi lúc một request)')
+    parser.add_argument('--backlog', type=int, default=1024)
+    args = parser.parse_args()
+
+    listener = create_listener(args.host, args.port, args.backlog)
+    metrics_dir, temporary = metrics_directory()
+    try:
+        prepare_index(args.workers, metrics_dir)
+        Master(listener, args.host, args.port, max(args.workers, 1), args.threads, metrics_dir).run()
+    finally:
+        if temporary:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
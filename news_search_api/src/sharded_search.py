@@ -0,0 +1,628 @@
+"""
+Index chia shard, mỗi shard là một SimpleTFIDFSearchEngine chạy trong process riêng
+
+Corpus được chia thành các khoảng document liên tiếp, mỗi khoảng là một shard.
+Query được tiền xử lý một lần ở process chính (query_factors theo IDF của toàn
+corpus), gửi tới mọi shard cùng lúc, mỗi shard trả về top_k của mình và process
+chính gộp lại thành top_k toàn cục. Latency của một query phụ thuộc kích thước
+shard thay vì kích thước corpus.
+
+Điểm giống hệt engine không chia shard:
+- IDF được tính từ document frequency của toàn corpus (các shard gửi document
+  frequency của mình về process chính khi build)
+- cận trên điểm của term (quyết định thứ tự cộng điểm) là max trên mọi shard,
+  bằng đúng cận trên của index không chia shard
+- vị trí document là vị trí trong corpus (không tính bản sao đã gộp), dùng để
+  tie-break như engine gốc
+- bài gần trùng lặp được gom cụm một lần trên toàn corpus ở process chính, mỗi
+  shard nhận danh sách bản sao cần bỏ qua và bản sao của các bản chính của mình
+
+Gợi ý theo tiền tố được trả lời ở process chính từ index gợi ý gộp (cộng trọng
+số) của các shard, lấy về khi build hoặc nạp snapshot.
+"""
+
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from src.basic_text_processor import BasicVietnameseTextProcessor
+from src.corpus_reader import iter_documents
+from src.field_scoring import FieldScoring
+from src.filter_index import SearchFilter
+from src.index_segment import TermDictionary, TermValues
+from src.metrics import StageTimer
+from src.phrase_query import PositionalQuery, parse_query
+from src.scoring_backend import create_scoring_backend
+from src.near_duplicates import DuplicateClusters
+from src.simple_tfidf import SimpleTFIDFSearchEngine, find_duplicates
+from src.suggest_index import MIN_SUGGEST_DF, SUGGEST_TOP_K, SuggestIndex, normalize_prefix
+
+
+class ShardError(RuntimeError):
+    """Lỗi xảy ra trong process của shard"""
+
+
+def shard_index_path(index_path: str, shard_id: int, num_shards: int) -> str:
+    """File snapshot của một shard, ví dụ news.idx -> news.shard0-of-4.idx"""
+    base, ext = os.path.splitext(index_path)
+    return f"{base}.shard{shard_id}-of-{num_shards}{ext}"
+
+
+class ShardWorker:
+    """Phần chạy trong process của shard: giữ một SimpleTFIDFSearchEngine và trả lời lệnh của process chính"""
+
+    def __init__(self, conn, scoring_backend: str, positions: bool, field_scoring: FieldScoring):
+        self.conn = conn
+        # Bản sao được tìm ở process chính (build nhận DuplicateClusters của shard)
+        self.engine = SimpleTFIDFSearchEngine(scoring_backend=scoring_backend, suggest_min_df=1, positions=positions,
+                                              field_scoring=field_scoring, duplicate_threshold=None)
+
+    def _exchange_stats(self, doc_freq: Counter, num_docs: int,
+                        field_totals: Tuple[int, int]) -> Tuple[Mapping[str, int], int, Tuple[int, int]]:
+        """Gửi document frequency và tổng độ dài title / content của shard, nhận lại số liệu của toàn corpus"""
+        self.conn.send(('ok', (dict(doc_freq), num_docs, field_totals)))
+        return self.conn.recv()
+
+    def build(self, source_path: str, start: int, stop: int, workers: int,
+              duplicates: Optional[DuplicateClusters]) -> Dict[str, float]:
+        """Build index cho documents [start, stop) của corpus, trả về cận trên điểm của từng term"""
+        self.engine.load_data(source_path, start, stop)
+        self.engine.build_index(workers=workers, global_stats=self._exchange_stats, duplicates=duplicates)
+        if not self.engine.segments:
+            raise ShardError('Không build được index của shard')
+        return dict(self.engine.segments[0].term_bounds.items())
+
+    def set_term_bounds(self, term_bounds: Mapping[str, float]):
+        """Dùng cận trên điểm của toàn corpus để term được duyệt theo cùng thứ tự như index không chia shard"""
+        segment = self.engine.segments[0]
+        term_ids = segment.postings.term_ids
+        segment.term_bounds = TermValues(term_ids, array('d', (term_bounds[word] for word in segment.postings)))
+
+    def set_field_scoring(self, field_scoring: FieldScoring) -> Dict[str, float]:
+        """Tính lại trọng số theo field_scoring, trả về cận trên điểm mới của từng term"""
+        self.engine.set_field_scoring(field_scoring)
+        return dict(self.engine.segments[0].term_bounds.items())
+
+    def load(self, index_path: str,
+             source_path: Optional[str]) -> Optional[Tuple[int, Dict[str, float], Dict[str, float]]]:
+        """Nạp snapshot của shard, trả về (số documents, IDF, cận trên điểm của các term trong shard) hoặc None
+
+        Cận trên điểm được tính lại trong shard nếu snapshot được lưu với FieldScoring khác.
+        """
+        if not self.engine.load_index(index_path, source_path=source_path):
+            return None
+        return (len(self.engine.documents), dict(self.engine.idf_scores.items()),
+                dict(self.engine.segments[0].term_bounds.items()))
+
+    def save(self, index_path: str):
+        self.engine.save_index(index_path)
+
+    def warm_up(self):
+        self.engine.warm_up()
+
+    def search(self, query_factors: Dict[str, float], query_norm: float, top_k: int,
+               exhaustive: bool, summary: bool, offset: int, filters: Optional[SearchFilter],
+               after: Optional[Tuple[float, int]], phrases: Optional[PositionalQuery]) -> List[Tuple[float, int, Dict]]:
+        return self.engine.score_query(query_factors, query_norm, top_k, exhaustive, summary, offset, filters, after,
+                                       phrases)
+
+    def search_batch(self, plans: Sequence[Tuple], summary: bool,
+                     offset: int) -> List[List[Tuple[float, int, Dict]]]:
+        return self.engine.score_queries(plans, summary, offset)
+
+    def suggest_entries(self) -> Dict[str, int]:
+        """Các key của index gợi ý của shard kèm trọng số (số document trong shard)"""
+        return dict(self.engine.suggestions.items())
+
+    def stats(self) -> Dict:
+        return {
+            'documents': sum(segment.live_count for segment in self.engine.segments),
+            'vocabulary_size': len(self.engine.vocabulary),
+            'duplicates': self.engine.duplicate_stats(),
+            'memory_bytes': self.engine.memory_usage()['total'],
+        }
+
+
+def _shard_main(conn, inherited, scoring_backend: str, positions: bool, field_scoring: FieldScoring):
+    """Vòng lặp của process shard: nhận (lệnh, tham số), gửi lại ('ok', kết quả) hoặc ('error', thông báo)"""
+    # Đóng các đầu kết nối phía process chính được kế thừa khi fork (của shard này và các shard
+    # khác), để shard nhận EOF khi process chính dừng kể cả khi thoát bằng os._exit
+    for other in inherited:
+        other.close()
+    worker = ShardWorker(conn, scoring_backend, positions, field_scoring)
+    while True:
+        try:
+            method, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        if method == 'close':
+            break
+        try:
+            result = getattr(worker, method)(*args)
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+        else:
+            conn.send(('ok', result))
+
+
+class ShardClient:
+    """Kết nối tới một process shard; lock đảm bảo mỗi lúc chỉ một lệnh đang chờ trả lời
+
+    Kết nối chỉ dùng trong process đã tạo shard: worker của src/serve.py mở shard riêng
+    (ShardedSearchEngine.reopen) thay vì dùng chung một pipe với các worker khác.
+    """
+
+    def __init__(self, context, shard_id: int, inherited: List, scoring_backend: str, positions: bool,
+                 field_scoring: FieldScoring):
+        self.shard_id = shard_id
+        self.conn, child_conn = context.Pipe()
+        self.lock = threading.Lock()
+        self.process = context.Process(target=_shard_main,
+                                       args=(child_conn, inherited + [self.conn], scoring_backend, positions,
+                                             field_scoring),
+                                       name=f'search-shard-{shard_id}', daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def send(self, method: str, *args):
+        self.conn.send((method, args))
+
+    def result(self):
+        status, value = self.conn.recv()
+        if status != 'ok':
+            raise ShardError(f"Shard {self.shard_id}: {value}")
+        return value
+
+    def call(self, method: str, *args):
+        with self.lock:
+            self.send(method, *args)
+            return self.result()
+
+    def close(self):
+        try:
+            with self.lock:
+                self.send('close')
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+    def detach(self):
+        """Đóng đầu kết nối được kế thừa khi fork mà không dừng shard (shard thuộc process cha)"""
+        self.conn.close()
+
+
+class ShardedSearchEngine:
+    """Search engine chia corpus thành num_shards shard, mỗi shard chạy trong một process
+
+    Giao diện tìm kiếm giống SimpleTFIDFSearchEngine (search, search_batch, load_data,
+    build_index, save_index, load_index, get_stats); index chỉ đọc (không hỗ trợ
+    upsert/delete documents).
+    """
+
+    def __init__(self, num_shards: int, scoring_backend: str = 'python', positions: bool = True,
+                 field_scoring: Optional[FieldScoring] = None,
+                 duplicate_threshold: Optional[float] = None):
+        if num_shards < 1:
+            raise ValueError("Số shard phải >= 1")
+        self.num_shards = num_shards
+        # Các shard lưu vị trí của từ cho truy vấn cụm từ / NEAR (xem SimpleTFIDFSearchEngine)
+        self.positions = positions
+        # Mô hình chấm điểm của các shard, query_factors được tính theo mô hình này ở process chính
+        self.field_scoring = field_scoring or FieldScoring()
+        # Ngưỡng gộp bài gần trùng lặp khi build (xem SimpleTFIDFSearchEngine)
+        self.duplicate_threshold = duplicate_threshold
+        self.text_processor = BasicVietnameseTextProcessor()
+        self.idf_scores = TermDictionary.from_scores({})
+        self.suggestions = SuggestIndex.build({})
+        self.generation = 0
+        self.build_timings = {}
+        # (generation, thống kê) của get_stats(), chỉ hỏi lại các shard khi index đổi generation
+        self._stats = None
+        self.source_path = None
+        # Snapshot đã nạp, dùng để mở lại shard trong worker sau khi fork (reopen)
+        self._index_path = None
+        # Backend được kiểm tra ở process chính, các shard dùng tên backend đã chọn
+        self._scoring_backend_name = 'python' if create_scoring_backend(scoring_backend) is None else 'numpy'
+        self._context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods()
+                                                    else 'spawn')
+        self._shards: List[ShardClient] = []
+        # Vị trí trong corpus (không tính bản sao đã gộp) của document đầu tiên của từng shard
+        self._offsets: List[int] = []
+        self._num_documents = 0
+        self._lock = threading.Lock()
+
+    def _start_shards(self, num_shards: int):
+        self.close()
+        inherited = []
+        for shard_id in range(num_shards):
+            shard = ShardClient(self._context, shard_id, list(inherited), self._scoring_backend_name, self.positions,
+                                self.field_scoring)
+            inherited.append(shard.conn)
+            self._shards.append(shard)
+
+    def _scatter(self, method: str, args_per_shard: Sequence[Tuple]) -> List:
+        """Gửi lệnh tới mọi shard rồi chờ kết quả, các shard xử lý song song"""
+        shards = self._shards
+        acquired = []
+        try:
+            for shard, args in zip(shards, args_per_shard):
+                shard.lock.acquire()
+                acquired.append(shard)
+                shard.send(method, *args)
+            return [shard.result() for shard in shards]
+        finally:
+            for shard in acquired:
+                shard.lock.release()
+
+    def _set_global_term_bounds(self, shard_bounds: Sequence[Mapping[str, float]]):
+        """Đặt cận trên điểm của mỗi term trong mọi shard bằng max trên các shard"""
+        term_bounds = {}
+        for bounds in shard_bounds:
+            for word, bound in bounds.items():
+                if bound > term_bounds.get(word, -1.0):
+                    term_bounds[word] = bound
+        self._scatter('set_term_bounds', [({word: term_bounds[word] for word in bounds},)
+                                          for bounds in shard_bounds])
+
+    def _gather_suggestions(self) -> SuggestIndex:
+        """Index gợi ý của toàn corpus: trọng số của mỗi key là tổng trọng số trên các shard"""
+        entries = Counter()
+        for shard_entries in self._scatter('suggest_entries', [()] * len(self._shards)):
+            entries.update(shard_entries)
+        return SuggestIndex.build({key: weight for key, weight in entries.items() if weight >= MIN_SUGGEST_DF})
+
+    def close(self):
+        """Dừng các process shard"""
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
+
+    def load_data(self, json_file_path: str):
+        """Chọn file dữ liệu, build_index() chia documents của file cho các shard"""
+        if not os.path.isfile(json_file_path):
+            print(f"Lỗi khi tải dữ liệu: không tìm thấy file {json_file_path}")
+            self.source_path = None
+            return
+        self.source_path = json_file_path
+        print(f"Sẽ đọc dữ liệu theo luồng từ {json_file_path}")
+
+    def build_index(self, workers: Optional[int] = None):
+        """Build index của mọi shard song song, IDF và cận trên điểm tính trên toàn corpus
+
+        Nếu duplicate_threshold > 0, process chính gom cụm bài gần trùng lặp trên toàn
+        corpus (đọc corpus thêm một lần để lấy thông tin bản sao nếu có) trước khi chia shard.
+
+        Args:
+            workers: Tổng số process tiền xử lý văn bản, chia đều cho các shard (mặc định: số CPU)
+        """
+        if not self.source_path:
+            print("Không có dữ liệu để xây dựng index")
+            return
+        self.build_timings = {}
+        timer = StageTimer()
+        duplicates = None
+        try:
+            if self.duplicate_threshold:
+                print("Đang tìm bài gần trùng lặp...")
+                duplicates = find_duplicates(iter_documents(self.source_path), self.duplicate_threshold, workers)
+                total = duplicates.num_documents
+                if duplicates:
+                    # Ghi lại thông tin bản sao dưới bản chính, kể cả khi hai bài thuộc hai shard khác nhau
+                    for _ in duplicates.split(iter_documents(self.source_path)):
+                        pass
+                print(f"Tìm thấy {len(duplicates)} bản sao")
+                timer.mark('duplicates')
+            else:
+                total = sum(1 for _ in iter_documents(self.source_path))
+                timer.mark('count')
+        except (OSError, ValueError) as e:
+            print(f"Lỗi khi tải dữ liệu: {e}")
+            return
+        if total == 0:
+            print("Không có dữ liệu để xây dựng index")
+            return
+
+        # Chia đều số documents được index (bản sao không tính) cho các shard,
+        # offsets là vị trí trong file nguồn của document đầu tiên của từng shard
+        skipped = sorted(duplicates.canonical_of) if duplicates else []
+        kept = total - len(skipped)
+        num_shards = min(self.num_shards, kept)
+        offsets = []
+        num_skipped = 0
+        for shard_id in range(num_shards):
+            # Document được index thứ k nằm ở vị trí k + số bản sao đứng trước nó
+            position = shard_id * kept // num_shards
+            while num_skipped < len(skipped) and skipped[num_skipped] <= position + num_skipped:
+                num_skipped += 1
+            offsets.append(position + num_skipped)
+        offsets.append(total)
+        shard_workers = max((workers or os.cpu_count() or 1) // num_shards, 1)
+        print(f"Đang xây dựng index {kept} documents trên {num_shards} shard...")
+        self._start_shards(num_shards)
+
+        with self._lock:
+            for shard in self._shards:
+                shard.lock.acquire()
+            try:
+                for shard, start, stop in zip(self._shards, offsets, offsets[1:]):
+                    shard.send('build', self.source_path, start, stop, shard_workers,
+                               duplicates.subset(start, stop) if duplicates else None)
+                # Document frequency và độ dài các trường của từng shard -> số liệu toàn corpus
+                shard_stats = [shard.result() for shard in self._shards]
+                doc_freq = Counter()
+                for shard_doc_freq, _, _ in shard_stats:
+                    doc_freq.update(shard_doc_freq)
+                total_docs = sum(num_docs for _, num_docs, _ in shard_stats)
+                field_totals = tuple(sum(totals[field] for _, _, totals in shard_stats) for field in range(2))
+                for shard, (shard_doc_freq, _, _) in zip(self._shards, shard_stats):
+                    shard.conn.send(({word: doc_freq[word] for word in shard_doc_freq}, total_docs, field_totals))
+                shard_bounds = [shard.result() for shard in self._shards]
+            except ShardError as e:
+                print(f"Lỗi khi xây dựng index: {e}")
+                shard_bounds = None
+            finally:
+                for shard in self._shards:
+                    shard.lock.release()
+            if shard_bounds is None:
+                self.close()
+                return
+            timer.mark('shards')
+
+            self._set_global_term_bounds(shard_bounds)
+            timer.mark('term_bounds')
+
+            self.idf_scores = TermDictionary.from_scores({
+                word: math.log(total_docs / df) if df > 0 else 0
+                for word, df in doc_freq.items()
+            })
+            timer.mark('idf')
+            self.suggestions = self._gather_suggestions()
+            self._offsets = list(itertools.accumulate((num_docs for _, num_docs, _ in shard_stats[:-1]), initial=0))
+            self._num_documents = total_docs
+            self.generation += 1
+            timer.mark('suggest')
+        self.build_timings = dict(timer.stages)
+        print(f"Hoàn thành xây dựng index! Vocabulary size: {len(self.idf_scores)}")
+        for phase, elapsed in self.build_timings.items():
+            print(f"  - {phase}: {elapsed:.3f}s")
+
+    def save_index(self, index_path: str, source_path: Optional[str] = None):
+        """Lưu snapshot của từng shard (xem shard_index_path)"""
+        if not self._shards:
+            print("Index chưa được xây dựng, không có gì để lưu")
+            return
+        num_shards = len(self._shards)
+        started = time.perf_counter()
+        try:
+            self._scatter('save', [(shard_index_path(index_path, shard_id, num_shards),)
+                                   for shard_id in range(num_shards)])
+        except ShardError as e:
+            print(f"Lỗi khi lưu index: {e}")
+            return
+        print(f"Đã lưu index {num_shards} shard ({time.perf_counter() - started:.3f}s)")
+
+    def load_index(self, index_path: str, source_path: Optional[str] = None) -> bool:
+        """Nạp snapshot của num_shards shard
+
+        Returns:
+            False nếu thiếu snapshot của một shard, snapshot hỏng hoặc cũ
+        """
+        started = time.perf_counter()
+        num_shards = self.num_shards
+        paths = [shard_index_path(index_path, shard_id, num_shards) for shard_id in range(num_shards)]
+        if not all(os.path.isfile(path) for path in paths):
+            print(f"Không dùng được index snapshot {index_path}: thiếu snapshot của shard")
+            return False
+        self._start_shards(num_shards)
+        try:
+            loaded = self._scatter('load', [(path, source_path) for path in paths])
+        except ShardError as e:
+            print(f"Không dùng được index snapshot {index_path}: {e}")
+            loaded = [None]
+        if any(result is None for result in loaded):
+            self.close()
+            return False
+
+        idf_scores = {}
+        offsets = []
+        total_docs = 0
+        for num_docs, shard_idf, _ in loaded:
+            offsets.append(total_docs)
+            total_docs += num_docs
+            idf_scores.update(shard_idf)
+        self._set_global_term_bounds([bounds for _, _, bounds in loaded])
+        suggestions = self._gather_suggestions()
+        with self._lock:
+            self.source_path = source_path
+            self._index_path = index_path
+            self.idf_scores = TermDictionary.from_scores(idf_scores)
+            self.suggestions = suggestions
+            self._offsets = offsets
+            self._num_documents = total_docs
+            self.generation += 1
+        print(f"Đã nạp index {num_shards} shard từ {index_path} ({time.perf_counter() - started:.3f}s, "
+              f"{total_docs} documents)")
+        return True
+
+    def reopen(self) -> bool:
+        """Khởi động các process shard riêng cho process hiện tại từ snapshot đã nạp
+
+        Gọi trong worker sau khi fork (src/serve.py): mỗi worker có kết nối tới shard của
+        riêng mình nên các worker không phải chờ nhau; snapshot được memory-map nên
+        các shard của mọi worker dùng chung page cache. Shard của process cha (nếu còn)
+        không bị dừng.
+
+        Returns:
+            False nếu index chưa được nạp từ snapshot hoặc không nạp lại được
+        """
+        if self._index_path is None:
+            print("Không mở lại được shard: index chưa được nạp từ snapshot")
+            return False
+        for shard in self._shards:
+            shard.detach()
+        self._shards = []
+        return self.load_index(self._index_path, self.source_path)
+
+    def set_field_scoring(self, field_scoring: FieldScoring):
+        """Đổi mô hình chấm điểm / hệ số của các trường trong mọi shard mà không build lại index
+        (xem SimpleTFIDFSearchEngine.set_field_scoring), cận trên điểm vẫn tính trên toàn corpus"""
+        with self._lock:
+            if self._shards:
+                shard_bounds = self._scatter('set_field_scoring', [(field_scoring,)] * len(self._shards))
+                self._set_global_term_bounds(shard_bounds)
+            self.field_scoring = field_scoring
+            self.generation += 1
+
+    def warm_up(self):
+        if self._shards:
+            self._scatter('warm_up', [()] * len(self._shards))
+
+    @property
+    def vocabulary(self):
+        return self.idf_scores.term_ids.keys()
+
+    @property
+    def scoring_backend(self) -> str:
+        return self._scoring_backend_name
+
+    @property
+    def num_documents(self) -> int:
+        return self._num_documents
+
+    @property
+    def num_segments(self) -> int:
+        return len(self._shards)
+
+    def normalize_query(self, query: str) -> str:
+        return SimpleTFIDFSearchEngine.normalize_parsed(self.text_processor, query)
+
+    def suggest(self, text: str, limit: int = SUGGEST_TOP_K) -> List[Tuple[str, int]]:
+        """Gợi ý hoàn thành query đang gõ (xem SimpleTFIDFSearchEngine.suggest), không cần gửi tới shard"""
+        return self.suggestions.suggest(normalize_prefix(self.text_processor, text), limit)
+
+    @staticmethod
+    def _merge_hits(shard_hits: Sequence[List[Tuple[float, int, Dict]]], top_k: int) -> List[Tuple[float, int, Dict]]:
+        """Gộp top_k của các shard: điểm giảm dần, cùng điểm thì document đứng trước trong corpus trước"""
+        hits = [hit for hits in shard_hits for hit in hits]
+        hits.sort(key=lambda hit: (-hit[0], hit[1]))
+        return hits[:top_k]
+
+    @staticmethod
+    def _page(hits: List[Tuple[float, int, Dict]], top_k: int) -> Tuple[List[Tuple[Dict, float]], Optional[Tuple[float, int]]]:
+        """(top_k kết quả đầu, mốc after của trang sau) như SimpleTFIDFSearchEngine.search_page"""
+        results = [(document, score) for score, _, document in hits[:top_k]]
+        if top_k > 0 and len(hits) > top_k:
+            return results, hits[top_k - 1][:2]
+        return results, None
+
+    def search(self, query: str, top_k: int = 10, exhaustive: bool = False,
+               summary: bool = False, timer: Optional[StageTimer] = None,
+               filters: Optional[SearchFilter] = None) -> List[Tuple[Dict, float]]:
+        """Tìm kiếm documents liên quan đến query trên mọi shard (xem SimpleTFIDFSearchEngine.search)
+
+        Bộ lọc và điều kiện cụm từ / NEAR được áp dụng trong từng shard khi chấm điểm.
+        """
+        hits = self._ranked_hits(query, top_k, exhaustive, summary, timer, filters)
+        return [(document, score) for score, _, document in hits]
+
+    def search_page(self, query: str, top_k: int = 10, after: Optional[Tuple[float, int]] = None,
+                    summary: bool = False, timer: Optional[StageTimer] = None,
+                    filters: Optional[SearchFilter] = None) -> Tuple[List[Tuple[Dict, float]], Optional[Tuple[float, int]]]:
+        """Một trang kết quả xếp sau mốc after (xem SimpleTFIDFSearchEngine.search_page)"""
+        hits = self._ranked_hits(query, top_k + 1 if top_k > 0 else 0, False, summary, timer, filters, after)
+        return self._page(hits, top_k)
+
+    def _ranked_hits(self, query: str, top_k: int, exhaustive: bool, summary: bool, timer: Optional[StageTimer],
+                     filters: Optional[SearchFilter], after: Optional[Tuple[float, int]] = None) -> List[Tuple[float, int, Dict]]:
+        """top_k kết quả (score, vị trí, document) tốt nhất của query trên mọi shard"""
+        if timer is None:
+            timer = StageTimer()
+        with self._lock:
+            idf_scores, offsets, field_scoring = self.idf_scores, self._offsets, self.field_scoring
+        if not offsets:
+            print("Index chưa được xây dựng. Vui lòng gọi build_index() trước.")
+            return []
+        if top_k <= 0:
+            return []
+        scoring_query, phrases = parse_query(self.text_processor, query)
+        query_tokens = self.text_processor.query_tokens(scoring_query)
+        if not query_tokens:
+            print("Query rỗng sau khi xử lý")
+            return []
+        query_factors, query_norm = SimpleTFIDFSearchEngine._query_factors(query_tokens, idf_scores, field_scoring)
+        timer.mark('preprocess')
+        if not query_factors:
+            return []
+
+        shard_hits = self._scatter('search', [(query_factors, query_norm, top_k, exhaustive, summary, offset,
+                                               filters, after, phrases) for offset in offsets])
+        timer.mark('score')
+        hits = self._merge_hits(shard_hits, top_k)
+        timer.mark('sort')
+        return hits
+
+    def search_batch(self, queries: Sequence[Tuple[str, int]], summary: bool = False,
+                     timer: Optional[StageTimer] = None, pages: bool = False) -> List:
+        """Tìm kiếm nhiều query (query, top_k) trong một lượt gửi tới các shard
+        (pages=True: kết quả như search_page, xem SimpleTFIDFSearchEngine.search_batch)"""
+        if timer is None:
+            timer = StageTimer()
+        with self._lock:
+            idf_scores, offsets, field_scoring = self.idf_scores, self._offsets, self.field_scoring
+        if not offsets:
+            print("Index chưa được xây dựng. Vui lòng gọi build_index() trước.")
+            return [([], None) if pages else [] for _ in queries]
+        if pages:
+            queries = [(query, top_k + 1 if top_k > 0 else 0) for query, top_k in queries]
+        plans, query_plans = SimpleTFIDFSearchEngine.plan_queries(self.text_processor, queries, idf_scores,
+                                                                  field_scoring)
+        timer.mark('preprocess')
+
+        shard_results = self._scatter('search_batch', [(plans, summary, offset) for offset in offsets])
+        timer.mark('score')
+        plan_hits = [self._merge_hits([hits[plan_id] for hits in shard_results], top_k)
+                     for plan_id, (_, _, top_k, _) in enumerate(plans)]
+        timer.mark('sort')
+        if pages:
+            plan_results = [self._page(hits, max(top_k - 1, 0)) for hits, (_, _, top_k, _) in zip(plan_hits, plans)]
+            return [(list(plan_results[plan_id][0]), plan_results[plan_id][1]) for plan_id in query_plans]
+        plan_results = [[(document, score) for score, _, document in hits] for hits in plan_hits]
+        return [list(plan_results[plan_id]) for plan_id in query_plans]
+
+    def get_stats(self) -> Dict:
+        """Lấy thống kê về search engine (tính một lần cho mỗi generation, như SimpleTFIDFSearchEngine)"""
+        if not self._shards:
+            return {"status": "Index chưa được xây dựng"}
+        generation, cached = self.generation, self._stats
+        if cached is not None and cached[0] == generation:
+            return dict(cached[1])
+        shard_stats = self._scatter('stats', [()] * len(self._shards))
+        totals = {
+            "total_documents": sum(stats['documents'] for stats in shard_stats),
+            "duplicates": {key: sum(stats['duplicates'][key] for stats in shard_stats)
+                           for key in ('clusters', 'collapsed')},
+            "vocabulary_size": len(self.idf_scores),
+            "sample_features": list(itertools.islice(self.idf_scores, 10)),
+            "shards": [dict(stats, offset=offset) for stats, offset in zip(shard_stats, self._offsets)],
+            "segments": len(self._shards),
+            "suggestions": len(self.suggestions),
+            "generation": generation,
+            "scoring_backend": self.scoring_backend,
+            "field_scoring": self.field_scoring.to_dict(),
+            "memory_bytes": {
+                'idf': sum(self.idf_scores.memory_usage().values()),
+                'suggestions': self.suggestions.memory_usage(),
+                'shards': sum(stats['memory_bytes'] for stats in shard_stats),
+            },
+        }
+        self._stats = (generation, totals)
+        return dict(totals)
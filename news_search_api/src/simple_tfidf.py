@@ -2,155 +2,1374 @@
 Simple TF-IDF implementation without numpy/scikit-learn for deployment
 """
 
-import json
+import functools
+import heapq
+import itertools
 import math
-from collections import defaultdict, Counter
-from typing import List, Dict, Tuple
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque, Counter
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, List, Dict, Mapping, Sequence, Tuple, Optional
 from src.basic_text_processor import BasicVietnameseTextProcessor
+from src.corpus_reader import iter_batches, iter_documents
+from src.index_segment import (DocStatsSpool, IndexSegment, PackedPostings, PostingPositions, TermDictionary,
+                               compute_doc_norms, encode_positions)
+from src.document_store import DocumentStoreError, DocumentStoreWriter, content_bytes, document_summary
+from src.field_scoring import FieldScoring
+from src.filter_index import AllowedDocs, FilterIndex, FilterIndexWriter, SearchFilter
+from src.index_snapshot import SnapshotError, read_snapshot, write_snapshot
+from src.metrics import StageTimer
+from src.near_duplicates import DUPLICATE_THRESHOLD, DuplicateClusters, signature_batch
+from src.phrase_query import PositionalQuery, parse_query
+from src.scoring_backend import create_scoring_backend
+from src.snippets import (PassageIndex, PassageIndexWriter, best_passage, content_passages, make_snippet,
+                          snippet_range)
+from src.suggest_index import MIN_SUGGEST_DF, SUGGEST_TOP_K, PhraseCounter, SuggestIndex, normalize_prefix, title_phrases
+
+# Dưới ngưỡng này, chi phí khởi tạo process pool lớn hơn lợi ích song song
+PARALLEL_MIN_DOCS = 2000
+# Số documents mỗi batch trong pipeline build_index
+DEFAULT_BATCH_SIZE = 500
+# Sai số tương đối cho cận trên điểm khi cắt tỉa top-k (bù sai số làm tròn số thực)
+PRUNING_EPSILON = 1e-9
+# Gộp các segment nhỏ khi số segment nhỏ vượt quá ngưỡng này
+MERGE_MAX_SEGMENTS = 8
+# Gộp toàn bộ vào segment gốc (và tính lại IDF) khi số document mới + đã xóa
+# vượt quá tỉ lệ này so với segment gốc
+MAJOR_MERGE_RATIO = 0.1
+
+
+def _preprocess_shard(shard: List[Tuple[str, str]], positions: bool = False):
+    """Tiền xử lý một shard (title, content)
+
+    Returns:
+        (word_counts, title_counts, title_length, content_length) của từng document như
+        IndexSegment.build, document frequency của shard, số title chứa từng cụm từ
+        (dùng cho gợi ý, xem src/suggest_index.py) và nếu positions=True, vị trí đã mã hóa
+        của từng (document, từ) theo thứ tự word_counts dạng (data, lengths) như
+        IndexSegment.build kèm đầu các đoạn của content (counts, byte_starts, word_starts)
+        như PassageIndexWriter.extend (None nếu không lưu vị trí)
+    """
+    text_processor = BasicVietnameseTextProcessor()
+    doc_stats = []
+    doc_freq = Counter()
+    phrases = Counter()
+    position_chunks = []
+    position_lengths = array('I')
+    passage_counts = array('I')
+    passage_bytes = array('I')
+    passage_words = array('I')
+    for title, content in shard:
+        if positions:
+            # Đoạn của content được tách cùng lúc với từ của content (src/snippets.py)
+            byte_starts, word_starts, content_words = content_passages(text_processor, content,
+                                                                       text_processor.content_start(title))
+            title_tokens, content_tokens, word_positions = text_processor.document_positions(title, content,
+                                                                                             content_words)
+        else:
+            title_tokens, content_tokens = text_processor.document_fields(title, content)
+        # Các từ của title đứng đầu word_counts, title_counts theo cùng thứ tự
+        title_counts = Counter(title_tokens)
+        word_counts = title_counts.copy()
+        word_counts.update(content_tokens)
+        doc_stats.append((word_counts, tuple(title_counts.values()), len(title_tokens), len(content_tokens)))
+        doc_freq.update(word_counts.keys())
+        phrases.update(title_phrases(text_processor, title))
+        if positions:
+            for word in word_counts:
+                chunk = encode_positions(word_positions[word])
+                position_chunks.append(chunk)
+                position_lengths.append(len(chunk))
+            passage_counts.append(len(byte_starts))
+            passage_bytes.extend(byte_starts)
+            passage_words.extend(word_starts)
+    if positions:
+        return doc_stats, doc_freq, phrases, (b''.join(position_chunks), position_lengths,
+                                              (passage_counts, passage_bytes, passage_words))
+    return doc_stats, doc_freq, phrases, None
+
+
+def map_batches(function: Callable, batches: Iterator[List], workers: int, *args) -> Iterator:
+    """Chạy function(batch, *args) trên từng batch, giữ nguyên thứ tự batch
+
+    Dùng process pool khi corpus có ít nhất PARALLEL_MIN_DOCS documents.
+    """
+    # Đọc trước một ít batch để biết corpus có đủ lớn cho process pool không
+    head = []
+    head_docs = 0
+    for batch in batches:
+        head.append(batch)
+        head_docs += len(batch)
+        if head_docs >= PARALLEL_MIN_DOCS:
+            break
+    batches = itertools.chain(head, batches)
+    
+    if workers <= 1 or head_docs < PARALLEL_MIN_DOCS:
+        for batch in batches:
+            yield function(batch, *args)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Giới hạn số batch đang xử lý để bộ nhớ không tăng theo kích thước corpus
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(function, batch, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def find_duplicates(documents: Iterable[Dict], threshold: float = DUPLICATE_THRESHOLD,
+                    workers: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> DuplicateClusters:
+    """Gom cụm bài gần trùng lặp (src/near_duplicates.py), chữ ký được tính song song theo batch"""
+    workers = workers or os.cpu_count() or 1
+    texts = ((doc.get('title', ''), doc.get('content', '')) for doc in documents)
+    signatures = itertools.chain.from_iterable(
+        map_batches(signature_batch, iter_batches(texts, batch_size), workers))
+    return DuplicateClusters.find(signatures, threshold)
+
+
+def average_field_lengths(field_totals: Tuple[int, int], num_docs: int) -> Tuple[float, float]:
+    """Độ dài trung bình của title / content từ tổng độ dài trên num_docs document"""
+    return tuple(total / num_docs if num_docs else 0.0 for total in field_totals)
+
 
 class SimpleTFIDFSearchEngine:
-    def __init__(self):
+    def __init__(self, scoring_backend: str = 'python', suggest_min_df: int = MIN_SUGGEST_DF,
+                 positions: bool = True, field_scoring: Optional[FieldScoring] = None,
+                 duplicate_threshold: Optional[float] = None):
+        """
+        Args:
+            scoring_backend: 'python', 'numpy' hoặc 'auto' (xem src/scoring_backend.py)
+            suggest_min_df: Chỉ gợi ý từ / cụm từ có trong ít nhất chừng này document
+                (shard giữ mọi từ, ngưỡng được áp dụng sau khi cộng các shard)
+            positions: Lưu vị trí của từ cho truy vấn cụm từ / NEAR (src/phrase_query.py);
+                nếu tắt, các truy vấn này chỉ yêu cầu document chứa mọi từ của điều kiện
+            field_scoring: Mô hình chấm điểm và hệ số của title / content
+                (src/field_scoring.py, mặc định TF-IDF cosine với title x2)
+            duplicate_threshold: Ngưỡng tương đồng để build_index gộp các bài gần trùng lặp,
+                chỉ index bản chính (src/near_duplicates.py, ví dụ DUPLICATE_THRESHOLD); mặc định
+                None (hoặc 0): không gộp
+        """
         self.text_processor = BasicVietnameseTextProcessor()
         self.documents = []
-        self.processed_docs = []
-        self.vocabulary = set()
-        self.idf_scores = {}
-        self.tf_idf_matrix = []
+        # Từ điển term -> id kèm IDF, dùng chung cho mọi segment, chỉ tính lại khi build hoặc merge toàn bộ
+        self.idf_scores = TermDictionary.from_scores({})
+        # Các segment của inverted index, segments[0] là segment gốc
+        self.segments: List[IndexSegment] = []
+        # Gợi ý theo tiền tố (/api/suggest), như IDF chỉ tính lại khi build hoặc merge toàn bộ
+        self.suggestions = SuggestIndex.build({})
+        self.suggest_min_df = suggest_min_df
+        self.positions = positions
+        self.field_scoring = field_scoring or FieldScoring()
+        # Độ dài trung bình của title / content (cho BM25F), như IDF chỉ tính lại khi build hoặc merge toàn bộ
+        self.avg_field_lengths = (0.0, 0.0)
+        self.duplicate_threshold = duplicate_threshold
+        # id bản chính -> thông tin các bản sao không được index (theo thứ tự corpus)
+        self.duplicates: Dict[object, List[Dict]] = {}
+        # Tăng mỗi khi kết quả tìm kiếm có thể thay đổi (build, nạp, cập nhật, merge)
+        self.generation = 0
+        # Thời gian (giây) của từng giai đoạn trong lần build_index gần nhất
+        self.build_timings = {}
+        # (generation, thống kê) của get_stats(), chỉ tính lại khi index đổi generation
+        self._stats = None
+        # File dữ liệu nguồn, dùng làm fingerprint khi lưu/nạp snapshot
+        self.source_path = None
+        # Khoảng vị trí [start, stop) của documents được đọc từ source_path
+        self._source_range = (0, None)
+        # Memory-map của snapshot đang được dùng (nếu index được nạp từ snapshot)
+        self._snapshot = None
+        # File tạm chứa documents khi build_index đọc corpus theo luồng
+        self._spool = None
+        # id bài báo -> (segment, doc_idx), tạo khi có thao tác cập nhật đầu tiên
+        self._doc_locations = None
+        # _write_lock bảo vệ danh sách segment, _merge_lock đảm bảo mỗi lúc chỉ một lần merge
+        self._write_lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        # None: chấm điểm bằng vòng lặp Python (_score_segment)
+        self._scoring_backend = create_scoring_backend(scoring_backend)
+        self._merge_thread = None
     
-    def load_data(self, json_file_path: str):
-        """Tải dữ liệu từ file JSON"""
-        try:
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                self.documents = json.load(f)
-            print(f"Đã tải {len(self.documents)} documents")
-        except Exception as e:
-            print(f"Lỗi khi tải dữ liệu: {e}")
+    def load_data(self, json_file_path: str, start: int = 0, stop: Optional[int] = None):
+        """Chọn file dữ liệu (JSON array hoặc JSONL, có thể nén gzip)
+
+        Documents không được nạp hết vào bộ nhớ: build_index() đọc file theo luồng.
+        Chỉ các documents ở vị trí [start, stop) được đánh index (dùng khi chia shard).
+        """
+        if not os.path.isfile(json_file_path):
+            print(f"Lỗi khi tải dữ liệu: không tìm thấy file {json_file_path}")
+            self.source_path = None
             self.documents = []
+            return
+        self.source_path = json_file_path
+        self._source_range = (start, stop)
+        self.documents = []
+        print(f"Sẽ đọc dữ liệu theo luồng từ {json_file_path}")
     
-    def build_index(self):
-        """Xây dựng index TF-IDF"""
-        if not self.documents:
+    def build_index(self, workers: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                    global_stats: Optional[Callable[[Counter, int, Tuple[int, int]],
+                                                    Tuple[Mapping[str, int], int, Tuple[int, int]]]] = None,
+                    duplicates: Optional[DuplicateClusters] = None):
+        """Xây dựng index TF-IDF
+
+        Nếu self.documents rỗng, documents được đọc theo luồng từ file của load_data()
+        và ghi tạm ra đĩa, nên bộ nhớ dùng cho văn bản gốc chỉ phụ thuộc batch_size.
+        Thống kê từng document và vị trí của từ cũng được ghi tạm ra đĩa theo batch
+        (DocStatsSpool): ngoài chính index, bộ nhớ khi build gồm từ điển từ và vài số
+        nguyên mỗi document, không tăng theo tổng số posting.
+        Nếu duplicate_threshold > 0, corpus được đọc thêm một lần trước đó để gom cụm
+        bài gần trùng lặp; bản sao không được index (kể cả khỏi self.documents) mà được
+        ghi vào self.duplicates dưới bản chính.
+
+        Args:
+            workers: Số process dùng để tiền xử lý văn bản (mặc định: số CPU)
+            batch_size: Số documents mỗi batch gửi tới process pool
+            global_stats: Khi index chỉ chứa một phần corpus (shard), hàm nhận
+                (document frequency, số documents, tổng độ dài title / content) của phần
+                này và trả về số liệu tương ứng của toàn corpus để IDF và độ dài trung
+                bình của các trường được tính trên toàn corpus
+            duplicates: Cụm bản sao đã tìm trước cho đúng các documents này (shard nhận từ
+                process chính để gộp cả bản sao nằm ở shard khác); mặc định tìm theo duplicate_threshold
+        """
+        if not self.documents and not self.source_path:
             print("Không có dữ liệu để xây dựng index")
             return
         
+        self.build_timings = {}
+        
+        if duplicates is None and self.duplicate_threshold:
+            print("Đang tìm bài gần trùng lặp...")
+            started = time.perf_counter()
+            try:
+                duplicates = find_duplicates(self._read_documents(), self.duplicate_threshold, workers, batch_size)
+            except (OSError, ValueError) as e:
+                print(f"Lỗi khi tải dữ liệu: {e}")
+                return
+            print(f"Tìm thấy {len(duplicates)} bản sao")
+            self.build_timings['duplicates'] = time.perf_counter() - started
+        
+        spool = None
+        if self.documents:
+            if duplicates:
+                self.documents = list(duplicates.split(self.documents))
+            documents = self.documents
+        else:
+            spool = DocumentStoreWriter()
+            documents = self._read_documents()
+            if duplicates:
+                documents = duplicates.split(documents)
+            documents = spool.spool(documents)
+        
         print("Đang xử lý văn bản...")
-        # Tiền xử lý tất cả documents
-        self.processed_docs = []
-        for doc in self.documents:
-            processed_doc = self.text_processor.preprocess_document(
-                doc.get('title', ''), 
-                doc.get('content', '')
-            )
-            self.processed_docs.append(processed_doc.split())
-            self.vocabulary.update(processed_doc.split())
+        started = time.perf_counter()
+        # Tiền xử lý documents theo từng batch, đồng thời đếm document frequency
+        doc_ids = []
+        filters = FilterIndexWriter()
+        phrases = PhraseCounter()
+        try:
+            doc_stats, doc_freq, positions, passages = self._preprocess_documents(
+                documents, workers, batch_size, doc_ids, filters, phrases)
+        except (OSError, ValueError) as e:
+            print(f"Lỗi khi tải dữ liệu: {e}")
+            return
+        if not doc_stats:
+            doc_stats.close()
+            print("Không có dữ liệu để xây dựng index")
+            return
+        if spool is not None:
+            self._spool = spool
+            self.documents = spool.finish()
+            print(f"Đã tải {len(self.documents)} documents")
+        self.build_timings['preprocess'] = time.perf_counter() - started
         
         print("Đang tính toán IDF scores...")
-        # Tính IDF cho mỗi từ
-        self.idf_scores = {}
-        total_docs = len(self.processed_docs)
-        
-        for word in self.vocabulary:
-            # Đếm số documents chứa từ này
-            doc_freq = sum(1 for doc in self.processed_docs if word in doc)
-            # Tính IDF
-            self.idf_scores[word] = math.log(total_docs / doc_freq) if doc_freq > 0 else 0
-        
-        print("Đang tính toán TF-IDF matrix...")
-        # Tính TF-IDF cho mỗi document
-        self.tf_idf_matrix = []
-        for doc_tokens in self.processed_docs:
-            doc_length = len(doc_tokens)
-            tf_idf_vector = {}
-            
-            if doc_length > 0:
-                # Đếm tần suất từ
-                word_counts = Counter(doc_tokens)
-                
-                # Tính TF-IDF cho mỗi từ
-                for word in word_counts:
-                    tf = word_counts[word] / doc_length  # Term Frequency
-                    idf = self.idf_scores.get(word, 0)   # Inverse Document Frequency
-                    tf_idf_vector[word] = tf * idf
-            
-            self.tf_idf_matrix.append(tf_idf_vector)
+        started = time.perf_counter()
+        # Tính IDF cho mỗi từ từ document frequency đã đếm
+        total_docs = len(doc_stats)
+        corpus_doc_freq = doc_freq
+        field_totals = doc_stats.field_totals
+        if global_stats is not None:
+            corpus_doc_freq, total_docs, field_totals = global_stats(doc_freq, total_docs, field_totals)
+        avg_lengths = average_field_lengths(field_totals, total_docs)
+        idf_scores = TermDictionary.from_scores({
+            word: math.log(total_docs / df) if df > 0 else 0
+            for word, df in ((word, corpus_doc_freq[word]) for word in doc_freq)
+        })
+        self.build_timings['idf'] = time.perf_counter() - started
+        
+        # Trọng số gợi ý là document frequency trong phần corpus của index này
+        # (với shard, process chính cộng gợi ý của các shard)
+        started = time.perf_counter()
+        suggestions = SuggestIndex.from_counts(doc_freq, phrases.counts, self.suggest_min_df)
+        del phrases
+        self.build_timings['suggest'] = time.perf_counter() - started
+        
+        print("Đang xây dựng inverted index...")
+        started = time.perf_counter()
+        # Postings lưu số đếm theo trường và trọng số, norm của document tính với IDF ở trên;
+        # segment gốc dùng chung term id với từ điển toàn cục
+        segment = IndexSegment.build(self.documents, doc_stats, idf_scores, doc_ids,
+                                     term_ids=idf_scores.term_ids, filters=filters.finish(), positions=positions,
+                                     passages=passages, scoring=self.field_scoring, avg_lengths=avg_lengths)
+        # Thống kê theo document chỉ cần khi build
+        doc_stats.close()
+        del doc_stats, doc_freq, corpus_doc_freq, positions
+        self.build_timings['postings'] = time.perf_counter() - started
+        
+        with self._write_lock:
+            self.idf_scores = idf_scores
+            self.avg_field_lengths = avg_lengths
+            self.duplicates = duplicates.pointers() if duplicates else {}
+            self.segments = [segment]
+            self.suggestions = suggestions
+            self._doc_locations = None
+            self.generation += 1
         
         print(f"Hoàn thành xây dựng index! Vocabulary size: {len(self.vocabulary)}")
+        for phase, elapsed in self.build_timings.items():
+            print(f"  - {phase}: {elapsed:.3f}s")
+    
+    def _read_documents(self) -> Iterable[Dict]:
+        """Documents cần index: self.documents hoặc khoảng [start, stop) của file nguồn"""
+        if self.documents:
+            return self.documents
+        start, stop = self._source_range
+        return itertools.islice(iter_documents(self.source_path), start, stop)
     
-    def cosine_similarity(self, vec1: Dict[str, float], vec2: Dict[str, float]) -> float:
-        """Tính cosine similarity giữa 2 vectors"""
-        # Tìm từ chung
-        common_words = set(vec1.keys()) & set(vec2.keys())
+    def _preprocess_documents(self, documents: Iterable[Dict], workers: Optional[int], batch_size: int,
+                              doc_ids: List, filters: FilterIndexWriter,
+                              phrases: PhraseCounter) -> Tuple[DocStatsSpool, Counter, Optional[Tuple],
+                                                               Optional[PassageIndex]]:
+        """Tiền xử lý documents theo batch và gộp thống kê của các batch
+
+        id và giá trị lọc (topic, source, crawled_at) của từng document được ghi vào
+        doc_ids và filters khi document đi qua pipeline, cụm từ trong title được đếm vào phrases.
+        Thống kê từng document và vị trí của từ (nếu lưu) được ghi tạm ra đĩa theo thứ tự
+        document như IndexSegment.build (DocStatsSpool, người gọi đóng sau khi build),
+        kèm đầu các đoạn của content (PassageIndex).
+        """
+        workers = workers or os.cpu_count() or 1
         
-        if not common_words:
-            return 0.0
+        def iter_texts():
+            for doc in documents:
+                doc_ids.append(doc.get('id'))
+                filters.add(doc)
+                yield doc.get('title', ''), doc.get('content', '')
+        texts = iter_texts()
         
-        # Tính dot product
-        dot_product = sum(vec1[word] * vec2[word] for word in common_words)
+        doc_stats = DocStatsSpool()
+        doc_freq = Counter()
+        passages = PassageIndexWriter()
+        try:
+            for batch_stats, batch_doc_freq, batch_phrases, batch_positions in map_batches(
+                    _preprocess_shard, iter_batches(texts, batch_size), workers, self.positions):
+                doc_stats.append(batch_stats, batch_positions[:2] if batch_positions is not None else None)
+                doc_freq.update(batch_doc_freq)
+                phrases.update(batch_phrases)
+                if batch_positions is not None:
+                    passages.extend(*batch_positions[2])
+        except BaseException:
+            doc_stats.close()
+            raise
+        if not self.positions:
+            return doc_stats, doc_freq, None, None
+        return doc_stats, doc_freq, doc_stats.positions(), passages.finish()
+    
+    def save_index(self, index_path: str, source_path: Optional[str] = None):
+        """Lưu index ra file snapshot để lần khởi động sau không phải build lại
+
+        Các segment được gộp lại (bỏ document đã xóa) trước khi ghi.
+        """
+        if not self.segments:
+            print("Index chưa được xây dựng, không có gì để lưu")
+            return
+        self.merge_segments()
+        started = time.perf_counter()
+        with self._write_lock:
+            segment, idf_scores, suggestions = self.segments[0], self.idf_scores, self.suggestions
+            field_scoring, avg_lengths, duplicates = self.field_scoring, self.avg_field_lengths, self.duplicates
+        try:
+            write_snapshot(index_path, segment, idf_scores, suggestions, source_path or self.source_path,
+                           field_scoring, avg_lengths, duplicates)
+        except (OSError, DocumentStoreError) as e:
+            print(f"Lỗi khi lưu index: {e}")
+            return
+        print(f"Đã lưu index vào {index_path} ({time.perf_counter() - started:.3f}s)")
+    
+    def load_index(self, index_path: str, source_path: Optional[str] = None) -> bool:
+        """Nạp index từ file snapshot (memory-mapped)
+
+        Trọng số posting, norm và cận trên điểm được dùng nguyên từ snapshot; nếu snapshot
+        được lưu với FieldScoring khác self.field_scoring, chúng được tính lại từ số đếm
+        theo trường (không cần build lại index).
+
+        Returns:
+            False nếu snapshot không tồn tại, hỏng hoặc cũ hơn source_path;
+            khi đó cần load_data() và build_index() lại
+        """
+        started = time.perf_counter()
+        try:
+            snapshot = read_snapshot(index_path, source_path)
+        except SnapshotError as e:
+            print(f"Không dùng được index snapshot {index_path}: {e}")
+            return False
         
-        # Tính magnitude của mỗi vector
-        mag1 = math.sqrt(sum(val ** 2 for val in vec1.values()))
-        mag2 = math.sqrt(sum(val ** 2 for val in vec2.values()))
+        if self.positions and snapshot['positions'] is None:
+            print(f"Không dùng được index snapshot {index_path}: snapshot không có vị trí của từ")
+            return False
+        field_scoring, avg_lengths = self.field_scoring, snapshot['avg_field_lengths']
+        postings, field_lengths = snapshot['postings'], snapshot['field_lengths']
+        if snapshot['field_scoring'] == field_scoring:
+            doc_norms, term_bounds = snapshot['doc_norms'], snapshot['term_bounds']
+        else:
+            print(f"Snapshot được lưu với {snapshot['field_scoring']}, tính lại trọng số theo {field_scoring}")
+            postings = postings.with_weights(field_scoring.posting_weights(postings, field_lengths, avg_lengths))
+            doc_norms, term_bounds = compute_doc_norms(field_scoring, postings, field_lengths,
+                                                       snapshot['idf_scores']), None
+        segment = IndexSegment(snapshot['documents'], postings, doc_norms, snapshot['doc_ids'], field_lengths,
+                               term_bounds, snapshot['filters'], snapshot['positions'] if self.positions else None,
+                               snapshot['passages'] if self.positions else None)
+        with self._write_lock:
+            self._snapshot = snapshot['mmap']
+            self._spool = None
+            self.source_path = source_path
+            self.documents = snapshot['documents']
+            self.idf_scores = snapshot['idf_scores']
+            self.avg_field_lengths = avg_lengths
+            self.duplicates = snapshot['duplicates']
+            self.segments = [segment]
+            self.suggestions = snapshot['suggestions']
+            self._doc_locations = None
+            self.generation += 1
+        print(f"Đã nạp index từ {index_path} ({time.perf_counter() - started:.3f}s, "
+              f"{len(self.documents)} documents)")
+        return True
+    
+    def upsert_documents(self, documents: List[Dict]) -> int:
+        """Thêm mới hoặc thay thế (theo 'id') các bài báo mà không cần build lại index
+
+        Documents được ghi vào một segment nhỏ trong bộ nhớ và tìm kiếm được ngay,
+        bản cũ (nếu có) bị đánh dấu xóa. Merge segment chạy ở background.
+        Không kiểm tra trùng lặp: bản sao của bài đã có chỉ được gộp ở lần build_index sau.
+
+        Returns:
+            Số document đã ghi
+        """
+        # Trong cùng một lần gọi, document xuất hiện sau cùng với mỗi id được giữ lại
+        latest = {}
+        for doc in documents:
+            if not isinstance(doc, dict) or doc.get('id') is None:
+                raise ValueError("Mỗi document phải là object có trường 'id'")
+            latest[doc['id']] = doc
+        documents = list(latest.values())
+        if not documents:
+            return 0
         
-        if mag1 == 0 or mag2 == 0:
-            return 0.0
+        doc_stats, doc_freq, _, positions = _preprocess_shard(
+            [(doc.get('title', ''), doc.get('content', '')) for doc in documents], self.positions)
+        passages = None
+        if positions is not None:
+            passages = PassageIndexWriter()
+            passages.extend(*positions[2])
+            positions, passages = positions[:2], passages.finish()
         
-        return dot_product / (mag1 * mag2)
+        with self._write_lock:
+            locations = self._ensure_doc_locations()
+            # Từ mới nhận IDF theo thống kê hiện tại; IDF của từ đã có giữ nguyên tới lần merge toàn bộ
+            total_docs = sum(segment.live_count for segment in self.segments) + len(documents)
+            for word, df in doc_freq.items():
+                if word not in self.idf_scores:
+                    self.idf_scores.add(word, math.log(total_docs / df))
+            
+            segment = IndexSegment.build(documents, doc_stats, self.idf_scores,
+                                         filters=FilterIndex.build(documents), positions=positions,
+                                         passages=passages, scoring=self.field_scoring, avg_lengths=self.avg_field_lengths)
+            for doc_idx, doc_id in enumerate(segment.doc_ids):
+                previous = locations.get(doc_id)
+                if previous is not None:
+                    previous[0].deleted.add(previous[1])
+                locations[doc_id] = (segment, doc_idx)
+            self.segments = self.segments + [segment]
+            self.generation += 1
+            self._schedule_merge()
+        return len(documents)
+    
+    def delete_documents(self, doc_ids: List) -> List:
+        """Xóa các bài báo theo 'id' bằng tombstone (bản sao đã gộp vào bài cũng bị bỏ)
+
+        Returns:
+            Danh sách id đã xóa (bỏ qua id không tồn tại)
+        """
+        deleted = []
+        with self._write_lock:
+            locations = self._ensure_doc_locations()
+            for doc_id in doc_ids:
+                location = locations.pop(doc_id, None)
+                if location is not None:
+                    location[0].deleted.add(location[1])
+                    deleted.append(doc_id)
+            if any(doc_id in self.duplicates for doc_id in deleted):
+                # Thay dict thay vì sửa tại chỗ vì search và get_stats đọc không cần khóa
+                removed = set(deleted)
+                self.duplicates = {doc_id: variants for doc_id, variants in self.duplicates.items()
+                                   if doc_id not in removed}
+            if deleted:
+                self.generation += 1
+                self._schedule_merge()
+        return deleted
+    
+    def _ensure_doc_locations(self) -> Dict:
+        """Bảng id -> (segment, doc_idx) của document chưa bị xóa (gọi khi giữ _write_lock)"""
+        if self._doc_locations is None:
+            locations = {}
+            for segment in self.segments:
+                for doc_idx, doc_id in enumerate(segment.doc_ids):
+                    if doc_id is not None and doc_idx not in segment.deleted:
+                        locations[doc_id] = (segment, doc_idx)
+            self._doc_locations = locations
+        return self._doc_locations
+    
+    def _pending_merge(self) -> Optional[str]:
+        """Loại merge cần chạy theo trạng thái segment hiện tại: 'major', 'minor' hoặc None"""
+        segments = self.segments
+        if not segments:
+            return None
+        small_docs = sum(len(segment) for segment in segments[1:])
+        deleted_docs = sum(len(segment.deleted) for segment in segments)
+        if small_docs + deleted_docs > MAJOR_MERGE_RATIO * max(len(segments[0]), 1):
+            return 'major'
+        if len(segments) - 1 > MERGE_MAX_SEGMENTS:
+            return 'minor'
+        return None
+    
+    def _schedule_merge(self):
+        """Khởi động thread merge nếu cần (gọi khi giữ _write_lock)"""
+        if self._pending_merge() is None:
+            return
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        self._merge_thread = threading.Thread(target=self._merge_in_background,
+                                              name='segment-merge', daemon=True)
+        self._merge_thread.start()
+    
+    def _merge_in_background(self):
+        with self._merge_lock:
+            while True:
+                with self._write_lock:
+                    kind = self._pending_merge()
+                if kind is None:
+                    return
+                self._merge_segments(major=(kind == 'major'))
+    
+    def merge_segments(self):
+        """Gộp toàn bộ segment thành một, bỏ document đã xóa và tính lại IDF"""
+        with self._merge_lock:
+            self._merge_segments(major=True)
+    
+    def _merge_segments(self, major: bool):
+        """Gộp segment (gọi khi giữ _merge_lock)
+
+        major=True gộp mọi segment và tính lại IDF/norm (và độ dài trung bình của các trường) theo thống kê mới,
+        tương đương build lại index mà không cần tiền xử lý văn bản.
+        major=False chỉ gộp các segment nhỏ, IDF giữ nguyên.
+        Phần tốn thời gian chạy ngoài _write_lock nên tìm kiếm và cập nhật không bị chặn.
+        """
+        with self._write_lock:
+            segments = self.segments
+            sources = segments if major else segments[1:]
+            if (not sources or (not major and len(sources) < 2)
+                    or (major and len(sources) == 1 and not sources[0].deleted)):
+                return
+            deleted_before = [set(segment.deleted) for segment in sources]
+            field_scoring = self.field_scoring
+        
+        started = time.perf_counter()
+        # Đánh số lại document còn sống theo thứ tự segment (-1: đã xóa)
+        documents = DocumentStoreWriter() if major else []
+        filters = FilterIndexWriter()
+        phrases = PhraseCounter()
+        doc_ids = []
+        remaps = []
+        doc_norms = []
+        title_lengths = array('I')
+        content_lengths = array('I')
+        # Đầu các đoạn của content, chỉ giữ nếu mọi segment được merge đều có (như vị trí của từ)
+        passages = PassageIndexWriter() if all(segment.passages is not None for segment in sources) else None
+        for segment, deleted in zip(sources, deleted_before):
+            remap = []
+            for doc_idx in range(len(segment)):
+                if doc_idx in deleted:
+                    remap.append(-1)
+                    continue
+                remap.append(len(doc_ids))
+                if major:
+                    documents.append_from(segment.documents, doc_idx)
+                    title = document_summary(segment.documents, doc_idx).get('title')
+                    phrases.update(title_phrases(self.text_processor, title or ''))
+                else:
+                    documents.append(segment.documents[doc_idx])
+                filters.add_from(segment.filters, doc_idx)
+                doc_ids.append(segment.doc_ids[doc_idx])
+                doc_norms.append(segment.doc_norms[doc_idx])
+                title_lengths.append(segment.field_lengths[0][doc_idx])
+                content_lengths.append(segment.field_lengths[1][doc_idx])
+                if passages is not None:
+                    passages.add_from(segment.passages, doc_idx)
+            remaps.append(remap)
+        field_lengths = (title_lengths, content_lengths)
+        
+        postings = defaultdict(list)
+        # Vị trí đã mã hóa của từng posting, chỉ giữ nếu mọi segment được merge đều có vị trí
+        positions = defaultdict(list) if all(segment.positions is not None for segment in sources) else None
+        for segment, remap in zip(sources, remaps):
+            packed = segment.postings
+            offsets, docs, tfs = packed.offsets, packed.docs, packed.tfs
+            title_counts, content_counts = packed.title_counts, packed.content_counts
+            for term_id, word in enumerate(packed):
+                merged_postings = postings[word]
+                for posting in range(offsets[term_id], offsets[term_id + 1]):
+                    new_idx = remap[docs[posting]]
+                    if new_idx >= 0:
+                        merged_postings.append((new_idx, tfs[posting], title_counts[posting], content_counts[posting]))
+                        if positions is not None:
+                            positions[word].append(segment.positions.raw(posting))
+        postings = {word: word_postings for word, word_postings in postings.items() if word_postings}
+        if major:
+            documents = documents.finish()
+            # IDF mới theo document frequency của các document được merge
+            total_docs = len(doc_ids)
+            idf_scores = TermDictionary.from_scores({word: math.log(total_docs / len(word_postings))
+                                                     for word, word_postings in postings.items()})
+            avg_lengths = average_field_lengths((sum(title_lengths), sum(content_lengths)), total_docs)
+            suggestions = SuggestIndex.from_counts({word: len(word_postings) for word, word_postings in postings.items()},
+                                                   phrases.counts, self.suggest_min_df)
+            postings = PackedPostings.from_lists(postings, idf_scores.term_ids)
+            if not field_scoring.cosine:
+                # Trọng số BM25F phụ thuộc độ dài trung bình của các trường
+                postings = postings.with_weights(field_scoring.posting_weights(postings, field_lengths, avg_lengths))
+            doc_norms = compute_doc_norms(field_scoring, postings, field_lengths, idf_scores)
+        else:
+            idf_scores = None
+            postings = PackedPostings.from_lists(postings)
+        if positions is not None:
+            positions = PostingPositions.from_lists(positions, postings.term_ids)
+        merged = IndexSegment(documents, postings, doc_norms, doc_ids, field_lengths, filters=filters.finish(),
+                              positions=positions, passages=passages.finish() if passages is not None else None)
+        
+        with self._write_lock:
+            current = self.segments
+            start = next(i for i, segment in enumerate(current) if segment is sources[0])
+            tail = current[start + len(sources):]
+            # Tombstone được thêm trong lúc merge
+            for segment, remap, deleted in zip(sources, remaps, deleted_before):
+                for doc_idx in segment.deleted - deleted:
+                    if remap[doc_idx] >= 0:
+                        merged.deleted.add(remap[doc_idx])
+            
+            if major:
+                # Segment được thêm trong lúc merge dùng IDF mới; từ chỉ có trong các segment này giữ IDF cũ
+                for segment in tail:
+                    for word in segment.postings:
+                        if word not in idf_scores:
+                            idf_scores.add(word, self.idf_scores.get(word, 0))
+                new_tail = [segment.reweighted(field_scoring, idf_scores, avg_lengths) for segment in tail]
+            else:
+                new_tail = tail
+            
+            if self._doc_locations is not None:
+                moved = [(segment, remap) for segment, remap in zip(sources, remaps)]
+                moved += [(old, range(len(old))) for old in tail]
+                targets = [merged] * len(sources) + new_tail
+                for (segment, remap), target in zip(moved, targets):
+                    for doc_idx, new_idx in enumerate(remap):
+                        doc_id = segment.doc_ids[doc_idx]
+                        location = self._doc_locations.get(doc_id)
+                        if location is not None and location[0] is segment and location[1] == doc_idx:
+                            self._doc_locations[doc_id] = (target, new_idx)
+            
+            if major:
+                self.idf_scores = idf_scores
+                self.avg_field_lengths = avg_lengths
+                self.suggestions = suggestions
+                self._snapshot = None
+                self._spool = None
+            self.segments = current[:start] + [merged] + new_tail
+            self.generation += 1
+        
+        print(f"Đã merge {len(sources)} segment ({'toàn bộ' if major else 'segment nhỏ'}, "
+              f"{len(merged)} documents, {time.perf_counter() - started:.3f}s)")
+    
+    def set_field_scoring(self, field_scoring: FieldScoring):
+        """Đổi mô hình chấm điểm / hệ số của title và content mà không build lại index
+
+        Trọng số, norm và cận trên điểm của mọi segment được tính lại từ số đếm theo
+        trường (không tiền xử lý lại văn bản). Phần tốn thời gian chạy ngoài _write_lock.
+        """
+        with self._merge_lock:
+            with self._write_lock:
+                segments, idf_scores, avg_lengths = self.segments, self.idf_scores, self.avg_field_lengths
+            reweighted = {id(segment): segment.reweighted(field_scoring, idf_scores, avg_lengths)
+                          for segment in segments}
+            with self._write_lock:
+                # Segment được thêm trong lúc tính lại (upsert) là segment nhỏ, tính lại khi giữ lock
+                self.segments = [reweighted[id(segment)] if id(segment) in reweighted
+                                 else segment.reweighted(field_scoring, idf_scores, avg_lengths)
+                                 for segment in self.segments]
+                self.field_scoring = field_scoring
+                self._doc_locations = None
+                self.generation += 1
+    
+    @property
+    def vocabulary(self):
+        """Các từ trong index"""
+        return self.idf_scores.term_ids.keys()
+    
+    @property
+    def num_documents(self) -> int:
+        """Số document đang được tìm kiếm (không tính document đã xóa)"""
+        return sum(segment.live_count for segment in self.segments)
     
-    def search(self, query: str, top_k: int = 10) -> List[Tuple[Dict, float]]:
-        """Tìm kiếm documents liên quan đến query"""
-        if not self.tf_idf_matrix:
+    @property
+    def num_segments(self) -> int:
+        return len(self.segments)
+    
+    @property
+    def scoring_backend(self) -> str:
+        """Tên backend chấm điểm đang dùng"""
+        return self._scoring_backend.name if self._scoring_backend is not None else 'python'
+    
+    def warm_up(self):
+        """Tạo trước các cấu trúc được khởi tạo lười khi truy vấn (ma trận của backend numpy)
+
+        Gọi trong process chính trước khi fork worker để các worker dùng chung
+        thay vì mỗi worker tự tạo một bản riêng.
+        """
+        with self._write_lock:
+            segments = self.segments
+        if self._scoring_backend is not None:
+            for segment in segments:
+                self._scoring_backend.matrix(segment)
+    
+    def normalize_query(self, query: str) -> str:
+        """Dạng chuẩn hóa của query (sau tiền xử lý), hai query cùng dạng chuẩn cho cùng kết quả"""
+        return self.normalize_parsed(self.text_processor, query)
+    
+    @staticmethod
+    def normalize_parsed(text_processor: BasicVietnameseTextProcessor, query: str) -> str:
+        """Dạng chuẩn hóa của query kèm dạng chuẩn của điều kiện cụm từ / NEAR (nếu có)"""
+        scoring_query, phrases = parse_query(text_processor, query)
+        normalized = text_processor.preprocess_query(scoring_query)
+        return normalized if phrases is None else normalized + ' ' + phrases.key()
+    
+    def suggest(self, text: str, limit: int = SUGGEST_TOP_K) -> List[Tuple[str, int]]:
+        """Gợi ý hoàn thành query đang gõ: (từ hoặc cụm từ, số document chứa nó), xem src/suggest_index.py"""
+        return self.suggestions.suggest(normalize_prefix(self.text_processor, text), limit)
+    
+    def search(self, query: str, top_k: int = 10, exhaustive: bool = False,
+               summary: bool = False, timer: Optional[StageTimer] = None,
+               filters: Optional[SearchFilter] = None) -> List[Tuple[Dict, float]]:
+        """Tìm kiếm documents liên quan đến query
+
+        Args:
+            top_k: Số kết quả tối đa
+            summary: Trả về bản tóm tắt của document (không có 'content', có 'preview' và
+                'snippet' nếu index lưu vị trí, xem _snippet()) thay vì document đầy đủ,
+                chỉ đọc phần nhỏ của record trên đĩa
+            exhaustive: Chấm điểm mọi document có chứa từ trong query, không cắt tỉa
+                theo cận trên điểm (kết quả giống hệt chế độ mặc định, dùng để kiểm tra).
+                Backend numpy luôn chấm điểm mọi document.
+            timer: Nhận thời gian các giai đoạn preprocess, filter, phrase, score, sort và fetch
+            filters: Chỉ chấm điểm các document thỏa mãn bộ lọc (topic, source, crawled_at)
+
+        Cụm từ trong ngoặc kép và NEAR/k trong query (src/phrase_query.py) chỉ giữ lại
+        các document thỏa mãn điều kiện, điểm tính như query thường.
+        """
+        if timer is None:
+            timer = StageTimer()
+        top_hits, query_factors = self._ranked_hits(query, top_k, exhaustive, timer, filters)
+        results = self._collect_results(top_hits, summary, query_factors)
+        timer.mark('fetch')
+        return results
+    
+    def search_page(self, query: str, top_k: int = 10, after: Optional[Tuple[float, int]] = None,
+                    summary: bool = False, timer: Optional[StageTimer] = None,
+                    filters: Optional[SearchFilter] = None) -> Tuple[List[Tuple[Dict, float]], Optional[Tuple[float, int]]]:
+        """Một trang kết quả khi phân trang theo kiểu search-after
+
+        Thứ tự kết quả là (score giảm dần, vị trí document tăng dần) như search(). Trang
+        gồm top_k kết quả xếp ngay sau mốc after; document xếp trước mốc bị loại khi
+        chấm điểm nên chi phí của trang thứ N không tăng theo N.
+
+        Args:
+            after: (score, vị trí) của kết quả cuối trang trước, None cho trang đầu
+
+        Returns:
+            (kết quả như search(), mốc after của trang sau hoặc None nếu đã hết kết quả)
+        """
+        if timer is None:
+            timer = StageTimer()
+        # Lấy thêm một kết quả để biết còn trang sau hay không
+        top_hits, query_factors = self._ranked_hits(query, top_k + 1 if top_k > 0 else 0, False, timer, filters,
+                                                    after)
+        page = self._page(top_hits, top_k, summary, query_factors)
+        timer.mark('fetch')
+        return page
+    
+    def _ranked_hits(self, query: str, top_k: int, exhaustive: bool, timer: StageTimer,
+                     filters: Optional[SearchFilter],
+                     after: Optional[Tuple[float, int]] = None) -> Tuple[List, Dict[str, float]]:
+        """top_k phần tử (score, -vị trí, segment, doc_idx) tốt nhất của query, đã sắp xếp giảm dần,
+        và trọng số của các từ trong query (dùng cho snippet)"""
+        with self._write_lock:
+            segments, idf_scores, field_scoring = self.segments, self.idf_scores, self.field_scoring
+        if not segments:
             print("Index chưa được xây dựng. Vui lòng gọi build_index() trước.")
-            return []
+            return [], {}
+        if top_k <= 0:
+            return [], {}
         
         # Tiền xử lý query
-        processed_query = self.text_processor.preprocess_query(query)
-        if not processed_query.strip():
+        scoring_query, phrases = parse_query(self.text_processor, query)
+        query_tokens = self.text_processor.query_tokens(scoring_query)
+        if not query_tokens:
             print("Query rỗng sau khi xử lý")
-            return []
+            return [], {}
         
-        query_tokens = processed_query.split()
-        query_length = len(query_tokens)
+        query_factors, query_norm = self._query_factors(query_tokens, idf_scores, field_scoring)
+        timer.mark('preprocess')
+        if not query_factors:
+            return [], {}
         
-        if query_length == 0:
+        allowed = self._resolve_filters(segments, filters)
+        if allowed is not None:
+            timer.mark('filter')
+        if phrases is not None:
+            allowed = self._resolve_phrases(segments, phrases, allowed)
+            timer.mark('phrase')
+        
+        top_hits = self._score_segments(segments, idf_scores, query_factors, query_norm, top_k, exhaustive,
+                                        allowed=allowed, after=after)
+        timer.mark('score')
+        
+        # Sắp xếp theo độ tương đồng giảm dần (cùng điểm thì giữ thứ tự document)
+        top_hits.sort(reverse=True)
+        timer.mark('sort')
+        return top_hits, query_factors
+    
+    def search_batch(self, queries: Sequence[Tuple[str, int]], summary: bool = False,
+                     timer: Optional[StageTimer] = None, pages: bool = False) -> List:
+        """Tìm kiếm nhiều query (query, top_k) cùng lúc trên cùng một phiên bản index
+
+        Từ dùng chung giữa các query chỉ được tra một lần và mỗi postings list chỉ
+        được duyệt một lần cho mọi query có từ đó. Kết quả của từng query giống
+        hệt search(query, top_k, summary=summary), hoặc search_page(query, top_k,
+        summary=summary) nếu pages=True. timer nhận thời gian các giai đoạn như search().
+        """
+        if timer is None:
+            timer = StageTimer()
+        with self._write_lock:
+            segments, idf_scores, field_scoring = self.segments, self.idf_scores, self.field_scoring
+        if not segments:
+            print("Index chưa được xây dựng. Vui lòng gọi build_index() trước.")
+            return [([], None) if pages else [] for _ in queries]
+        
+        if pages:
+            queries = [(query, top_k + 1 if top_k > 0 else 0) for query, top_k in queries]
+        plans, query_plans = self.plan_queries(self.text_processor, queries, idf_scores, field_scoring)
+        timer.mark('preprocess')
+        
+        plan_hits = self._score_segments_batch(segments, idf_scores, plans)
+        timer.mark('score')
+        
+        for top_hits in plan_hits:
+            top_hits.sort(reverse=True)
+        timer.mark('sort')
+        if pages:
+            plan_results = [self._page(top_hits, max(top_k - 1, 0), summary, query_factors)
+                            for top_hits, (query_factors, _, top_k, _) in zip(plan_hits, plans)]
+            timer.mark('fetch')
+            return [(list(plan_results[plan_id][0]), plan_results[plan_id][1]) for plan_id in query_plans]
+        plan_results = [self._collect_results(top_hits, summary, plan[0]) for top_hits, plan in zip(plan_hits, plans)]
+        timer.mark('fetch')
+        return [list(plan_results[plan_id]) for plan_id in query_plans]
+    
+    def score_query(self, query_factors: Dict[str, float], query_norm: float, top_k: int,
+                    exhaustive: bool = False, summary: bool = False, offset: int = 0,
+                    filters: Optional[SearchFilter] = None,
+                    after: Optional[Tuple[float, int]] = None,
+                    phrases: Optional[PositionalQuery] = None) -> List[Tuple[float, int, Dict]]:
+        """Chấm điểm một query đã được chuẩn bị ở nơi khác (shard của ShardedSearchEngine,
+        query_factors tính theo IDF của toàn corpus), phrases là điều kiện cụm từ / NEAR của query
+
+        Returns:
+            Các (score, vị trí document, document) theo score giảm dần, vị trí tính từ offset
+        """
+        with self._write_lock:
+            segments, idf_scores = self.segments, self.idf_scores
+        if not segments or not query_factors or top_k <= 0:
             return []
+        allowed = self._resolve_filters(segments, filters)
+        if phrases is not None:
+            allowed = self._resolve_phrases(segments, phrases, allowed)
+        top_hits = self._score_segments(segments, idf_scores, query_factors, query_norm, top_k, exhaustive, offset,
+                                        allowed, after)
+        top_hits.sort(reverse=True)
+        return self._collect_hits(top_hits, summary, query_factors)
+    
+    def score_queries(self, plans: Sequence[Tuple], summary: bool = False,
+                      offset: int = 0) -> List[List[Tuple[float, int, Dict]]]:
+        """Chấm điểm nhiều query đã được chuẩn bị (xem plan_queries) trong một lượt, như score_query"""
+        with self._write_lock:
+            segments, idf_scores = self.segments, self.idf_scores
+        if not segments:
+            return [[] for _ in plans]
+        plan_hits = self._score_segments_batch(segments, idf_scores, plans, offset)
+        for top_hits in plan_hits:
+            top_hits.sort(reverse=True)
+        return [self._collect_hits(top_hits, summary, plan[0]) for top_hits, plan in zip(plan_hits, plans)]
+    
+    @staticmethod
+    def _resolve_filters(segments: Sequence[IndexSegment],
+                         filters: Optional[SearchFilter]) -> Optional[List[AllowedDocs]]:
+        """Các document thỏa mãn bộ lọc trong từng segment (None nếu không lọc)"""
+        if filters is None:
+            return None
+        return [filters.resolve(segment.filters) for segment in segments]
+    
+    @staticmethod
+    def _resolve_phrases(segments: Sequence[IndexSegment], phrases: PositionalQuery,
+                         allowed: Optional[List[AllowedDocs]] = None) -> List[AllowedDocs]:
+        """Các document thỏa mãn điều kiện cụm từ / NEAR (và bộ lọc allowed) trong từng segment"""
+        return [phrases.resolve(segment, allowed[segment_id] if allowed is not None else None)
+                for segment_id, segment in enumerate(segments)]
+    
+    def _score_segments(self, segments: Sequence[IndexSegment], idf_scores: Mapping[str, float],
+                        query_factors: Dict[str, float], query_norm: float, top_k: int,
+                        exhaustive: bool = False, offset: int = 0,
+                        allowed: Optional[List[AllowedDocs]] = None,
+                        after: Optional[Tuple[float, int]] = None) -> List:
+        """Heap top_k kết quả của query trên các segment
+
+        allowed: document được phép của từng segment (xem _resolve_filters), các document
+        khác không được chấm điểm
+        after: chỉ lấy các document xếp sau mốc (score, vị trí toàn cục) này
+        """
+        # Min-heap top_k phần tử (score, -doc thứ tự toàn cục, segment, doc_idx):
+        # phần tử đầu heap là kết quả kém nhất đang giữ
+        top_hits = []
+        backend = self._scoring_backend
+        for segment_id, segment in enumerate(segments):
+            segment_allowed = allowed[segment_id] if allowed is not None else None
+            if segment_allowed is not None and not segment_allowed:
+                # Không document nào của segment thỏa mãn bộ lọc
+                pass
+            elif backend is not None:
+                backend.score_segment(segment, query_factors, query_norm, top_k, top_hits, offset,
+                                      functools.partial(self._push_hit, top_hits, top_k), segment_allowed, after)
+            else:
+                self._score_segment(segment, query_factors, query_norm, idf_scores,
+                                    top_k, top_hits, offset, exhaustive, segment_allowed, after)
+            offset += len(segment)
+        return top_hits
+    
+    def _score_segments_batch(self, segments: Sequence[IndexSegment], idf_scores: Mapping[str, float],
+                              plans: Sequence[Tuple], offset: int = 0) -> List[List]:
+        """Heap top_k kết quả của từng plan trên các segment
+
+        Plan có điều kiện cụm từ / NEAR được chấm điểm riêng trên các document thỏa mãn điều kiện.
+        """
+        plan_hits = [[] for _ in plans]
+        scoring = []
+        for plan_id, (query_factors, query_norm, top_k, phrases) in enumerate(plans):
+            if phrases is None:
+                scoring.append((query_factors, query_norm, top_k, plan_hits[plan_id]))
+            elif query_factors:
+                plan_hits[plan_id] = self._score_segments(segments, idf_scores, query_factors, query_norm, top_k,
+                                                          offset=offset,
+                                                          allowed=self._resolve_phrases(segments, phrases))
+        for segment in segments:
+            self._score_segment_batch(segment, scoring, idf_scores, offset)
+            offset += len(segment)
+        return plan_hits
+    
+    @classmethod
+    def plan_queries(cls, text_processor: BasicVietnameseTextProcessor, queries: Sequence[Tuple[str, int]],
+                     idf_scores: Mapping[str, float],
+                     field_scoring: Optional[FieldScoring] = None) -> Tuple[List[Tuple], List[int]]:
+        """Chuẩn bị chấm điểm các query (query, top_k), query giống nhau sau tiền xử lý chỉ chấm một lần
+
+        Returns:
+            (plans, query_plans): các (query_factors, query_norm, top_k, điều kiện cụm từ / NEAR
+            hoặc None) khác nhau và vị trí plan của từng query
+        """
+        plans = []
+        plan_ids = {}
+        query_plans = []
+        for query, top_k in queries:
+            scoring_query, phrases = parse_query(text_processor, query)
+            query_tokens = text_processor.query_tokens(scoring_query)
+            key = (tuple(query_tokens), top_k, phrases.key() if phrases is not None else None)
+            if key not in plan_ids:
+                query_factors, query_norm = cls._query_factors(query_tokens, idf_scores, field_scoring)
+                if top_k <= 0:
+                    query_factors = {}
+                plan_ids[key] = len(plans)
+                plans.append((query_factors, query_norm, top_k, phrases))
+            query_plans.append(plan_ids[key])
+        return plans, query_plans
+    
+    @staticmethod
+    def _query_factors(query_tokens: List[str], idf_scores: Mapping[str, float],
+                       field_scoring: Optional[FieldScoring] = None) -> Tuple[Dict[str, float], float]:
+        """Hệ số query_weight * idf của từng từ trong query và norm của vector TF-IDF query
+
+        Với BM25F (field_scoring không chấm bằng cosine), hệ số là số lần xuất hiện
+        trong query * idf và norm là 1.
+        """
+        query_length = len(query_tokens)
+        if query_length == 0:
+            return {}, 0.0
+        
+        if field_scoring is not None and not field_scoring.cosine:
+            query_factors = {}
+            for word, count in Counter(query_tokens).items():
+                idf = idf_scores.get(word)
+                if idf:
+                    query_factors[word] = count * idf
+            return query_factors, 1.0 if query_factors else 0.0
         
         # Tạo TF-IDF vector cho query
         query_word_counts = Counter(query_tokens)
         query_vector = {}
         
         for word in query_word_counts:
-            if word in self.vocabulary:
+            idf = idf_scores.get(word)
+            if idf is not None:
                 tf = query_word_counts[word] / query_length
-                idf = self.idf_scores.get(word, 0)
                 query_vector[word] = tf * idf
         
-        # Tính similarity với mỗi document
-        similarities = []
-        for i, doc_vector in enumerate(self.tf_idf_matrix):
-            similarity = self.cosine_similarity(query_vector, doc_vector)
-            similarities.append((i, similarity))
-        
-        # Sắp xếp theo độ tương đồng giảm dần
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        query_norm = math.sqrt(sum(val ** 2 for val in query_vector.values()))
+        if query_norm == 0:
+            return {}, 0.0
         
+        # Postings lưu tf nên nhân thêm IDF: dot = sum(query_weight * tf * idf)
+        query_factors = {
+            word: query_weight * idf_scores[word]
+            for word, query_weight in query_vector.items()
+            if query_weight != 0
+        }
+        return query_factors, query_norm
+    
+    @staticmethod
+    def _term_order(word: str, idf_scores: Mapping[str, float], term_bounds: Mapping[str, float]) -> Tuple[float, str]:
+        """Thứ tự duyệt term trong một segment: idf * cận trên tf / norm giảm dần
+
+        Không phụ thuộc query nên mọi query (search và search_batch) cộng điểm các
+        term theo cùng thứ tự, cho điểm giống hệt nhau.
+        """
+        return (-(idf_scores.get(word, 0) * term_bounds.get(word, 0.0)), word)
+    
+    def _hit_document(self, segment: IndexSegment, doc_idx: int, summary: bool,
+                      query_factors: Optional[Mapping[str, float]] = None) -> Dict:
+        """Document (hoặc bản tóm tắt kèm 'snippet' theo query_factors) của kết quả,
+        kèm 'duplicates' nếu document có bản sao"""
+        if summary:
+            document = document_summary(segment.documents, doc_idx)
+            snippet = self._snippet(segment, doc_idx, query_factors) if query_factors else None
+            if snippet is not None:
+                document['snippet'] = snippet
+        else:
+            document = segment.documents[doc_idx]
+        variants = self.duplicates.get(document.get('id')) if self.duplicates else None
+        if variants:
+            # Không sửa document gốc (summary=False trả về chính document trong self.documents)
+            document = dict(document, duplicates=variants)
+        return document
+    
+    @staticmethod
+    def _snippet(segment: IndexSegment, doc_idx: int, query_factors: Mapping[str, float]) -> Optional[Dict]:
+        """Đoạn content khớp query nhất của document, xem src/snippets.py (None nếu segment không lưu vị trí)
+
+        Vị trí của từng từ trong query được lấy từ posting của document (tìm nhị phân
+        trong postings của từ), đoạn được chọn theo trọng số query_factors và chỉ đoạn
+        đó được đọc từ kho documents.
+        """
+        passages = segment.passages
+        if passages is None or segment.positions is None:
+            return None
+        byte_starts, word_starts = passages.get(doc_idx)
+        if not len(byte_starts):
+            return None
+        postings = segment.postings
+        docs = postings.docs
+        term_positions = {}
+        for word in query_factors:
+            posting_range = postings.posting_range(word)
+            if posting_range is None:
+                continue
+            posting = bisect_left(docs, doc_idx, *posting_range)
+            if posting < posting_range[1] and docs[posting] == doc_idx:
+                term_positions[word] = segment.positions.get(posting)
+        passage = best_passage(word_starts, term_positions, query_factors)
+        start, stop = snippet_range(byte_starts, passage)
+        data = content_bytes(segment.documents, doc_idx, start, stop)
+        return make_snippet(data, query_factors, start > 0, len(data) == stop - start)
+    
+    def _collect_results(self, top_hits: List, summary: bool = False,
+                         query_factors: Optional[Mapping[str, float]] = None) -> List[Tuple[Dict, float]]:
+        """Chuyển top_hits (đã sắp xếp giảm dần) thành danh sách (document hoặc bản tóm tắt, score)"""
         # Lấy top_k kết quả có score > 0
-        results = []
-        for doc_idx, score in similarities[:top_k]:
-            if score > 0:
-                results.append((self.documents[doc_idx], score))
+        return [(self._hit_document(segment, doc_idx, summary, query_factors), score)
+                for score, _, segment, doc_idx in top_hits if score > 0]
+    
+    def _collect_hits(self, top_hits: List, summary: bool = False,
+                      query_factors: Optional[Mapping[str, float]] = None) -> List[Tuple[float, int, Dict]]:
+        """Như _collect_results nhưng giữ vị trí toàn cục của document: (score, vị trí, document)"""
+        return [(score, -negative_position, self._hit_document(segment, doc_idx, summary, query_factors))
+                for score, negative_position, segment, doc_idx in top_hits if score > 0]
+    
+    def _page(self, top_hits: List, top_k: int, summary: bool,
+              query_factors: Optional[Mapping[str, float]] = None) -> Tuple[List[Tuple[Dict, float]], Optional[Tuple[float, int]]]:
+        """(top_k kết quả đầu, mốc after của trang sau) từ top_hits đã sắp xếp,
+        top_hits có kết quả thứ top_k + 1 nếu còn trang sau"""
+        results = self._collect_results(top_hits[:top_k], summary, query_factors)
+        if top_k > 0 and len(top_hits) > top_k and top_hits[top_k][0] > 0:
+            score, negative_position = top_hits[top_k - 1][:2]
+            return results, (score, -negative_position)
+        return results, None
+    
+    @staticmethod
+    def _push_hit(top_hits: List, top_k: int, hit: Tuple):
+        """Đưa một kết quả (score, -doc thứ tự toàn cục, segment, doc_idx) vào heap top_hits"""
+        if len(top_hits) < top_k:
+            heapq.heappush(top_hits, hit)
+        elif hit[:2] > top_hits[0][:2]:
+            heapq.heapreplace(top_hits, hit)
+    
+    @staticmethod
+    def _push_hits(segment: IndexSegment, accumulators: Dict[int, float], query_norm: float,
+                   top_k: int, top_hits: List, offset: int, after: Optional[Tuple[float, int]] = None):
+        """Đưa các document đã chấm điểm của segment (xếp sau mốc after nếu có) vào heap top_hits"""
+        doc_norms = segment.doc_norms
+        deleted = segment.deleted
+        after_key = (after[0], -after[1]) if after is not None else None
+        for doc_idx, dot_product in accumulators.items():
+            doc_norm = doc_norms[doc_idx]
+            if doc_norm == 0 or doc_idx in deleted:
+                continue
+            hit = (dot_product / (query_norm * doc_norm), -(offset + doc_idx), segment, doc_idx)
+            if after_key is not None and hit[:2] >= after_key:
+                continue
+            if len(top_hits) < top_k:
+                heapq.heappush(top_hits, hit)
+            elif hit[:2] > top_hits[0][:2]:
+                heapq.heapreplace(top_hits, hit)
+    
+    def _score_segment_batch(self, segment: IndexSegment, plans: List, idf_scores: Mapping[str, float], offset: int):
+        """Chấm điểm một segment cho nhiều query, mỗi postings list chỉ duyệt một lần
+
+        plans: danh sách (query_factors, query_norm, top_k, top_hits). Không cắt tỉa
+        theo cận trên điểm vì ngưỡng top_k khác nhau giữa các query. Với backend
+        numpy, mỗi query là một phép nhân ma trận trên các hàng (term) của segment.
+        """
+        backend = self._scoring_backend
+        if backend is not None:
+            for query_factors, query_norm, top_k, top_hits in plans:
+                if query_factors:
+                    backend.score_segment(segment, query_factors, query_norm, top_k, top_hits, offset,
+                                          functools.partial(self._push_hit, top_hits, top_k))
+            return
         
-        return results
+        postings = segment.postings
+        term_bounds = segment.term_bounds
+        
+        # term -> [(accumulators của query, hệ số của term trong query)]
+        term_users = defaultdict(list)
+        all_accumulators = []
+        for query_factors, _, _, _ in plans:
+            accumulators = {}
+            all_accumulators.append(accumulators)
+            for word, factor in query_factors.items():
+                term_users[word].append((accumulators, factor))
+        
+        terms = sorted(term_users, key=lambda word: self._term_order(word, idf_scores, term_bounds))
+        for word in terms:
+            word_postings = postings.get(word)
+            if not word_postings:
+                continue
+            users = term_users[word]
+            if len(users) == 1:
+                accumulators, factor = users[0]
+                get = accumulators.get
+                for doc_idx, tf in word_postings:
+                    accumulators[doc_idx] = get(doc_idx, 0.0) + factor * tf
+                continue
+            for doc_idx, tf in word_postings:
+                for accumulators, factor in users:
+                    accumulators[doc_idx] = accumulators.get(doc_idx, 0.0) + factor * tf
+        
+        for (_, query_norm, top_k, top_hits), accumulators in zip(plans, all_accumulators):
+            if accumulators:
+                self._push_hits(segment, accumulators, query_norm, top_k, top_hits, offset)
+    
+    def _score_segment(self, segment: IndexSegment, query_factors: Dict[str, float], query_norm: float,
+                       idf_scores: Mapping[str, float], top_k: int, top_hits: List, offset: int, exhaustive: bool,
+                       allowed: Optional[AllowedDocs] = None, after: Optional[Tuple[float, int]] = None):
+        """Chấm điểm một segment term-at-a-time và đưa kết quả vào heap top_hits
+
+        Term được xử lý theo _term_order (cận trên điểm giảm dần, MaxScore). Khi tổng cận trên của
+        các term còn lại nhỏ hơn điểm thứ top_k hiện có, không document mới nào có thể
+        vào top_k: chỉ cập nhật các document đang xét và loại dần các document không
+        thể vượt ngưỡng. Thứ tự cộng điểm giống nhau ở mọi chế độ nên điểm giống hệt
+        khi chấm toàn bộ. Với allowed, chỉ document thỏa mãn bộ lọc được đưa vào tính điểm.
+        Với after (phân trang), document xếp trước mốc không được tính vào ngưỡng top_k
+        trừ khi cận trên điểm của nó đã thấp hơn điểm của mốc.
+        """
+        postings = segment.postings
+        term_bounds = segment.term_bounds
+        doc_norms = segment.doc_norms
+        deleted = segment.deleted
+        
+        terms = []
+        for word, factor in query_factors.items():
+            word_postings = postings.get(word)
+            if word_postings:
+                bound = factor * term_bounds.get(word, 0.0) / query_norm
+                terms.append((self._term_order(word, idf_scores, term_bounds), bound, word_postings, factor))
+        if not terms:
+            return
+        terms.sort(key=itemgetter(0))
+        # remaining[i]: tổng cận trên điểm của term i và các term sau nó
+        remaining = list(itertools.accumulate(term[1] for term in reversed(terms)))[::-1]
+        
+        def partial_scores(accumulators):
+            """Điểm tối thiểu (chưa cộng các term còn lại) của các document đang xét"""
+            return [dot / (query_norm * doc_norms[doc_idx]) for doc_idx, dot in accumulators.items()]
+        
+        def kth_score(accumulators, partials, bound):
+            """Điểm thứ top_k trong các điểm tối thiểu đã biết (None nếu chưa đủ top_k document)"""
+            if deleted:
+                partials = [score for doc_idx, score in zip(accumulators, partials) if doc_idx not in deleted]
+            if after is not None:
+                # Chỉ document chắc chắn xếp sau mốc mới giữ chỗ trong top_k
+                partials = [score for score in partials if (score + bound) * (1 + PRUNING_EPSILON) < after[0]]
+            scores = heapq.nlargest(top_k, itertools.chain((hit[0] for hit in top_hits), partials))
+            return scores[-1] if len(scores) == top_k else None
+        
+        accumulators = {}
+        growing = True
+        for i, (_, _, word_postings, factor) in enumerate(terms):
+            bound = remaining[i] * (1 + PRUNING_EPSILON)
+            if growing and not exhaustive and len(accumulators) + len(top_hits) >= top_k:
+                partials = partial_scores(accumulators)
+                threshold = kth_score(accumulators, partials, bound)
+                if threshold is not None and bound < threshold:
+                    growing = False
+                    # Loại document mà kể cả khi có đủ các term còn lại vẫn không vượt ngưỡng
+                    cutoff = threshold / (1 + PRUNING_EPSILON) - bound
+                    accumulators = {
+                        doc_idx: dot for (doc_idx, dot), score in zip(accumulators.items(), partials)
+                        if score >= cutoff
+                    }
+            
+            if growing:
+                get = accumulators.get
+                if allowed is None:
+                    for doc_idx, tf in word_postings:
+                        accumulators[doc_idx] = get(doc_idx, 0.0) + factor * tf
+                elif len(allowed) * 16 < len(word_postings):
+                    # Bộ lọc chọn ít document: tìm nhị phân từng document được phép trong postings
+                    lo = 0
+                    for doc_idx in allowed.ids:
+                        lo = bisect_left(word_postings, doc_idx, lo, key=itemgetter(0))
+                        if lo == len(word_postings):
+                            break
+                        if word_postings[lo][0] == doc_idx:
+                            accumulators[doc_idx] = get(doc_idx, 0.0) + factor * word_postings[lo][1]
+                else:
+                    mask = allowed.mask
+                    for doc_idx, tf in word_postings:
+                        if mask[doc_idx]:
+                            accumulators[doc_idx] = get(doc_idx, 0.0) + factor * tf
+                continue
+            
+            if not accumulators:
+                break
+            if len(accumulators) * 16 < len(word_postings):
+                # Ít document còn lại: tìm nhị phân trong postings (đã sắp theo doc_idx)
+                lo = 0
+                for doc_idx in sorted(accumulators):
+                    lo = bisect_left(word_postings, doc_idx, lo, key=itemgetter(0))
+                    if lo < len(word_postings) and word_postings[lo][0] == doc_idx:
+                        accumulators[doc_idx] += factor * word_postings[lo][1]
+            else:
+                for doc_idx, tf in word_postings:
+                    if doc_idx in accumulators:
+                        accumulators[doc_idx] += factor * tf
+        
+        self._push_hits(segment, accumulators, query_norm, top_k, top_hits, offset, after)
     
     def get_stats(self) -> Dict:
-        """Lấy thống kê về search engine"""
-        if not self.tf_idf_matrix:
+        """Lấy thống kê về search engine
+
+        Thống kê của index (kể cả memory_usage(), phải duyệt từ điển term) được tính một
+        lần cho mỗi generation; chỉ thống kê của backend chấm điểm (ma trận được tạo dần
+        khi có query) được lấy mới mỗi lần gọi.
+        """
+        with self._write_lock:
+            segments, generation, cached = self.segments, self.generation, self._stats
+        if not segments:
             return {"status": "Index chưa được xây dựng"}
         
-        return {
-            "total_documents": len(self.documents),
-            "vocabulary_size": len(self.vocabulary),
-            "sample_features": list(self.vocabulary)[:10] if self.vocabulary else []
-        }
+        if cached is None or cached[0] != generation:
+            cached = (generation, {
+                "total_documents": sum(segment.live_count for segment in segments),
+                "vocabulary_size": len(self.vocabulary),
+                "sample_features": list(itertools.islice(self.vocabulary, 10)),
+                "segments": len(segments),
+                "deleted_documents": sum(len(segment.deleted) for segment in segments),
+                "duplicates": self.duplicate_stats(),
+                "suggestions": len(self.suggestions),
+                "generation": generation,
+                "scoring_backend": self.scoring_backend,
+                "field_scoring": self.field_scoring.to_dict(),
+                "memory_bytes": self.memory_usage()
+            })
+            self._stats = cached
+        # Bản sao nông: nơi gọi có thể thêm trường vào thống kê trả về
+        stats = dict(cached[1])
+        if self._scoring_backend is not None:
+            stats["scoring_backend_stats"] = self._scoring_backend.stats()
+        return stats
+    
+    def duplicate_stats(self) -> Dict[str, int]:
+        """Số bài có bản sao và số bản sao đã được gộp (không index)"""
+        duplicates = self.duplicates
+        return {"clusters": len(duplicates), "collapsed": sum(len(variants) for variants in duplicates.values())}
+    
+    def memory_usage(self) -> Dict[str, int]:
+        """Số byte của từng cấu trúc index trong bộ nhớ (không tính documents)
+
+        Với index nạp từ snapshot, postings/IDF/norm nằm trong memory-map và được
+        hệ điều hành nạp theo trang khi cần.
+        """
+        with self._write_lock:
+            segments, idf_scores, suggestions = self.segments, self.idf_scores, self.suggestions
+        usage = idf_scores.memory_usage()
+        usage['suggestions'] = suggestions.memory_usage()
+        for segment in segments:
+            for name, size in segment.memory_usage(idf_scores.term_ids).items():
+                usage[name] = usage.get(name, 0) + size
+        if self._snapshot is not None:
+            usage['snapshot_mapped'] = len(self._snapshot)
+        usage['total'] = sum(size for name, size in usage.items() if name != 'snapshot_mapped')
+        return usage
 
 # Test simple search engine
 if __name__ == "__main__":
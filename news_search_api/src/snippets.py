@@ -0,0 +1,199 @@
+"""
+Đoạn trích (snippet) theo query cho kết quả tìm kiếm
+
+Khi build index, content của mỗi document được chia thành các đoạn (passage):
+tách theo câu / xuống dòng, đoạn dài hơn PASSAGE_MAX_LENGTH ký tự được cắt tiếp
+ở khoảng trắng. Với mỗi đoạn chỉ lưu hai số: vị trí byte (UTF-8) của đầu đoạn
+trong content và vị trí (như vị trí của từ trong PostingPositions) của từ đầu
+tiên trong đoạn.
+
+Khi trả kết quả, vị trí của các từ trong query trong document (lấy từ postings)
+cho biết chúng rơi vào đoạn nào; đoạn có tổng trọng số các từ khác nhau lớn
+nhất được chọn, chỉ phần content từ đầu đoạn (tối đa SNIPPET_LENGTH ký tự) được
+đọc và tách từ để đánh dấu. Thời gian phụ thuộc số lần xuất hiện của từ trong
+query và độ dài snippet, không phụ thuộc độ dài bài báo.
+"""
+
+import re
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+from src.basic_text_processor import WORD_RE
+from src.document_store import PREVIEW_LENGTH
+
+# Độ dài (ký tự) tối đa của snippet, bằng độ dài preview
+SNIPPET_LENGTH = PREVIEW_LENGTH
+# Đoạn dài hơn được cắt ở khoảng trắng để snippet từ đầu đoạn luôn chứa trọn đoạn
+PASSAGE_MAX_LENGTH = 150
+# Lần xuất hiện thêm của cùng một từ trong đoạn được tính với hệ số này
+REPEAT_WEIGHT = 0.1
+# Số byte UTF-8 tối đa của một ký tự
+_MAX_CHAR_BYTES = 4
+
+# Ký tự ngoài BMP, chiếm hai đơn vị UTF-16
+_ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+
+# Đầu câu (sau dấu kết thúc câu và khoảng trắng) hoặc đầu dòng
+_PASSAGE_BREAK_RE = re.compile(r'[.!?…]\s+|\n\s*')
+
+
+def content_passages(text_processor, content: str,
+                     first_position: int) -> Tuple[List[int], List[int], List[str]]:
+    """(vị trí byte, vị trí từ đầu tiên) của từng đoạn trong content và các từ của content
+    (text_processor.split_words(), dùng lại cho document_positions() để không tách từ hai lần)
+
+    first_position: vị trí của từ đầu tiên của content (text_processor.content_start())
+    """
+    if not content:
+        return [], [], []
+    starts = [0]
+    for match in _PASSAGE_BREAK_RE.finditer(content):
+        if match.end() < len(content):
+            starts.append(match.end())
+    starts.append(len(content))
+
+    bounded = []
+    for start, end in zip(starts, starts[1:]):
+        while end - start > PASSAGE_MAX_LENGTH:
+            # Cắt ở khoảng trắng nên không tách đôi một từ
+            cut = content.rfind(' ', start + 1, start + PASSAGE_MAX_LENGTH)
+            if cut < 0:
+                cut = content.find(' ', start + PASSAGE_MAX_LENGTH, end)
+                if cut < 0:
+                    break
+            bounded.append(start)
+            start = cut + 1
+        bounded.append(start)
+
+    words, counts = text_processor.split_words(content, bounded)
+    if counts is None:
+        # Không biết vị trí từ của từng đoạn: chỉ giữ một đoạn (snippet là đầu content)
+        return [0], [first_position], words
+    byte_starts = []
+    byte_position = 0
+    for start, end in zip(bounded, bounded[1:] + [len(content)]):
+        byte_starts.append(byte_position)
+        byte_position += len(content[start:end].encode('utf-8'))
+    return byte_starts, [first_position + count for count in counts], words
+
+
+class PassageIndex:
+    """Đầu các đoạn của từng document: đoạn của document i là các phần tử
+    [offsets[i], offsets[i + 1]) của byte_starts (uint32) và word_starts (uint32)"""
+
+    def __init__(self, offsets, byte_starts, word_starts):
+        self.offsets = offsets
+        self.byte_starts = byte_starts
+        self.word_starts = word_starts
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, doc_idx: int) -> Tuple[Sequence[int], Sequence[int]]:
+        """(vị trí byte, vị trí từ đầu tiên) của các đoạn của document"""
+        start, end = self.offsets[doc_idx], self.offsets[doc_idx + 1]
+        return self.byte_starts[start:end], self.word_starts[start:end]
+
+    def nbytes(self) -> int:
+        return sum(len(values) * values.itemsize for values in (self.offsets, self.byte_starts, self.word_starts))
+
+
+class PassageIndexWriter:
+    """Ghi đoạn của từng document theo thứ tự doc_idx rồi tạo PassageIndex"""
+
+    def __init__(self):
+        self.offsets = array('Q', [0])
+        self.byte_starts = array('I')
+        self.word_starts = array('I')
+
+    def add(self, byte_starts: Sequence[int], word_starts: Sequence[int]):
+        self.byte_starts.extend(byte_starts)
+        self.word_starts.extend(word_starts)
+        self.offsets.append(len(self.byte_starts))
+
+    def add_from(self, passages: PassageIndex, doc_idx: int):
+        self.add(*passages.get(doc_idx))
+
+    def extend(self, counts: Sequence[int], byte_starts: Sequence[int], word_starts: Sequence[int]):
+        """Thêm nhiều document, counts là số đoạn của từng document"""
+        self.byte_starts.extend(byte_starts)
+        self.word_starts.extend(word_starts)
+        total = self.offsets[-1]
+        for count in counts:
+            total += count
+            self.offsets.append(total)
+
+    def finish(self) -> PassageIndex:
+        return PassageIndex(self.offsets, self.byte_starts, self.word_starts)
+
+
+def best_passage(word_starts: Sequence[int], term_positions: Mapping[str, Sequence[int]],
+                 weights: Mapping[str, float]) -> int:
+    """Đoạn có tổng trọng số các từ khác nhau lớn nhất (cùng điểm: đoạn đứng trước)
+
+    term_positions: vị trí trong document của các từ trong query; vị trí trước
+    đoạn đầu tiên (title) bị bỏ qua.
+    """
+    if not len(word_starts):
+        return 0
+    first = word_starts[0]
+    scores = {}
+    for word, positions in term_positions.items():
+        weight = weights[word]
+        seen = set()
+        for position in positions:
+            if position < first:
+                continue
+            passage = bisect_right(word_starts, position) - 1
+            scores[passage] = scores.get(passage, 0.0) + (weight * REPEAT_WEIGHT if passage in seen else weight)
+            seen.add(passage)
+    if not scores:
+        return 0
+    return min(scores, key=lambda passage: (-scores[passage], passage))
+
+
+def _utf16_offsets(text: str, highlights: List[List[int]]) -> List[List[int]]:
+    """Đổi vị trí ký tự (code point) trong text sang vị trí theo đơn vị UTF-16
+
+    Ký tự ngoài BMP (emoji, ...) chiếm hai đơn vị trong chuỗi của JavaScript.
+    """
+    units = [0]
+    for char in text:
+        units.append(units[-1] + (2 if ord(char) > 0xFFFF else 1))
+    return [[units[start], units[end]] for start, end in highlights]
+
+
+def make_snippet(data: bytes, words, truncated_start: bool, more: bool) -> Dict:
+    """Snippet từ đoạn content data (UTF-8, có thể bị cắt giữa một ký tự ở cuối)
+
+    Returns:
+        {'text': đoạn trích, 'highlights': [[đầu, cuối], ...] vị trí (cuối không tính)
+        trong text của các từ thuộc words}; text có '...' ở đầu / cuối nếu content còn
+        phần trước / sau (more: data chưa tới cuối content). Vị trí tính theo đơn vị
+        UTF-16 như String của JavaScript (text.slice(đầu, cuối) là từ được đánh dấu).
+    """
+    text = data.decode('utf-8', errors='ignore')
+    if len(text) > SNIPPET_LENGTH:
+        cut = text.rfind(' ', 0, SNIPPET_LENGTH + 1)
+        text = text[:cut if cut > 0 else SNIPPET_LENGTH]
+        more = True
+    text = text.strip()
+    prefix = '...' if truncated_start else ''
+    lowered = text.lower()
+    highlights = []
+    # Chữ thường có thể dài hơn với một số ký tự hiếm, khi đó bỏ qua đánh dấu
+    if len(lowered) == len(text):
+        offset = len(prefix)
+        highlights = [[match.start() + offset, match.end() + offset]
+                      for match in WORD_RE.finditer(lowered) if match.group() in words]
+    text = prefix + text + ('...' if more else '')
+    if highlights and _ASTRAL_RE.search(text):
+        highlights = _utf16_offsets(text, highlights)
+    return {'text': text, 'highlights': highlights}
+
+
+def snippet_range(byte_starts: Sequence[int], passage: int) -> Tuple[int, int]:
+    """Khoảng byte của content cần đọc cho snippet bắt đầu từ đầu đoạn passage"""
+    start = byte_starts[passage]
+    return start, start + SNIPPET_LENGTH * _MAX_CHAR_BYTES
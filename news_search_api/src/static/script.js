@@ -10,10 +10,15 @@ const noResults = document.getElementById('noResults');
 const suggestionTags = document.querySelectorAll('.suggestion-tag');
 const totalDocs = document.getElementById('totalDocs');
 const vocabSize = document.getElementById('vocabSize');
+const autocompleteList = document.getElementById('autocompleteList');
 
 // API Base URL
 const API_BASE_URL = '/api';
 
+// Autocomplete state: pending request and highlighted suggestion
+let suggestController = null;
+let activeSuggestion = -1;
+
 // Initialize app
 document.addEventListener('DOMContentLoaded', function() {
     loadStats();
@@ -38,9 +43,110 @@ function setupEventListeners() {
     searchInput.addEventListener('keypress', function(e) {
         if (e.key === 'Enter') {
             e.preventDefault();
-            handleSearch(e);
+            const active = autocompleteList.querySelector('.autocomplete-item.active');
+            if (active) {
+                selectSuggestion(active.dataset.query);
+            } else {
+                hideSuggestions();
+                handleSearch(e);
+            }
         }
     });
+    
+    // Autocomplete while typing
+    searchInput.addEventListener('input', function() {
+        loadSuggestions(this.value);
+    });
+    searchInput.addEventListener('keydown', handleSuggestionKeys);
+    searchInput.addEventListener('blur', function() {
+        // Delay so that a click on a suggestion is handled first
+        setTimeout(hideSuggestions, 150);
+    });
+}
+
+// Fetch suggestions for the text being typed (one request per keystroke)
+async function loadSuggestions(text) {
+    if (suggestController) {
+        suggestController.abort();
+    }
+    if (!text.trim()) {
+        hideSuggestions();
+        return;
+    }
+    
+    suggestController = new AbortController();
+    try {
+        const response = await fetch(`${API_BASE_URL}/suggest?q=${encodeURIComponent(text)}&limit=8`, {
+            signal: suggestController.signal
+        });
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        if (data.success && searchInput.value === text) {
+            displaySuggestions(data.suggestions);
+        }
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error('Suggest error:', error);
+        }
+    }
+}
+
+// Display autocomplete suggestions under the search input
+function displaySuggestions(suggestions) {
+    autocompleteList.innerHTML = '';
+    activeSuggestion = -1;
+    
+    if (!suggestions || suggestions.length === 0) {
+        hideSuggestions();
+        return;
+    }
+    
+    suggestions.forEach(suggestion => {
+        const item = document.createElement('li');
+        item.className = 'autocomplete-item';
+        item.setAttribute('role', 'option');
+        item.dataset.query = suggestion.text;
+        item.innerHTML = `
+            <span>${escapeHtml(suggestion.text)}</span>
+            <span class="autocomplete-count">${suggestion.documents} bài</span>
+        `;
+        item.addEventListener('mousedown', function(e) {
+            e.preventDefault();
+            selectSuggestion(suggestion.text);
+        });
+        autocompleteList.appendChild(item);
+    });
+    autocompleteList.classList.add('show');
+}
+
+// Arrow keys move through suggestions, Escape closes the list
+function handleSuggestionKeys(e) {
+    const items = autocompleteList.querySelectorAll('.autocomplete-item');
+    if (!autocompleteList.classList.contains('show') || items.length === 0) {
+        return;
+    }
+    
+    if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+        e.preventDefault();
+        const step = e.key === 'ArrowDown' ? 1 : -1;
+        activeSuggestion = (activeSuggestion + step + items.length) % items.length;
+        items.forEach((item, index) => item.classList.toggle('active', index === activeSuggestion));
+    } else if (e.key === 'Escape') {
+        hideSuggestions();
+    }
+}
+
+function selectSuggestion(query) {
+    searchInput.value = query;
+    hideSuggestions();
+    performSearch(query);
+}
+
+function hideSuggestions() {
+    autocompleteList.classList.remove('show');
+    activeSuggestion = -1;
 }
 
 // Handle search form submission
@@ -64,16 +170,8 @@ async function performSearch(query) {
         hideResults();
         
         // Make API request
-        const response = await fetch(`${API_BASE_URL}/search`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                query: query,
-                limit: 10
-            })
-        });
+        // GET để trình duyệt lưu kết quả và hỏi lại bằng If-None-Match (server trả 304 nếu index không đổi)
+        const response = await fetch(`${API_BASE_URL}/search?q=${encodeURIComponent(query)}&limit=10`);
         
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
@@ -156,13 +254,14 @@ function createNewsItem(item) {
         </div>
         
         <div class="news-content">
-            ${escapeHtml(item.content)}
+            ${item.snippet ? renderSnippet(item.snippet) : escapeHtml(item.content)}
         </div>
         
         <div class="news-meta">
             <div class="news-tags">
                 <span class="news-topic">${escapeHtml(item.topic)}</span>
                 <span class="news-source">${escapeHtml(item.source)}</span>
+                ${item.duplicate_count ? `<span class="news-source" title="${escapeHtml(item.duplicates.map(dup => dup.source).join(', ')).replace(/"/g, '&quot;')}">+${item.duplicate_count} bài tương tự</span>` : ''}
             </div>
             <div class="news-date">
                 ${formattedDate}
@@ -233,6 +332,17 @@ function escapeHtml(text) {
     return div.innerHTML;
 }
 
+// Snippet với các từ khớp query được bọc trong <mark> (highlights tính theo đơn vị UTF-16 như slice())
+function renderSnippet(snippet) {
+    let html = '';
+    let last = 0;
+    snippet.highlights.forEach(([start, end]) => {
+        html += escapeHtml(snippet.text.slice(last, start)) + '<mark>' + escapeHtml(snippet.text.slice(start, end)) + '</mark>';
+        last = end;
+    });
+    return html + escapeHtml(snippet.text.slice(last));
+}
+
 // Add some interactive effects
 document.addEventListener('DOMContentLoaded', function() {
     // Add hover effects to suggestion tags
@@ -0,0 +1,207 @@
+"""
+Gợi ý hoàn thành query theo tiền tố (autocomplete) cho /api/suggest
+
+SuggestIndex chứa các từ trong vocabulary và các cụm từ 2-3 từ hay gặp trong
+title, mỗi mục có trọng số là số document chứa nó. Cấu trúc là một trie nén
+trên các key đã sắp xếp:
+- mọi key có cùng tiền tố nằm trong một khoảng liên tiếp (một nút của trie),
+  tìm bằng tìm kiếm nhị phân
+- nút có nhiều hơn DENSE_NODE_SIZE key lưu sẵn top SUGGEST_TOP_K key theo trọng
+  số (tra bằng dict tiền tố -> nút), nút nhỏ hơn được xếp hạng trực tiếp trên
+  khoảng key của nó
+nên một lần tra cứu tốn một lần tra dict, hoặc hai lần bisect cộng không quá
+DENSE_NODE_SIZE phép so sánh, không phụ thuộc kích thước vocabulary.
+"""
+
+import heapq
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Iterable, List, Mapping, Set, Tuple
+
+from src.index_segment import _nbytes
+
+# Số gợi ý tối đa của một tiền tố
+SUGGEST_TOP_K = 10
+# Nút có nhiều key hơn ngưỡng này lưu sẵn top SUGGEST_TOP_K
+DENSE_NODE_SIZE = 64
+# Số từ của cụm từ lấy từ title
+PHRASE_SIZES = (2, 3)
+# Chỉ gợi ý từ / cụm từ xuất hiện trong ít nhất chừng này document
+MIN_SUGGEST_DF = 2
+# Số cụm từ tối đa trong index gợi ý
+MAX_PHRASES = 100000
+# Số cụm từ ứng viên tối đa được đếm khi build (xem PhraseCounter)
+MAX_PHRASE_CANDIDATES = 1000000
+
+# Lớn hơn mọi ký tự có thể có trong key: các key bắt đầu bằng p nằm trong [p, p + _MAX_CHAR)
+_MAX_CHAR = chr(sys.maxunicode)
+
+
+def title_phrases(text_processor, title: str) -> Set[str]:
+    """Các cụm từ PHRASE_SIZES từ liên tiếp trong title (chữ thường, bỏ dấu câu)
+
+    Cụm từ có thể chứa stop word ở giữa nhưng từ đầu và từ cuối phải là từ được
+    đánh index (không phải stop word, dài ít nhất 2 ký tự).
+    """
+    words = text_processor.clean_text(title).split()
+    stop_words = text_processor.stop_words
+    edges = [len(word) >= 2 and word not in stop_words for word in words]
+    phrases = set()
+    for size in PHRASE_SIZES:
+        for start in range(len(words) - size + 1):
+            if edges[start] and edges[start + size - 1]:
+                phrases.add(' '.join(words[start:start + size]))
+    return phrases
+
+
+def normalize_prefix(text_processor, text: str) -> str:
+    """Tiền tố đã chuẩn hóa như key của SuggestIndex, giữ một khoảng trắng ở cuối
+    nếu người dùng đã gõ xong một từ ('giá ' chỉ gợi ý các cụm từ bắt đầu bằng 'giá')"""
+    prefix = text_processor.clean_text(text)
+    if prefix and text[-1:].isspace():
+        prefix += ' '
+    return prefix
+
+
+class PhraseCounter:
+    """Đếm số title chứa từng cụm từ khi build index
+
+    Khi số cụm từ vượt max_phrases, các cụm từ ít gặp nhất bị bỏ (lossy counting)
+    để bộ nhớ không tăng theo kích thước corpus: số đếm chính xác nếu corpus nhỏ,
+    với corpus lớn cụm từ bị bỏ rồi gặp lại được đếm từ đầu.
+    """
+
+    def __init__(self, max_phrases: int = MAX_PHRASE_CANDIDATES):
+        self.max_phrases = max_phrases
+        self.counts = Counter()
+
+    def update(self, counts: Iterable[str]):
+        self.counts.update(counts)
+        if len(self.counts) > self.max_phrases:
+            self._prune()
+
+    def _prune(self):
+        """Giữ lại không quá max_phrases / 2 cụm từ có số đếm cao nhất"""
+        histogram = Counter(self.counts.values())
+        remaining = len(self.counts)
+        floor = 0
+        for count in sorted(histogram):
+            if remaining <= self.max_phrases // 2:
+                break
+            remaining -= histogram[count]
+            floor = count
+        self.counts = Counter({phrase: count for phrase, count in self.counts.items() if count > floor})
+
+
+class SuggestIndex:
+    """Trie nén trên các key (từ, cụm từ) đã sắp xếp kèm trọng số, xem đầu module"""
+
+    def __init__(self, keys: List[str], weights, prefixes: List[str], node_offsets, node_top):
+        # Key sắp theo thứ tự từ điển và trọng số (số document) tương ứng
+        self.keys = keys
+        self.weights = weights
+        # Nút lớn: tiền tố -> nút, top key của nút n: node_top[node_offsets[n]:node_offsets[n + 1]]
+        self.prefixes = prefixes
+        self.nodes = {prefix: node for node, prefix in enumerate(prefixes)}
+        self.node_offsets = node_offsets
+        self.node_top = node_top
+
+    @classmethod
+    def build(cls, entries: Mapping[str, int]) -> 'SuggestIndex':
+        keys = sorted(entries)
+        weights = array('I', (entries[key] for key in keys))
+        nodes = {}
+
+        def rank(candidates):
+            return heapq.nsmallest(SUGGEST_TOP_K, candidates, key=lambda i: (-weights[i], i))
+
+        def visit(prefix: str, lo: int, hi: int) -> List[int]:
+            """Top key của khoảng [lo, hi) (các key bắt đầu bằng prefix), ghi lại nút lớn"""
+            if hi - lo <= DENSE_NODE_SIZE:
+                return rank(range(lo, hi))
+            # Top của nút được gộp từ top của các nút con (mỗi ký tự tiếp theo một nút)
+            depth = len(prefix)
+            candidates = []
+            if len(keys[lo]) == depth:
+                candidates.append(lo)
+                lo += 1
+            while lo < hi:
+                child = keys[lo][:depth + 1]
+                end = bisect_left(keys, child + _MAX_CHAR, lo, hi)
+                candidates.extend(visit(child, lo, end))
+                lo = end
+            nodes[prefix] = top = rank(candidates)
+            return top
+
+        if keys:
+            visit('', 0, len(keys))
+        node_offsets = array('Q', [0])
+        node_top = array('I')
+        for top in nodes.values():
+            node_top.extend(top)
+            node_offsets.append(len(node_top))
+        return cls(keys, weights, list(nodes), node_offsets, node_top)
+
+    @classmethod
+    def from_counts(cls, doc_freq: Mapping[str, int], phrases: Mapping[str, int],
+                    min_df: int = MIN_SUGGEST_DF) -> 'SuggestIndex':
+        """Index gợi ý từ document frequency của các từ và số title chứa từng cụm từ"""
+        entries = {word: df for word, df in doc_freq.items() if df >= min_df}
+        frequent = heapq.nlargest(MAX_PHRASES, ((count, phrase) for phrase, count in phrases.items()
+                                                if count >= min_df))
+        entries.update((phrase, count) for count, phrase in frequent)
+        return cls.build(entries)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def items(self) -> Iterable[Tuple[str, int]]:
+        return zip(self.keys, self.weights)
+
+    def complete(self, prefix: str, limit: int = SUGGEST_TOP_K) -> List[int]:
+        """Vị trí các key bắt đầu bằng prefix, trọng số giảm dần (cùng trọng số theo thứ tự từ điển)"""
+        limit = min(limit, SUGGEST_TOP_K)
+        node = self.nodes.get(prefix)
+        if node is not None:
+            return list(self.node_top[self.node_offsets[node]:self.node_offsets[node + 1]][:limit])
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _MAX_CHAR, lo)
+        weights = self.weights
+        return heapq.nsmallest(limit, range(lo, hi), key=lambda i: (-weights[i], i))
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_TOP_K) -> List[Tuple[str, int]]:
+        """Các gợi ý (key, trọng số) cho tiền tố đã chuẩn hóa (normalize_prefix)
+
+        Nếu chưa đủ limit gợi ý cho cả tiền tố, phần cuối dài nhất có gợi ý (bỏ dần
+        các từ đầu) được hoàn thành và ghép với phần đứng trước: 'tin bóng đ' ->
+        'tin bóng đá' qua cụm từ 'bóng đá'. Phần cuối phải dài ít nhất 2 ký tự.
+        """
+        if not prefix.strip():
+            return []
+        suggestions = [(self.keys[i], self.weights[i]) for i in self.complete(prefix, limit)]
+        head, tail = '', prefix
+        while len(suggestions) < limit and ' ' in tail.strip():
+            word, _, tail = tail.lstrip().partition(' ')
+            head += word + ' '
+            if len(tail.strip()) < 2:
+                break
+            completions = self.complete(tail, limit)
+            if not completions:
+                continue
+            seen = {key for key, _ in suggestions}
+            for i in completions:
+                key = head + self.keys[i]
+                if key not in seen:
+                    suggestions.append((key, self.weights[i]))
+                    if len(suggestions) >= limit:
+                        break
+            break
+        return suggestions
+
+    def memory_usage(self) -> int:
+        return (sys.getsizeof(self.keys) + sum(sys.getsizeof(key) for key in self.keys)
+                + _nbytes(self.weights) + sys.getsizeof(self.nodes)
+                + sum(sys.getsizeof(prefix) for prefix in self.prefixes)
+                + _nbytes(self.node_offsets) + _nbytes(self.node_top))
@@ -1,16 +1,97 @@
 """
 Module xử lý văn bản tiếng Việt cho hệ thống tìm kiếm tin tức
+
+Tách từ bằng underthesea chậm, nên khi tiền xử lý nhiều văn bản
+(VietnameseTextProcessor.tokenize_many) văn bản được gom thành batch, tách từ
+song song trên process pool và kết quả được lưu vào cache SQLite trên đĩa
+(SegmentationCache) theo hash của văn bản đã làm sạch: index lại một corpus
+không đổi hoặc ít thay đổi gần như không phải tách từ lại.
 """
 
+import hashlib
+import itertools
+import os
 import re
+import sqlite3
 import string
+from concurrent.futures import ProcessPoolExecutor
+import underthesea
 from underthesea import word_tokenize
-from typing import List, Set
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+# Phiên bản của bộ tách từ, thuộc key của cache: đổi phiên bản underthesea làm các mục cũ hết hiệu lực
+SEGMENTER_VERSION = f"underthesea-{getattr(underthesea, '__version__', 'unknown')}"
+# Số văn bản mỗi lượt tra / ghi cache, và mỗi batch gửi tới một process
+CACHE_BATCH_SIZE = 2000
+SEGMENT_BATCH_SIZE = 64
+# Dưới ngưỡng này (số văn bản cần tách), tách từ ngay trong process hiện tại
+PARALLEL_MIN_TEXTS = 200
+# Số tham số tối đa của một câu lệnh SQLite (giới hạn mặc định của các bản cũ là 999)
+SQLITE_MAX_VARIABLES = 900
+
+
+def _segment_texts(texts: Sequence[str]) -> List[List[str]]:
+    """Tách từ một batch văn bản đã làm sạch (chạy trong process của pool)"""
+    return [word_tokenize(text) for text in texts]
+
+
+def segmentation_key(clean_text: str) -> bytes:
+    """Key trong cache của một văn bản đã làm sạch"""
+    return hashlib.sha1(f'{SEGMENTER_VERSION}\0{clean_text}'.encode('utf-8')).digest()
+
+
+class SegmentationCache:
+    """Cache kết quả tách từ trên đĩa (SQLite): key -> danh sách token
+
+    Chỉ lưu kết quả tách từ (trước khi lọc stop words), nên đổi danh sách stop
+    words không làm cache hết hiệu lực. Mục của văn bản không còn trong corpus
+    không bị xóa; xóa file để làm trống cache.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS segments (key BLOB PRIMARY KEY, tokens TEXT NOT NULL)')
+        self._conn.commit()
+    
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, List[str]]:
+        """Các key có trong cache kèm danh sách token"""
+        found = {}
+        for start in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            chunk = keys[start:start + SQLITE_MAX_VARIABLES]
+            rows = self._conn.execute(
+                f"SELECT key, tokens FROM segments WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            for key, tokens in rows:
+                # Văn bản đã làm sạch không chứa xuống dòng, token được nối bằng '\n'
+                found[key] = tokens.split('\n') if tokens else []
+        return found
+    
+    def put_many(self, items: Iterable[Tuple[bytes, List[str]]]):
+        self._conn.executemany('INSERT OR REPLACE INTO segments (key, tokens) VALUES (?, ?)',
+                               ((key, '\n'.join(tokens)) for key, tokens in items))
+        self._conn.commit()
+    
+    def __len__(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+    
+    def close(self):
+        self._conn.close()
+    
+    def __enter__(self) -> 'SegmentationCache':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
 
 class VietnameseTextProcessor:
     def __init__(self):
         # Danh sách stop words tiếng Việt
         self.stop_words = self._load_vietnamese_stop_words()
+        # Số văn bản lấy từ cache / phải tách từ ở lần tokenize_many gần nhất
+        self.segmentation_stats = {'cached': 0, 'segmented': 0}
     
     def _load_vietnamese_stop_words(self) -> Set[str]:
         """Tải danh sách stop words tiếng Việt"""
@@ -68,13 +149,57 @@ class VietnameseTextProcessor:
         # Tách từ bằng underthesea
         tokens = word_tokenize(clean_text)
         
-        # Lọc bỏ stop words và từ có độ dài < 2
-        filtered_tokens = [
+        return self._filter_tokens(tokens)
+    
+    def _filter_tokens(self, tokens: List[str]) -> List[str]:
+        """Lọc bỏ stop words và từ có độ dài < 2"""
+        return [
             token for token in tokens 
             if token not in self.stop_words and len(token) >= 2
         ]
-        
-        return filtered_tokens
+    
+    def tokenize_many(self, texts: Iterable[str], workers: Optional[int] = None,
+                      cache: Optional[SegmentationCache] = None) -> Iterator[List[str]]:
+        """Tách từ nhiều văn bản, kết quả giống tokenize() và theo đúng thứ tự của texts
+
+        Văn bản được xử lý theo từng lượt CACHE_BATCH_SIZE: văn bản trùng nhau chỉ tách
+        một lần, văn bản có trong cache không phải tách lại, phần còn lại được tách
+        song song trên `workers` process (mặc định: số CPU) rồi ghi vào cache.
+        """
+        workers = workers or os.cpu_count() or 1
+        self.segmentation_stats = {'cached': 0, 'segmented': 0}
+        executor = None
+        try:
+            texts = iter(texts)
+            while True:
+                batch = [self.clean_text(text) if text else '' for text in itertools.islice(texts, CACHE_BATCH_SIZE)]
+                if not batch:
+                    break
+                keys = {text: segmentation_key(text) for text in batch if text}
+                found = cache.get_many(list(keys.values())) if cache is not None else {}
+                segmented = {text: found[key] for text, key in keys.items() if key in found}
+                missing = [text for text in keys if text not in segmented]
+                self.segmentation_stats['cached'] += len(segmented)
+                self.segmentation_stats['segmented'] += len(missing)
+                
+                if missing:
+                    batches = [missing[start:start + SEGMENT_BATCH_SIZE]
+                               for start in range(0, len(missing), SEGMENT_BATCH_SIZE)]
+                    if workers > 1 and len(missing) >= PARALLEL_MIN_TEXTS:
+                        if executor is None:
+                            executor = ProcessPoolExecutor(max_workers=workers)
+                        results = executor.map(_segment_texts, batches)
+                    else:
+                        results = map(_segment_texts, batches)
+                    segmented.update(zip(missing, itertools.chain.from_iterable(results)))
+                    if cache is not None:
+                        cache.put_many((keys[text], segmented[text]) for text in missing)
+                
+                for text in batch:
+                    yield self._filter_tokens(segmented[text]) if text else []
+        finally:
+            if executor is not None:
+                executor.shutdown()
     
     def preprocess_document(self, title: str, content: str) -> str:
         """Tiền xử lý document (kết hợp title và content)"""
@@ -87,6 +212,18 @@ class VietnameseTextProcessor:
         
         return ' '.join(all_tokens)
     
+    def preprocess_documents(self, documents: Iterable[Tuple[str, str]], workers: Optional[int] = None,
+                             cache: Optional[SegmentationCache] = None) -> Iterator[str]:
+        """Tiền xử lý nhiều document (title, content) như preprocess_document() qua tokenize_many()"""
+        def iter_texts():
+            for title, content in documents:
+                yield title
+                yield content
+        tokens = self.tokenize_many(iter_texts(), workers, cache)
+        # Token của title và content của một document nằm liền nhau
+        for title_tokens, content_tokens in zip(tokens, tokens):
+            yield ' '.join(title_tokens * 2 + content_tokens)
+    
     def preprocess_query(self, query: str) -> str:
         """Tiền xử lý query tìm kiếm"""
         tokens = self.tokenize(query)
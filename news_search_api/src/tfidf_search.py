@@ -3,15 +3,24 @@ TF-IDF Search Engine cho hệ thống tìm kiếm tin tức tiếng Việt
 """
 
 import json
+import time
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Tuple
-from text_processor import VietnameseTextProcessor
+from typing import List, Dict, Optional, Tuple
+from text_processor import SegmentationCache, VietnameseTextProcessor
 
 class TFIDFSearchEngine:
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None, segmentation_cache: Optional[str] = None):
+        """
+        Args:
+            workers: Số process dùng để tách từ khi build_index (mặc định: số CPU)
+            segmentation_cache: File SQLite lưu kết quả tách từ giữa các lần build_index
+                (None: không dùng cache)
+        """
         self.text_processor = VietnameseTextProcessor()
+        self.workers = workers
+        self.segmentation_cache = segmentation_cache
         self.vectorizer = TfidfVectorizer(
             max_features=10000,  # Giới hạn số features
             ngram_range=(1, 2),  # Sử dụng unigram và bigram
@@ -39,14 +48,20 @@ class TFIDFSearchEngine:
             return
         
         print("Đang xử lý văn bản...")
-        # Tiền xử lý tất cả documents
-        self.processed_docs = []
-        for doc in self.documents:
-            processed_doc = self.text_processor.preprocess_document(
-                doc.get('title', ''), 
-                doc.get('content', '')
-            )
-            self.processed_docs.append(processed_doc)
+        started = time.perf_counter()
+        # Tiền xử lý tất cả documents: tách từ theo batch trên nhiều process, bỏ qua văn bản đã có trong cache
+        cache = SegmentationCache(self.segmentation_cache) if self.segmentation_cache else None
+        try:
+            self.processed_docs = list(self.text_processor.preprocess_documents(
+                ((doc.get('title', ''), doc.get('content', '')) for doc in self.documents),
+                self.workers, cache
+            ))
+        finally:
+            if cache is not None:
+                cache.close()
+        stats = self.text_processor.segmentation_stats
+        print(f"Tách từ {stats['segmented']} văn bản, {stats['cached']} văn bản lấy từ cache "
+              f"({time.perf_counter() - started:.1f}s)")
         
         print("Đang tính toán TF-IDF matrix...")
         # Tính toán TF-IDF matrix
@@ -0,0 +1,75 @@
+"""
+Fixture dùng chung cho các test: search engine được build một lần từ data/sample_news.json
+
+Chạy từ thư mục news_search_api: python -m pytest -q tests
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.filter_index import SearchFilter, parse_time  # noqa: E402
+from src.simple_tfidf import SimpleTFIDFSearchEngine  # noqa: E402
+
+DATA_PATH = os.path.join(ROOT, 'data', 'sample_news.json')
+
+# Query mẫu: từ phổ biến, nhiều từ, cụm từ hiếm và query có ký tự đặc biệt
+QUERIES = [
+    'giá vàng',
+    'việt nam',
+    'cướp tiệm vàng',
+    'bóng đá',
+    'COVID-19 ca mắc',
+    'chứng khoán VN-Index',
+    'thời tiết hà nội',
+    'xuất khẩu gạo',
+]
+
+
+def build_engine(data_path=DATA_PATH, stop=None, **options):
+    """SimpleTFIDFSearchEngine đã build index (không in log), options như __init__"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = SimpleTFIDFSearchEngine(**options)
+        engine.load_data(data_path, stop=stop)
+        engine.build_index(workers=1)
+    return engine
+
+
+def filter_cases(documents):
+    """(bộ lọc, hàm kiểm tra document) theo topic phổ biến nhất, nguồn, khoảng thời gian và cả ba"""
+    topic = Counter(doc['topic'] for doc in documents if doc['topic']).most_common(1)[0][0]
+    # Nguồn có nhiều bài nhất trong topic đó, khoảng thời gian chứa một nửa số bài của topic
+    source = Counter(doc['source'] for doc in documents if doc['topic'] == topic).most_common(1)[0][0]
+    times = sorted(doc['crawled_at'] for doc in documents if doc['topic'] == topic and doc.get('crawled_at'))
+    crawled_from, crawled_to = times[len(times) // 4][:10], times[3 * len(times) // 4][:10]
+    in_range = lambda doc: parse_time(crawled_from) <= (parse_time(doc.get('crawled_at')) or -1) \
+        <= parse_time(crawled_to, end=True)
+    return [
+        # So khớp topic / source không phân biệt hoa thường
+        (SearchFilter.parse(topic), lambda doc: doc['topic'].lower() == topic.lower()),
+        (SearchFilter.parse(sources=[source, 'không tồn tại']), lambda doc: doc['source'].lower() == source.lower()),
+        (SearchFilter.parse(crawled_from=crawled_from, crawled_to=crawled_to), in_range),
+        (SearchFilter.parse(topic, source, crawled_from, crawled_to),
+         lambda doc: doc['topic'].lower() == topic.lower() and doc['source'].lower() == source.lower()
+         and in_range(doc)),
+    ]
+
+
+@pytest.fixture(scope='session')
+def documents():
+    with open(DATA_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='session')
+def engine():
+    """Engine backend python, không gộp bản sao (mọi document được index như trước đây)"""
+    return build_engine(scoring_backend='python', duplicate_threshold=None)
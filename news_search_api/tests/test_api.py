@@ -0,0 +1,146 @@
+"""
+Smoke test của API tìm kiếm: phân trang bằng cursor, ETag / 304 và lỗi từng query trong batch
+"""
+
+import gzip
+import json
+
+import pytest
+from flask import Flask
+
+from conftest import QUERIES, build_engine
+from src.metrics import SlowQueryLog
+from src.routes import search as search_routes
+
+API_CORPUS_SIZE = 300
+
+
+@pytest.fixture(scope='module')
+def api_engine():
+    return build_engine(stop=API_CORPUS_SIZE, scoring_backend='python')
+
+
+@pytest.fixture
+def client(api_engine, monkeypatch):
+    monkeypatch.setattr(search_routes, 'search_engine', api_engine)
+    monkeypatch.setattr(search_routes, 'index_read_only', False)
+    search_routes.search_cache.clear()
+    app = Flask(__name__)
+    app.register_blueprint(search_routes.search_bp, url_prefix='/api')
+    return app.test_client()
+
+
+def result_ids(response):
+    return [result['id'] for result in response.get_json()['results']]
+
+
+def test_cursor_paging(client, api_engine):
+    full = client.get('/api/search', query_string={'q': 'việt nam', 'limit': 12}).get_json()
+    assert full['success'] and len(full['results']) == 12
+
+    pages, cursor = [], None
+    for _ in range(3):
+        params = {'q': 'việt nam', 'limit': 4}
+        if cursor:
+            params['cursor'] = cursor
+        body = client.get('/api/search', query_string=params).get_json()
+        assert body['success']
+        pages.extend(result['id'] for result in body['results'])
+        cursor = body['next_cursor']
+        assert cursor
+    assert pages == [result['id'] for result in full['results']]
+
+    # Cursor chỉ dùng được cho đúng query, POST cho cùng kết quả với GET
+    other = client.get('/api/search', query_string={'q': 'bóng đá', 'cursor': cursor})
+    assert other.status_code == 400
+    posted = client.post('/api/search', json={'query': 'việt nam', 'limit': 4, 'cursor': cursor})
+    assert posted.status_code == 200
+
+    # Hết kết quả: next_cursor là None
+    body = client.get('/api/search', query_string={'q': 'việt nam', 'limit': 50}).get_json()
+    while body['next_cursor']:
+        body = client.get('/api/search', query_string={'q': 'việt nam', 'limit': 50,
+                                                       'cursor': body['next_cursor']}).get_json()
+    assert body['success']
+
+    # Cursor hết hạn khi index thay đổi
+    api_engine.upsert_documents([{'id': 'api-test', 'title': 'Tin thử nghiệm', 'content': 'Việt Nam'}])
+    expired = client.get('/api/search', query_string={'q': 'việt nam', 'limit': 4, 'cursor': cursor})
+    assert expired.status_code == 410
+    assert client.get('/api/search', query_string={'q': 'việt nam', 'cursor': 'không hợp lệ'}).status_code == 400
+
+
+def test_etag_not_modified(client, api_engine):
+    first = client.get('/api/search?q=giá vàng&limit=10')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/') and first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get('/api/search?q=giá vàng&limit=10', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+    # Cùng query sau khi chuẩn hóa
+    same = client.get('/api/search?q=GIÁ   Vàng&limit=10', headers={'If-None-Match': etag})
+    assert same.status_code == 304
+    other_limit = client.get('/api/search?q=giá vàng&limit=5', headers={'If-None-Match': etag})
+    assert other_limit.status_code == 200 and other_limit.headers['ETag'] != etag
+    head = client.head('/api/search?q=giá vàng&limit=10', headers={'If-None-Match': etag})
+    assert head.status_code == 304
+
+    # POST luôn trả nội dung, kể cả khi gửi kèm If-None-Match khớp
+    posted = client.post('/api/search', json={'query': 'giá vàng', 'limit': 10}, headers={'If-None-Match': etag})
+    assert posted.status_code == 200 and 'ETag' not in posted.headers
+    assert result_ids(posted) == result_ids(first)
+
+    api_engine.upsert_documents([{'id': 'etag-test', 'title': 'Giá vàng hôm nay', 'content': 'Giá vàng tăng'}])
+    changed = client.get('/api/search?q=giá vàng&limit=10', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert 'etag-test' in result_ids(changed)
+
+
+def test_compressed_response(client):
+    plain = client.get('/api/search?q=việt nam&limit=20')
+    compressed = client.get('/api/search?q=việt nam&limit=20', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+
+def test_search_batch_matches_search(api_engine):
+    queries = [(query, top_k) for query in QUERIES for top_k in (3, 10)]
+    batch = api_engine.search_batch(queries)
+    assert [[(doc['id'], score) for doc, score in results] for results in batch] == \
+           [[(doc['id'], score) for doc, score in api_engine.search(query, top_k)] for query, top_k in queries]
+
+
+def test_batch_item_errors(client):
+    response = client.post('/api/search/batch', json={
+        'queries': ['giá vàng', {'query': ''}, {'query': 'bóng đá', 'limit': 'nhiều'}, 42,
+                    {'query': 'giá vàng', 'limit': 3}],
+        'limit': 5
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] and body['total_queries'] == 5 and body['failed_queries'] == 3
+    results = body['results']
+    assert [result['success'] for result in results] == [True, False, False, False, True]
+    assert all(result['message'] for result in results[1:4])
+    single = client.get('/api/search?q=giá vàng&limit=5').get_json()
+    assert results[0]['results'] == single['results']
+    assert results[0]['next_cursor'] == single['next_cursor']
+    assert len(results[4]['results']) == 3
+
+    assert client.post('/api/search/batch', json={'queries': []}).status_code == 400
+    assert client.post('/api/search/batch', json={'queries': ['a'] * (search_routes.SEARCH_BATCH_MAX_QUERIES + 1)}
+                       ).status_code == 400
+
+
+def test_batch_slow_query_entry(client, monkeypatch):
+    log = SlowQueryLog(threshold_ms=0)
+    monkeypatch.setattr(search_routes, 'slow_query_log', log)
+    queries = ['giá vàng', 'bóng đá', 'việt nam', 'thời tiết', 'chứng khoán', 'xuất khẩu', 'công an']
+    assert client.post('/api/search/batch', json={'queries': queries}).status_code == 200
+    [entry] = log.entries()
+    assert entry['endpoint'] == 'search_batch'
+    shown = search_routes.SLOW_LOG_BATCH_QUERIES
+    assert entry['query'] == ' | '.join(queries[:shown]) + f' (+{len(queries) - shown})'
+    assert entry['scored_queries'] == len(queries)
@@ -0,0 +1,37 @@
+"""
+Thêm / cập nhật / xóa document không build lại index so với build lại toàn bộ
+"""
+
+import contextlib
+import io
+import json
+
+from conftest import QUERIES, build_engine
+
+CORPUS_SIZE = 200
+
+
+def hits(results):
+    return [(doc['id'], round(score, 9)) for doc, score in results]
+
+
+def test_updates_match_rebuild(tmp_path, documents):
+    initial, added = documents[:CORPUS_SIZE], documents[CORPUS_SIZE:CORPUS_SIZE + 30]
+    path = tmp_path / 'news.json'
+    path.write_text(json.dumps(initial, ensure_ascii=False), encoding='utf-8')
+    engine = build_engine(str(path), scoring_backend='python', duplicate_threshold=None)
+
+    updated = dict(initial[5], title='Giá vàng tăng mạnh', content='Giá vàng trong nước tăng mạnh hôm nay')
+    removed = [initial[0]['id'], initial[7]['id'], added[3]['id']]
+    engine.upsert_documents(added + [updated])
+    assert engine.delete_documents(removed + ['không tồn tại']) == removed
+    final = [updated if doc['id'] == updated['id'] else doc for doc in initial + added if doc['id'] not in removed]
+    assert engine.num_documents == len(final)
+    assert removed[0] not in {doc['id'] for doc, _ in engine.search(initial[0]['title'], 50)}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.merge_segments()
+    path.write_text(json.dumps(final, ensure_ascii=False), encoding='utf-8')
+    rebuilt = build_engine(str(path), scoring_backend='python', duplicate_threshold=None)
+    for query in QUERIES:
+        assert hits(engine.search(query, 20)) == hits(rebuilt.search(query, 20))
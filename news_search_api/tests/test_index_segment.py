@@ -0,0 +1,36 @@
+"""
+Thống kê build ghi tạm ra đĩa (DocStatsSpool) so với danh sách doc_stats trong bộ nhớ
+"""
+
+from src.index_segment import DocStatsSpool, IndexSegment
+from src.simple_tfidf import _preprocess_shard
+
+BATCH_SIZE = 37
+
+
+def test_spool_matches_doc_stats(documents):
+    texts = [(doc.get('title', ''), doc.get('content', '')) for doc in documents[:300]]
+    expected, spooled = [], DocStatsSpool()
+    position_data, position_lengths = bytearray(), []
+    for start in range(0, len(texts), BATCH_SIZE):
+        doc_stats, _, _, positions = _preprocess_shard(texts[start:start + BATCH_SIZE], True)
+        expected.extend(doc_stats)
+        position_data += positions[0]
+        position_lengths.extend(positions[1])
+        spooled.append(doc_stats, positions[:2])
+    # Đọc lại được nhiều lần, giữ thứ tự từ (title trước) và số đếm
+    for _ in range(2):
+        assert [(list(counts.items()), *rest) for counts, *rest in spooled] == \
+               [(list(counts.items()), *rest) for counts, *rest in expected]
+    assert len(spooled) == len(expected)
+    assert spooled.field_totals == (sum(stats[2] for stats in expected), sum(stats[3] for stats in expected))
+    data, lengths = spooled.positions()
+    assert bytes(data) == bytes(position_data) and list(lengths) == position_lengths
+
+    idf = {word: 1.0 for counts, *_ in expected for word in counts}
+    built = IndexSegment.build(documents[:300], expected, idf, positions=(position_data, position_lengths))
+    from_spool = IndexSegment.build(documents[:300], spooled, idf, positions=spooled.positions())
+    assert list(from_spool.doc_norms) == list(built.doc_norms)
+    assert from_spool.postings.raw_arrays()[1:] == built.postings.raw_arrays()[1:]
+    assert from_spool.positions.data == built.positions.data
+    spooled.close()
@@ -0,0 +1,212 @@
+"""
+Lưu / nạp snapshot index và build lại khi snapshot cũ hoặc hỏng
+"""
+
+import contextlib
+import io
+import json
+import os
+import zlib
+
+import pytest
+
+from conftest import QUERIES, build_engine
+from src.document_store import CHECKSUM_BLOCK_SIZE, BlockChecksums, DocumentStoreError
+from src.field_scoring import FieldScoring
+from src.index_snapshot import _HEADER, _SECTION, MAGIC, SECTIONS, SnapshotError, read_snapshot
+from src.routes import search as search_routes
+from src.simple_tfidf import SimpleTFIDFSearchEngine
+
+# Corpus nhỏ cho các test phải build lại index
+SMALL_CORPUS_SIZE = 150
+
+
+def load_engine(index_path, source_path=None, **options):
+    """(engine, kết quả load_index) của một engine mới"""
+    engine = SimpleTFIDFSearchEngine(scoring_backend='python', **options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        loaded = engine.load_index(index_path, source_path=source_path)
+    return engine, loaded
+
+
+def section_range(index_path, name):
+    """(offset, length) của một section trong file snapshot"""
+    with open(index_path, 'rb') as f:
+        f.seek(_HEADER.size + _SECTION.size * SECTIONS.index(name))
+        offset, length, _ = _SECTION.unpack(f.read(_SECTION.size))
+    return offset, length
+
+
+def damage_section(index_path, name):
+    """Đảo các byte ở giữa một section"""
+    offset, length = section_range(index_path, name)
+    assert length > 0
+    with open(index_path, 'r+b') as f:
+        f.seek(offset + length // 2)
+        data = f.read(4)
+        f.seek(offset + length // 2)
+        f.write(bytes(byte ^ 0xFF for byte in data))
+
+
+def results(engine, query, summary=False):
+    return [(doc['id'], score, doc.get('snippet')) for doc, score in engine.search(query, 10, summary=summary)]
+
+
+@pytest.fixture
+def small_corpus(tmp_path, documents):
+    path = tmp_path / 'news.json'
+    path.write_text(json.dumps(documents[:SMALL_CORPUS_SIZE], ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def small_snapshot(small_corpus):
+    engine = build_engine(small_corpus, scoring_backend='python')
+    index_path = os.path.splitext(small_corpus)[0] + '.idx'
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.save_index(index_path)
+    return engine, index_path
+
+
+def test_round_trip(engine, tmp_path, documents):
+    index_path = str(tmp_path / 'full.idx')
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.save_index(index_path)
+    loaded, ok = load_engine(index_path, duplicate_threshold=None)
+    assert ok
+    assert loaded.num_documents == len(documents)
+    assert set(loaded.vocabulary) == set(engine.vocabulary)
+    for query in QUERIES + ['"giá vàng"']:
+        assert results(loaded, query) == results(engine, query)
+        assert results(loaded, query, summary=True) == results(engine, query, summary=True)
+    assert loaded.suggest('giá') == engine.suggest('giá')
+    doc = loaded.search('giá vàng', 1)[0][0]
+    assert doc == next(original for original in documents if original['id'] == doc['id'])
+
+
+def test_round_trip_keeps_upserts(small_snapshot, documents):
+    engine, index_path = small_snapshot
+    document = dict(documents[0], id='test-upsert', title='Tin thử nghiệm snapshot', content='Nội dung thử nghiệm')
+    engine.upsert_documents([document])
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.save_index(index_path)
+    loaded, ok = load_engine(index_path)
+    assert ok
+    assert [doc['id'] for doc, _ in loaded.search('thử nghiệm snapshot', 1)] == ['test-upsert']
+
+
+def test_stale_snapshot_is_rejected(small_snapshot, small_corpus):
+    _, index_path = small_snapshot
+    assert load_engine(index_path, small_corpus)[1]
+    stat = os.stat(small_corpus)
+    os.utime(small_corpus, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    with pytest.raises(SnapshotError, match='cũ'):
+        read_snapshot(index_path, small_corpus)
+    assert not load_engine(index_path, small_corpus)[1]
+
+
+@pytest.mark.parametrize('damage', ['header', 'truncate', 'magic', 'empty'])
+def test_corrupt_snapshot_is_rejected(small_snapshot, damage):
+    _, index_path = small_snapshot
+    with open(index_path, 'rb') as f:
+        data = bytearray(f.read())
+    if damage == 'header':
+        data[_HEADER.size + 3] ^= 0xFF
+    elif damage == 'truncate':
+        data = data[:len(data) // 2]
+    elif damage == 'magic':
+        data[:len(MAGIC)] = b'X' * len(MAGIC)
+    else:
+        data = bytearray()
+    with open(index_path, 'wb') as f:
+        f.write(data)
+    with pytest.raises(SnapshotError):
+        read_snapshot(index_path)
+    assert not load_engine(index_path)[1]
+
+
+@pytest.mark.parametrize('name', ['vocabulary', 'idf', 'post_docs', 'post_content', 'norms', 'doc_offs',
+                                  'doc_ids', 'suggest_keys'])
+def test_corrupt_section_is_rejected(small_snapshot, name):
+    _, index_path = small_snapshot
+    damage_section(index_path, name)
+    with pytest.raises(SnapshotError, match=name):
+        read_snapshot(index_path)
+    assert not load_engine(index_path)[1]
+
+
+def test_corrupt_documents_detected_on_read(small_snapshot):
+    # Section docs không được kiểm tra khi nạp mà khi block chứa document được đọc
+    reference, index_path = small_snapshot
+    damage_section(index_path, 'docs')
+    engine, ok = load_engine(index_path)
+    assert ok
+    with pytest.raises(DocumentStoreError):
+        [engine.documents.summary(i) for i in range(len(engine.documents))]
+    # Không chép documents hỏng sang snapshot mới
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        engine.save_index(index_path + '.copy')
+    assert 'Lỗi khi lưu index' in output.getvalue()
+    assert not os.path.exists(index_path + '.copy') and not os.path.exists(index_path + '.copy.tmp')
+
+
+def test_stored_posting_weights(small_snapshot, small_corpus, monkeypatch):
+    reference, index_path = small_snapshot
+    bm25f = build_engine(small_corpus, scoring_backend='python', field_scoring=FieldScoring('bm25f'))
+
+    def posting_weights(self, *args):
+        calls.append(self)
+        return original(self, *args)
+
+    calls, original = [], FieldScoring.posting_weights
+    monkeypatch.setattr(FieldScoring, 'posting_weights', posting_weights)
+    # Cùng FieldScoring: dùng trọng số trong snapshot, không tính lại
+    engine, ok = load_engine(index_path)
+    assert ok and not calls
+    assert results(engine, 'giá vàng') == results(reference, 'giá vàng')
+    # FieldScoring khác: tính lại từ số đếm theo trường
+    engine, ok = load_engine(index_path, field_scoring=FieldScoring('bm25f'))
+    assert ok and calls
+    for query in QUERIES:
+        assert [(doc_id, pytest.approx(score)) for doc_id, score, _ in results(engine, query)] == \
+               [(doc_id, score) for doc_id, score, _ in results(bm25f, query)]
+
+
+def test_missing_snapshot_is_rejected(tmp_path):
+    assert not load_engine(str(tmp_path / 'missing.idx'))[1]
+
+
+def test_positions_required(small_corpus, tmp_path):
+    engine = build_engine(small_corpus, scoring_backend='python', positions=False)
+    index_path = str(tmp_path / 'no_positions.idx')
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.save_index(index_path)
+    assert load_engine(index_path, positions=False)[1]
+    assert not load_engine(index_path, positions=True)[1]
+
+
+def test_init_rebuilds_corrupt_snapshot(small_snapshot, small_corpus, monkeypatch):
+    reference, index_path = small_snapshot
+    with open(index_path, 'r+b') as f:
+        f.seek(-16, os.SEEK_END)
+        f.write(b'\xff' * 16)
+    monkeypatch.setenv('SEARCH_DATA_PATH', small_corpus)
+    monkeypatch.setattr(search_routes, 'SEARCH_BACKEND', 'python')
+    monkeypatch.setattr(search_routes, 'SEARCH_SHARDS', 0)
+    monkeypatch.setattr(search_routes, 'search_engine', None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        search_routes.init_search_engine()
+    engine = search_routes.search_engine
+    assert engine.num_documents == reference.num_documents
+    assert results(engine, 'giá vàng') == results(reference, 'giá vàng')
+    # Snapshot đã được ghi lại và dùng được
+    read_snapshot(index_path, small_corpus)
+
+
+def test_block_checksums_across_chunks():
+    data = bytes(range(256)) * (3 * CHECKSUM_BLOCK_SIZE // 256 + 7)
+    checksums = BlockChecksums()
+    for start in range(0, len(data), 300007):
+        checksums.update(data[start:start + 300007])
+    blocks = range(0, len(data), CHECKSUM_BLOCK_SIZE)
+    assert list(checksums.finish()) == [zlib.crc32(data[start:start + CHECKSUM_BLOCK_SIZE]) for start in blocks]
@@ -0,0 +1,121 @@
+"""
+Metrics và slow-query log khi nhiều process ghi vào cùng một thư mục (src/serve.py)
+"""
+
+import os
+import re
+
+import pytest
+
+from src.metrics import MetricsRegistry, SlowQueryLog, StageTimer
+
+
+def make_registry():
+    registry = MetricsRegistry()
+    latency = registry.histogram('test_latency_seconds', 'Latency', ['endpoint'], buckets=(0.1, 1.0))
+    requests = registry.counter('test_requests_total', 'Requests', ['result'])
+    return registry, latency, requests
+
+
+def sample(text, name):
+    match = re.search(rf'^{re.escape(name)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def run_in_child(function):
+    """Chạy function trong process con (fork) và chờ nó kết thúc"""
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            function()
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def slow_timer():
+    timer = StageTimer()
+    timer.mark('score')
+    return timer
+
+
+def test_local_render():
+    registry, latency, requests = make_registry()
+    latency.labels('search').observe(0.05)
+    latency.labels('search').observe(0.5)
+    requests.labels('hit').inc()
+    text = registry.render()
+    assert sample(text, 'test_latency_seconds_bucket{endpoint="search",le="0.1"}') == 1
+    assert sample(text, 'test_latency_seconds_bucket{endpoint="search",le="+Inf"}') == 2
+    assert sample(text, 'test_latency_seconds_count{endpoint="search"}') == 2
+    assert sample(text, 'test_requests_total{result="hit"}') == 1
+
+
+def test_slow_query_log_threshold(capsys):
+    log = SlowQueryLog(threshold_ms=60_000, max_entries=5)
+    assert not log.record('search', 'nhanh', slow_timer())
+    log.threshold_ms = 0
+    assert log.record('search', 'chậm', slow_timer(), limit=10)
+    [entry] = log.entries()
+    assert entry['query'] == 'chậm' and entry['limit'] == 10 and 'score' in entry['stages_ms']
+    # Chỉ ghi vào log, không in ra stdout
+    assert capsys.readouterr().out == ''
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='cần os.fork')
+def test_shared_metrics_sum_over_processes(tmp_path):
+    registry, latency, requests = make_registry()
+    # Số liệu của process chính trước khi fork được tính một lần
+    latency.labels('build').observe(2.0)
+    registry.share(str(tmp_path))
+
+    def worker(count, result):
+        def run():
+            registry.share(str(tmp_path), reset=True)
+            for _ in range(count):
+                latency.labels('search').observe(0.05)
+                requests.labels(result).inc()
+            # Chuỗi số liệu mới (nhiều bản ghi, file phải mở rộng)
+            for i in range(2000):
+                requests.labels(f'extra-{i}').inc()
+        return run
+
+    run_in_child(worker(3, 'hit'))
+    run_in_child(worker(4, 'miss'))
+    run_in_child(worker(5, 'hit'))
+
+    text = registry.render()
+    assert sample(text, 'test_latency_seconds_count{endpoint="build"}') == 1
+    assert sample(text, 'test_latency_seconds_count{endpoint="search"}') == 12
+    assert sample(text, 'test_latency_seconds_bucket{endpoint="search",le="0.1"}') == 12
+    assert sample(text, 'test_latency_seconds_sum{endpoint="search"}') == pytest.approx(0.6)
+    assert sample(text, 'test_requests_total{result="hit"}') == 8
+    assert sample(text, 'test_requests_total{result="miss"}') == 4
+    assert sample(text, 'test_requests_total{result="extra-1999"}') == 3
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='cần os.fork')
+def test_shared_slow_query_log(tmp_path):
+    log = SlowQueryLog(threshold_ms=0, max_entries=5)
+    log.share(str(tmp_path))
+
+    def worker(queries):
+        def run():
+            log.share(str(tmp_path), reset=True)
+            for query in queries:
+                log.record('search', query, slow_timer())
+        return run
+
+    run_in_child(worker(['a', 'b', 'c']))
+    run_in_child(worker(['d', 'e', 'f', 'g']))
+    assert log.total == 7
+    entries = log.entries()
+    assert len(entries) == 5
+    assert {entry['query'] for entry in entries} <= set('abcdefg')
+    # Query do các worker ghi (file riêng của từng worker), không phải của process chính
+    assert {'d', 'e', 'f', 'g'} & {entry['query'] for entry in entries}
+    assert all(entry['pid'] != os.getpid() for entry in entries)
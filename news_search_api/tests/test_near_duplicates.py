@@ -0,0 +1,78 @@
+"""
+Gom cụm bài gần trùng lặp (src/near_duplicates.py) và gộp bản sao khi build index
+"""
+
+import json
+
+import pytest
+
+from conftest import build_engine
+from src.near_duplicates import (DUPLICATE_THRESHOLD, NUM_HASHES, DuplicateClusters, document_signature,
+                                 similarity, variant_record)
+from src.simple_tfidf import SimpleTFIDFSearchEngine
+
+
+def variant(document, doc_id, replaced, source='Nguồn khác'):
+    """Bản đăng lại của document: `replaced` từ cuối content được thay"""
+    words = document['content'].split()
+    content = ' '.join(words[:len(words) - replaced] + ['đăng lại'] * replaced)
+    return dict(document, id=doc_id, content=content, source=source)
+
+
+def signatures(documents):
+    return [document_signature(doc.get('title', ''), doc.get('content', '')) for doc in documents]
+
+
+@pytest.fixture(scope='module')
+def corpus(documents):
+    """Bốn bài khác nhau, hai bản sao của bài thứ hai (một bản đứng trước nó) và một bản sao của bài cuối"""
+    first, second, third, fourth = documents[:4]
+    return [variant(second, 'early-copy', 5), first, second, third, variant(second, 'late-copy', 10),
+            fourth, dict(fourth, id='exact-copy')]
+
+
+def test_canonical_is_first_in_corpus(corpus):
+    clusters = DuplicateClusters.find(signatures(corpus))
+    # Bản đứng đầu corpus là bản chính, kể cả khi nó là bản đăng lại
+    assert clusters.canonical_of == {2: 0, 4: 0, 6: 5}
+    assert len(clusters) == 3
+    assert [doc['id'] for doc in clusters.split(corpus)] == [corpus[i]['id'] for i in (0, 1, 3, 5)]
+
+
+def test_pointers(corpus):
+    clusters = DuplicateClusters.find(signatures(corpus))
+    list(clusters.split(corpus))
+    assert clusters.pointers() == {
+        'early-copy': [variant_record(corpus[2]), variant_record(corpus[4])],
+        corpus[5]['id']: [variant_record(corpus[6])],
+    }
+    assert clusters.pointers()['early-copy'][1] == {
+        'id': 'late-copy', 'title': corpus[4]['title'], 'source': 'Nguồn khác',
+        'url': corpus[4]['url'], 'crawled_at': corpus[4]['crawled_at']}
+
+
+def test_threshold_is_respected(documents):
+    original = documents[0]
+    pair = [original, variant(original, 'copy', len(original['content'].split()) // 6)]
+    score = similarity(*signatures(pair))
+    assert 0.5 < score < 1
+    assert DuplicateClusters.find(signatures(pair), threshold=score).canonical_of == {1: 0}
+    # Ngay dưới ngưỡng: không gộp
+    assert not DuplicateClusters.find(signatures(pair), threshold=score + 1 / NUM_HASHES)
+    # Document không có từ nào không được so sánh
+    assert not DuplicateClusters.find([None, None], threshold=0)
+
+
+def test_engine_merges_only_when_enabled(corpus, tmp_path):
+    path = tmp_path / 'news.json'
+    path.write_text(json.dumps(corpus, ensure_ascii=False), encoding='utf-8')
+    # Mặc định không gộp
+    assert build_engine(str(path), scoring_backend='python').num_documents == len(corpus)
+    assert SimpleTFIDFSearchEngine().duplicate_threshold is None
+
+    engine = build_engine(str(path), scoring_backend='python', duplicate_threshold=DUPLICATE_THRESHOLD)
+    assert engine.num_documents == 4
+    hits = [doc for doc, _ in engine.search(corpus[2]['title'], 10)]
+    assert 'late-copy' not in {doc['id'] for doc in hits}
+    canonical = next(doc for doc in hits if doc['id'] == 'early-copy')
+    assert [record['id'] for record in canonical['duplicates']] == [corpus[2]['id'], 'late-copy']
@@ -0,0 +1,145 @@
+"""
+Xếp hạng của SimpleTFIDFSearchEngine so với cách chấm điểm ban đầu (cosine trên vector
+TF-IDF dạng dict của từng document), giữa cắt tỉa top-k với chấm điểm toàn bộ và giữa các backend
+"""
+
+import math
+from collections import Counter
+
+import pytest
+
+from conftest import QUERIES, build_engine, filter_cases
+from src.basic_text_processor import BasicVietnameseTextProcessor
+from src.scoring_backend import np
+
+TOP_K = 20
+
+
+class ReferenceScorer:
+    """Chấm điểm như phiên bản đầu tiên của engine: duyệt mọi document, cosine giữa hai dict"""
+
+    def __init__(self, documents):
+        text_processor = BasicVietnameseTextProcessor()
+        self.text_processor = text_processor
+        self.documents = documents
+        tokens = [text_processor.preprocess_document(doc.get('title', ''), doc.get('content', '')).split()
+                  for doc in documents]
+        doc_freq = Counter(word for doc_tokens in tokens for word in set(doc_tokens))
+        self.idf = {word: math.log(len(tokens) / df) for word, df in doc_freq.items()}
+        self.vectors = [{word: count / len(doc_tokens) * self.idf[word]
+                         for word, count in Counter(doc_tokens).items()} for doc_tokens in tokens]
+
+    @staticmethod
+    def cosine(first, second):
+        dot = sum(value * second[word] for word, value in first.items() if word in second)
+        norms = math.sqrt(sum(v * v for v in first.values())) * math.sqrt(sum(v * v for v in second.values()))
+        return dot / norms if norms else 0.0
+
+    def search(self, query, top_k):
+        query_tokens = self.text_processor.preprocess_query(query).split()
+        query_vector = {word: count / len(query_tokens) * self.idf[word]
+                        for word, count in Counter(query_tokens).items() if word in self.idf}
+        scores = [(self.cosine(query_vector, vector), i) for i, vector in enumerate(self.vectors)]
+        ranked = sorted((item for item in scores if item[0] > 0), key=lambda item: (-item[0], item[1]))
+        return {self.documents[i]['id']: score for score, i in ranked[:top_k]}, [score for score, _ in ranked[:top_k]]
+
+
+def hits(results):
+    return [(doc['id'], score) for doc, score in results]
+
+
+@pytest.fixture(scope='module')
+def reference(documents):
+    return ReferenceScorer(documents)
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_ranking_matches_reference_scorer(engine, reference, query):
+    expected_scores, expected_ranking = reference.search(query, TOP_K)
+    results = hits(engine.search(query, TOP_K))
+    assert expected_ranking
+    assert [score for _, score in results] == pytest.approx(expected_ranking, abs=1e-9)
+    # Document cùng điểm có thể đổi chỗ cho nhau, nhưng điểm của mỗi document phải giống
+    for doc_id, score in results:
+        assert doc_id in expected_scores
+        assert score == pytest.approx(expected_scores[doc_id], abs=1e-9)
+
+
+PHRASE_QUERIES = ['"giá vàng"', '"việt nam"', 'vàng NEAR/3 giá', '"tiệm vàng" cướp', '"vàng giá bóng đá"']
+
+
+@pytest.mark.parametrize('query', QUERIES + PHRASE_QUERIES)
+def test_pruned_matches_exhaustive(engine, query):
+    for top_k in (1, 5, TOP_K):
+        assert hits(engine.search(query, top_k)) == hits(engine.search(query, top_k, exhaustive=True))
+
+
+@pytest.fixture(scope='module')
+def numpy_engine():
+    return build_engine(scoring_backend='numpy', duplicate_threshold=None)
+
+
+def assert_same_scores(results, expected):
+    """Cùng document với cùng điểm (float32: so với sai số tương đối)"""
+    expected = dict(expected)
+    assert len(results) == len(expected)
+    for doc_id, score in results:
+        assert score == pytest.approx(expected.get(doc_id, math.nan), rel=1e-5)
+
+
+@pytest.mark.skipif(np is None, reason='cần NumPy')
+def test_numpy_backend_matches_python(engine, numpy_engine):
+    assert numpy_engine.scoring_backend == 'numpy'
+    for query in QUERIES + ['giá vàng giá vàng việt nam', 'từkhôngtồntại', 'từkhôngtồntại giá']:
+        assert_same_scores(hits(numpy_engine.search(query, TOP_K)), hits(engine.search(query, TOP_K)))
+
+
+def test_filtered_search(engine, numpy_engine, documents):
+    by_id = {doc['id']: doc for doc in documents}
+    for filters, accepts in filter_cases(documents):
+        matched = 0
+        for query in QUERIES:
+            pruned = hits(engine.search(query, TOP_K, filters=filters))
+            assert pruned == hits(engine.search(query, TOP_K, exhaustive=True, filters=filters))
+            assert all(accepts(by_id[doc_id]) for doc_id, _ in pruned)
+            # Cùng kết quả với lọc sau khi chấm điểm toàn bộ
+            everything = hits(engine.search(query, len(documents), exhaustive=True))
+            assert [hit for hit in everything if accepts(by_id[hit[0]])][:TOP_K] == pruned
+            if np is not None:
+                assert_same_scores(hits(numpy_engine.search(query, TOP_K, filters=filters)), pruned)
+            matched += len(pruned)
+        assert matched
+
+
+@pytest.mark.parametrize('backend', ['engine', 'numpy_engine'])
+def test_pages_match_top_k(request, backend):
+    if backend == 'numpy_engine' and np is None:
+        pytest.skip('cần NumPy')
+    search_engine = request.getfixturevalue(backend)
+    for query in QUERIES:
+        expected = hits(search_engine.search(query, 3 * 7))
+        pages, after = [], None
+        for _ in range(3):
+            results, after = search_engine.search_page(query, 7, after=after)
+            pages.extend(hits(results))
+            if after is None:
+                break
+        assert pages == expected
+
+
+def test_phrase_queries(engine, documents):
+    tokenize = engine.text_processor.simple_tokenize
+
+    def contains(tokens, phrase):
+        return any(tokens[i:i + len(phrase)] == phrase for i in range(len(tokens)))
+
+    phrase = ['giá', 'vàng']
+    results = hits(engine.search('"giá vàng"', len(documents)))
+    assert results
+    expected = {doc['id'] for doc in documents
+                if contains(tokenize(doc.get('title', '')), phrase) or contains(tokenize(doc.get('content', '')), phrase)}
+    assert {doc_id for doc_id, _ in results} == expected
+    # Cùng điểm như query thường, chỉ giữ document chứa cụm từ
+    plain = dict(hits(engine.search('giá vàng', len(documents))))
+    assert all(score == plain[doc_id] for doc_id, score in results)
+    assert not engine.search('"vàng giá bóng đá"', 10)
@@ -0,0 +1,53 @@
+"""
+Cache kết quả tìm kiếm: LRU, TTL và generation của index
+"""
+
+from src.search_cache import SearchCache
+
+
+def test_lru_eviction():
+    cache = SearchCache(max_entries=2)
+    cache.put('a', 1, 1)
+    cache.put('b', 2, 1)
+    assert cache.get('a', 1) == 1
+    cache.put('c', 3, 1)
+    assert cache.get('b', 1) is None
+    assert (cache.get('a', 1), cache.get('c', 1)) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('src.search_cache.time.monotonic', lambda: now[0])
+    cache = SearchCache(ttl=10)
+    cache.put('a', 1, 1)
+    now[0] += 9
+    assert cache.get('a', 1) == 1
+    now[0] += 2
+    assert cache.get('a', 1) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_newer_generation_invalidates():
+    cache = SearchCache()
+    cache.put('a', 1, 1)
+    assert cache.get('a', 2) is None
+    assert cache.stats()['invalidations'] == 1
+    cache.put('a', 2, 2)
+    assert cache.get('a', 2) == 2
+
+
+def test_stale_generation_is_ignored():
+    cache = SearchCache()
+    cache.put('a', 1, 2)
+    # Request bắt đầu trước khi index thay đổi, kết thúc sau: không xóa cache, không được lưu
+    cache.put('b', 0, 1)
+    assert cache.get('b', 1) is None and cache.get('a', 1) is None
+    assert cache.get('a', 2) == 1 and cache.get('b', 2) is None
+    stats = cache.stats()
+    assert stats['generation'] == 2 and stats['entries'] == 1 and stats['invalidations'] == 0
+
+    # Thay search engine: generation bắt đầu lại
+    cache.clear()
+    cache.put('a', 3, 1)
+    assert cache.get('a', 1) == 3
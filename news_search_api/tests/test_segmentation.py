@@ -0,0 +1,99 @@
+"""
+Tách từ theo batch của VietnameseTextProcessor: cache SQLite và process pool
+
+word_tokenize được thay bằng hàm tách theo khoảng trắng (không cần model của underthesea),
+process con của pool (fork) dùng cùng hàm đó.
+"""
+
+import multiprocessing
+
+import pytest
+
+pytest.importorskip('underthesea')
+
+from src import text_processor as text_processor_module
+from src.text_processor import PARALLEL_MIN_TEXTS, SegmentationCache, VietnameseTextProcessor
+
+TEXTS = ['Giá vàng hôm nay tăng mạnh', '', 'Đội tuyển Việt Nam thắng', 'Giá vàng hôm nay tăng mạnh',
+         'Công an tỉnh Thừa Thiên Huế bắt đối tượng cướp tiệm vàng', '<b>Thời tiết</b> Hà Nội']
+
+
+@pytest.fixture
+def segmenter_calls(monkeypatch):
+    """Văn bản được đưa vào word_tokenize (trong process hiện tại)"""
+    calls = []
+
+    def word_tokenize(text):
+        calls.append(text)
+        words = text.split()
+        # Ghép hai từ đầu như underthesea ghép từ ghép
+        return ['_'.join(words[:2])] + words[2:] if len(words) > 1 else words
+
+    monkeypatch.setattr(text_processor_module, 'word_tokenize', word_tokenize)
+    return calls
+
+
+@pytest.fixture
+def processor():
+    return VietnameseTextProcessor()
+
+
+def test_matches_tokenize(processor, segmenter_calls):
+    expected = [processor.tokenize(text) for text in TEXTS]
+    del segmenter_calls[:]
+    assert list(processor.tokenize_many(TEXTS, workers=1)) == expected
+    # Văn bản trùng nhau chỉ tách một lần, văn bản rỗng không được tách
+    assert len(segmenter_calls) == len(set(TEXTS) - {''})
+    documents = list(zip(TEXTS[::2], TEXTS[1::2]))
+    assert list(processor.preprocess_documents(documents, workers=1)) == \
+           [processor.preprocess_document(title, content) for title, content in documents]
+
+
+def test_cache_hit_and_miss(processor, segmenter_calls, tmp_path):
+    unique = len(set(TEXTS) - {''})
+    with SegmentationCache(str(tmp_path / 'segments.db')) as cache:
+        first = list(processor.tokenize_many(TEXTS, workers=1, cache=cache))
+        assert processor.segmentation_stats == {'cached': 0, 'segmented': unique}
+        assert len(cache) == unique
+
+        del segmenter_calls[:]
+        assert list(processor.tokenize_many(TEXTS, workers=1, cache=cache)) == first
+        assert processor.segmentation_stats == {'cached': unique, 'segmented': 0}
+        assert not segmenter_calls
+
+        # Chỉ văn bản mới phải tách
+        assert list(processor.tokenize_many(TEXTS + ['Tin mới nhất'], workers=1, cache=cache))[:-1] == first
+        assert processor.segmentation_stats == {'cached': unique, 'segmented': 1}
+        assert segmenter_calls == ['tin mới nhất']
+
+    # Cache được giữ trên đĩa
+    with SegmentationCache(str(tmp_path / 'segments.db')) as cache:
+        list(processor.tokenize_many(TEXTS, workers=1, cache=cache))
+        assert processor.segmentation_stats == {'cached': unique, 'segmented': 0}
+
+
+def test_segmenter_version_invalidates_cache(processor, segmenter_calls, tmp_path, monkeypatch):
+    unique = len(set(TEXTS) - {''})
+    with SegmentationCache(str(tmp_path / 'segments.db')) as cache:
+        expected = list(processor.tokenize_many(TEXTS, workers=1, cache=cache))
+        monkeypatch.setattr(text_processor_module, 'SEGMENTER_VERSION', 'underthesea-khác')
+        del segmenter_calls[:]
+        assert list(processor.tokenize_many(TEXTS, workers=1, cache=cache)) == expected
+        assert processor.segmentation_stats == {'cached': 0, 'segmented': unique}
+        assert len(segmenter_calls) == unique
+        assert len(cache) == 2 * unique
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='cần pool khởi tạo bằng fork')
+def test_process_pool_matches_tokenize(processor, segmenter_calls, tmp_path):
+    texts = [f'{TEXTS[i % len(TEXTS)]} số {i}' if i % 7 else TEXTS[i % len(TEXTS)]
+             for i in range(3 * PARALLEL_MIN_TEXTS)]
+    expected = [processor.tokenize(text) for text in texts]
+    del segmenter_calls[:]
+    with SegmentationCache(str(tmp_path / 'segments.db')) as cache:
+        assert list(processor.tokenize_many(texts, workers=2, cache=cache)) == expected
+        # Tách từ trên pool, không phải trong process hiện tại
+        assert processor.segmentation_stats['segmented'] >= PARALLEL_MIN_TEXTS
+        assert not segmenter_calls
+        assert list(processor.tokenize_many(texts, workers=2, cache=cache)) == expected
+        assert processor.segmentation_stats['segmented'] == 0
@@ -0,0 +1,83 @@
+"""
+Index chia shard (src/sharded_search.py) so với engine không chia shard
+"""
+
+import contextlib
+import io
+import os
+
+import pytest
+
+from conftest import DATA_PATH, QUERIES, filter_cases
+from src.sharded_search import ShardedSearchEngine
+
+TOP_K = 20
+
+
+def hits(results):
+    return [(doc['id'], score) for doc, score in results]
+
+
+@pytest.fixture(scope='module')
+def sharded_engine():
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = ShardedSearchEngine(3, scoring_backend='python', duplicate_threshold=None)
+        engine.load_data(DATA_PATH)
+        engine.build_index(workers=1)
+    yield engine
+    engine.close()
+
+
+def test_sharded_matches_single(engine, sharded_engine):
+    assert sharded_engine.num_documents == engine.num_documents
+    for query in QUERIES:
+        assert hits(sharded_engine.search(query, TOP_K)) == hits(engine.search(query, TOP_K))
+        assert (hits(sharded_engine.search(query, TOP_K, summary=True))
+                == hits(engine.search(query, TOP_K, summary=True)))
+    queries = [(query, TOP_K) for query in QUERIES]
+    assert ([hits(results) for results in sharded_engine.search_batch(queries)]
+            == [hits(results) for results in engine.search_batch(queries)])
+
+
+def test_sharded_suggestions_match_single(engine, sharded_engine):
+    for prefix in ('giá', 'việt n', 'tin bóng đ', 'covid'):
+        assert sharded_engine.suggest(prefix) == engine.suggest(prefix)
+
+
+def test_sharded_filtered_search(engine, sharded_engine, documents):
+    for filters, _ in filter_cases(documents):
+        for query in QUERIES:
+            assert (hits(sharded_engine.search(query, TOP_K, filters=filters))
+                    == hits(engine.search(query, TOP_K, filters=filters)))
+
+
+def test_sharded_pages_match_single(engine, sharded_engine):
+    after = sharded_after = None
+    for _ in range(3):
+        results, after = engine.search_page('việt nam', 7, after=after)
+        sharded_results, sharded_after = sharded_engine.search_page('việt nam', 7, after=sharded_after)
+        assert hits(sharded_results) == hits(results)
+        assert sharded_after == after
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='cần os.fork')
+def test_worker_reopens_own_shards(tmp_path, sharded_engine):
+    index_path = str(tmp_path / 'news.idx')
+    with contextlib.redirect_stdout(io.StringIO()):
+        sharded_engine.save_index(index_path)
+        engine = ShardedSearchEngine(3, scoring_backend='python', duplicate_threshold=None)
+        assert not engine.reopen()
+        assert engine.load_index(index_path)
+    expected = hits(engine.search('giá vàng', TOP_K))
+    inherited = [shard.process.pid for shard in engine._shards]
+    # Như worker của src/serve.py sau khi fork: shard mới, kết nối riêng
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert engine.reopen()
+    try:
+        assert engine.num_segments == 3
+        assert not {shard.process.pid for shard in engine._shards} & set(inherited)
+        for query in QUERIES:
+            assert hits(engine.search(query, TOP_K)) == hits(sharded_engine.search(query, TOP_K))
+        assert hits(engine.search('giá vàng', TOP_K)) == expected
+    finally:
+        engine.close()
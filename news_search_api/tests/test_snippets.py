@@ -0,0 +1,47 @@
+"""
+Snippet theo query: đoạn được chọn và vị trí các từ được đánh dấu
+"""
+
+import pytest
+
+from conftest import build_engine
+from src.snippets import make_snippet
+
+
+def js_slice(text, start, end):
+    """text.slice(start, end) của JavaScript (vị trí theo đơn vị UTF-16)"""
+    return text.encode('utf-16-le')[2 * start:2 * end].decode('utf-16-le')
+
+
+def marked(snippet):
+    return [js_slice(snippet['text'], start, end) for start, end in snippet['highlights']]
+
+
+@pytest.fixture(scope='module')
+def snippet_engine():
+    return build_engine(stop=50, scoring_backend='python')
+
+
+def test_highlights():
+    snippet = make_snippet('Đội tuyển Việt Nam thắng. Đội bạn thua.'.encode('utf-8'), {'đội', 'tuyển'}, True, True)
+    assert snippet['text'] == '...Đội tuyển Việt Nam thắng. Đội bạn thua....'
+    assert snippet['highlights'] == [[3, 6], [7, 12], [29, 32]]
+    assert marked(snippet) == ['Đội', 'tuyển', 'Đội']
+
+
+def test_highlights_after_astral_characters():
+    snippet = make_snippet('Tin vui 🎉🎉🎉 đội tuyển 😀 chiến thắng'.encode('utf-8'),
+                           {'đội', 'tuyển', 'thắng'}, True, False)
+    assert snippet['highlights'] == [[18, 21], [22, 27], [37, 42]]
+    assert marked(snippet) == ['đội', 'tuyển', 'thắng']
+
+
+def test_snippet_from_index(snippet_engine):
+    content = ('Mở đầu bài viết không liên quan. 🎉🎉 Lễ hội 🏮 pháo hoa rực rỡ trên sông Hàn. '
+               'Phần cuối cũng không liên quan.')
+    snippet_engine.upsert_documents([{'id': 'snippet-test', 'title': 'Tin thử nghiệm', 'content': content}])
+    doc, _ = snippet_engine.search('pháo hoa sông hàn', 1, summary=True)[0]
+    assert doc['id'] == 'snippet-test'
+    snippet = doc['snippet']
+    assert snippet['text'].startswith('...🎉🎉 Lễ hội')
+    assert marked(snippet) == ['pháo', 'hoa', 'sông', 'Hàn']
@@ -0,0 +1,41 @@
+"""
+Gợi ý theo tiền tố (src/suggest_index.py) so với duyệt toàn bộ các key
+"""
+
+import random
+
+from src.suggest_index import DENSE_NODE_SIZE, SUGGEST_TOP_K, SuggestIndex
+
+
+def reference_suggest(entries, prefix, limit=SUGGEST_TOP_K):
+    """Các key bắt đầu bằng prefix, trọng số giảm dần rồi theo thứ tự key"""
+    matches = sorted((key for key in entries if key.startswith(prefix)), key=lambda key: (-entries[key], key))
+    return [(key, entries[key]) for key in matches[:limit]]
+
+
+def test_prefix_suggestions_match_reference():
+    rng = random.Random(0)
+    letters = 'abcđêơ'
+    entries = {}
+    # Đủ nhiều key chung tiền tố để có cả nút lớn (top lưu sẵn) lẫn nút nhỏ
+    while len(entries) < 20 * DENSE_NODE_SIZE:
+        key = ''.join(rng.choice(letters) for _ in range(rng.randint(1, 6)))
+        entries[key] = rng.randint(1, 50)
+    index = SuggestIndex.build(entries)
+    prefixes = {key[:length] for key in entries for length in (1, 2, 3)}
+    for prefix in sorted(prefixes):
+        expected = reference_suggest(entries, prefix)
+        assert index.suggest(prefix)[:len(expected)] == expected, prefix
+        assert index.suggest(prefix, 3)[:3] == expected[:3], prefix
+
+
+def test_engine_suggestions(engine):
+    results = engine.suggest('GIÁ')
+    assert results and all(key.startswith('giá') for key, _ in results)
+    weights = [weight for _, weight in results]
+    assert weights == sorted(weights, reverse=True)
+    # Trọng số của một từ là số document chứa từ đó
+    word = next(key for key, _ in results if ' ' not in key)
+    assert dict(results)[word] == sum(1 for doc in engine.documents if word in engine.text_processor.simple_tokenize(
+        f"{doc.get('title', '')} {doc.get('content', '')}"))
+    assert engine.suggest('zzzzqq') == []
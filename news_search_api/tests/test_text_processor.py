@@ -0,0 +1,96 @@
+"""
+Tách từ của BasicVietnameseTextProcessor so với cách làm sạch bằng chuỗi re.sub ban đầu
+"""
+
+import random
+import re
+
+import pytest
+
+from src.basic_text_processor import FIELD_POSITION_GAP, MEMO_MAX_LENGTH, BasicVietnameseTextProcessor
+
+FUZZ_CASES = 5000
+
+
+def reference_clean_text(text):
+    """clean_text() phiên bản đầu tiên"""
+    if not text:
+        return ''
+    text = text.lower()
+    text = re.sub(r'<[^>]+>', '', text)
+    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
+    text = re.sub(r'\S+@\S+', '', text)
+    text = re.sub(r'[\+]?[1-9]?[0-9]{7,15}', '', text)
+    text = re.sub(r'[^\w\sàáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def reference_tokenize(text, stop_words):
+    """simple_tokenize() phiên bản đầu tiên: reference_clean_text() rồi split()"""
+    return [token for token in reference_clean_text(text).split() if token not in stop_words and len(token) >= 2]
+
+
+# Mảnh văn bản để sinh chuỗi ngẫu nhiên: từ tiếng Việt (có cả chữ hoa), stop words,
+# số điện thoại, URL, email, thẻ HTML, dấu câu, khoảng trắng đặc biệt và emoji
+FRAGMENTS = [
+    'Giá', 'vàng', 'ĐỘI', 'tuyển', 'Việt', 'Nam', 'và', 'của', 'có thể', 'ở', 'a', 'x', 'COVID-19',
+    'VN-Index', '0912345678', '+84912345678', '1234567', '123456', '2022', 'https://vnexpress.net/tin-1.html',
+    'http://a.b/c?d=e&f=g', 'ban.bien-tap@vnexpress.net', 'a@b', '@', '<p>', '</b>', '<a href="x">',
+    '<', '>', '.', ',', '!', '?', '…', '"', "'", '(', ')', '-', '_', '/', '%', '$', '&',
+    ' ', '  ', '\n', '\t', ' ', '　', '🎉', '😀', 'ǅ', 'İ', 'ß', 'ﬁ', '١٢٣', 'Ω',
+]
+
+
+def fuzz_texts(count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = [rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 40))]
+        yield ''.join(part + rng.choice(['', ' ', ' ', '\n']) for part in parts)
+
+
+@pytest.fixture(scope='module')
+def processor():
+    return BasicVietnameseTextProcessor()
+
+
+def test_tokenize_matches_reference_on_fuzzed_text(processor):
+    for text in fuzz_texts(FUZZ_CASES):
+        expected = reference_tokenize(text, processor.stop_words)
+        assert processor.simple_tokenize(text) == expected, text
+        # Văn bản dài không đi qua cache (từ một ký tự bị lọc nên không đổi kết quả)
+        assert processor.simple_tokenize(text + ' x' * MEMO_MAX_LENGTH) == expected, text
+
+
+def test_tokenize_matches_reference_on_corpus(processor, documents):
+    for doc in documents:
+        for text in (doc.get('title', ''), doc.get('content', '')):
+            assert processor.simple_tokenize(text) == reference_tokenize(text, processor.stop_words)
+
+
+def test_clean_text_matches_reference(processor):
+    for text in fuzz_texts(1000, seed=1):
+        assert processor.clean_text(text) == reference_clean_text(text), text
+
+
+def test_positional_tokens_match_tokenize(processor):
+    for text in fuzz_texts(1000, seed=2):
+        assert [token for _, token in processor.positional_tokens(text)] == processor.simple_tokenize(text)
+
+
+def test_document_positions(processor):
+    title = 'Tên cướp tiệm vàng tại Huế là đại úy công an'
+    content = 'Đối tượng cướp tiệm vàng đã bị bắt. Tiệm vàng mở cửa lại.'
+    title_tokens, content_tokens, positions = processor.document_positions(title, content)
+    assert (title_tokens, content_tokens) == processor.document_fields(title, content)
+    start = processor.content_start(title)
+    assert start == len(title.split()) + FIELD_POSITION_GAP
+    assert positions['cướp'] == [1, start + 2]
+    assert positions['vàng'] == [3, start + 4, start + 9]
+
+
+def test_split_words_counts(processor):
+    text = 'Câu một có bốn. Câu <b>hai</b> dài hơn một chút! Liên hệ 0912345678 nhé'
+    starts = [0, text.index('Câu <b>'), text.index('Liên')]
+    words, counts = processor.split_words(text, starts)
+    assert words == processor._words(text)
+    assert counts == [len(processor._words(text[:start])) for start in starts]